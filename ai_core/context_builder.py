@@ -0,0 +1,207 @@
+# ai_core/context_builder.py
+import logging
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ai_core.memory_manager import render_turn
+
+logger = logging.getLogger(__name__)
+
+# Ngân sách token cho phần "THÔNG TIN TRA CỨU" theo intent (safety cần nhiều bước hướng dẫn hơn)
+DEFAULT_INTENT_BUDGETS = {
+    "definition": 500,
+    "safety_advice": 800,
+    "report_uxo": 800,
+    "location_info": 600,
+    "general": 500,
+}
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?…;])\s+|\n+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (~4 ký tự / token) — đủ để so sánh trước/sau, không gọi API đếm token"""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def _overlap_length(left: str, right: str, min_overlap: int, max_overlap: int) -> int:
+    """Độ dài đoạn dài nhất vừa là hậu tố của left vừa là tiền tố của right (≥ min_overlap)"""
+    if len(left) < min_overlap or len(right) < min_overlap:
+        return 0
+    tail = left[-max_overlap:]
+    probe = right[:min_overlap]
+    best = 0
+    start = tail.find(probe)
+    while start != -1:
+        length = len(tail) - start
+        if length > best and right.startswith(tail[start:]):
+            best = length
+            break   # lần xuất hiện đầu tiên cho overlap dài nhất
+        start = tail.find(probe, start + 1)
+    return best
+
+
+class ContextBuilder:
+    """
+    Ghép context RAG trong ngân sách token:
+      1. bỏ chunk trùng và đoạn overlap giữa các chunk (split_documents dùng chunk_overlap=200)
+      2. xếp hạng câu theo cosine với câu hỏi (embedding chuẩn hoá, 1 lần forward cho cả lô)
+      3. lấy các câu tốt nhất tới khi hết ngân sách của intent, giữ thứ tự gốc trong văn bản
+    Context đã nằm trong ngân sách sau bước 1 → bỏ qua bước 2-3 (không tốn embedding).
+    """
+
+    def __init__(self, embed_query: Optional[Callable[[str], np.ndarray]] = None,
+                 embed_texts: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 intent_budgets: Optional[Dict[str, int]] = None,
+                 history_budget: Optional[int] = None,
+                 min_overlap: int = 40, max_overlap: int = 400):
+        self.embed_query = embed_query
+        self.embed_texts = embed_texts
+        default_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", 0))
+        self.intent_budgets = dict(intent_budgets or DEFAULT_INTENT_BUDGETS)
+        if default_budget:
+            self.intent_budgets = {intent: default_budget for intent in self.intent_budgets}
+        self.history_budget = (
+            history_budget if history_budget is not None else int(os.getenv("HISTORY_TOKEN_BUDGET", 300))
+        )
+        self.min_overlap = min_overlap
+        self.max_overlap = max_overlap
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "ranked": 0, "duplicate_chunks": 0, "overlap_chars": 0,
+                      "tokens_before": 0, "tokens_after": 0}
+
+    def budget_for(self, intent: Optional[str]) -> int:
+        return self.intent_budgets.get(intent or "general", self.intent_budgets.get("general", 500))
+
+    # ================= 1. Dedup =================
+    def dedup_chunks(self, texts: Sequence[str]) -> List[str]:
+        kept: List[str] = []
+        seen = set()
+        duplicates = overlap_chars = 0
+        for text in texts:
+            text = (text or "").strip()
+            if not text or text in seen:
+                duplicates += 1
+                continue
+            seen.add(text)
+            # Thứ tự retrieval ≠ thứ tự trong tài liệu → kiểm tra overlap cả 2 chiều với mọi chunk đã giữ
+            for other in kept:
+                cut = _overlap_length(other, text, self.min_overlap, self.max_overlap)
+                if cut:
+                    text = text[cut:].lstrip()
+                    overlap_chars += cut
+                cut = _overlap_length(text, other, self.min_overlap, self.max_overlap)
+                if cut:
+                    text = text[:-cut].rstrip()
+                    overlap_chars += cut
+                if not text:
+                    break
+            if text:
+                kept.append(text)
+        with self._lock:
+            self.stats["duplicate_chunks"] += duplicates
+            self.stats["overlap_chars"] += overlap_chars
+        return kept
+
+    # ================= 2-3. Rank + pack =================
+    @staticmethod
+    def _split_sentences(chunks: Sequence[str]) -> List[Tuple[int, int, str]]:
+        """(chunk_idx, sentence_idx, câu) theo thứ tự gốc"""
+        sentences = []
+        for ci, chunk in enumerate(chunks):
+            for si, sentence in enumerate(s.strip() for s in _SENTENCE_SPLIT.split(chunk)):
+                if sentence:
+                    sentences.append((ci, si, sentence))
+        return sentences
+
+    def _rank(self, query: str, sentences: List[str]) -> List[int]:
+        """Chỉ số câu theo độ liên quan giảm dần; không có / lỗi embedding → giữ thứ tự retrieval"""
+        if self.embed_query is None or self.embed_texts is None:
+            return list(range(len(sentences)))
+        try:
+            scores = self.embed_texts(sentences) @ self.embed_query(query)
+        except Exception as e:
+            logger.warning(f"⚠️ Xếp hạng câu lỗi, giữ thứ tự retrieval: {e}")
+            return list(range(len(sentences)))
+        with self._lock:
+            self.stats["ranked"] += 1
+        return [int(i) for i in np.argsort(-scores, kind="stable")]
+
+    def _pack(self, query: str, chunks: List[str], budget: int) -> str:
+        items = self._split_sentences(chunks)
+        order = self._rank(query, [sentence for _, _, sentence in items])
+        chosen, used = [], 0
+        for idx in order:
+            cost = estimate_tokens(items[idx][2]) + 1
+            if used + cost > budget:
+                continue   # câu dài không vừa → thử câu ngắn hơn phía sau
+            chosen.append(idx)
+            used += cost
+        if not chosen and order:   # câu tốt nhất dài hơn cả ngân sách → cắt bớt
+            return items[order[0]][2][: budget * 4]
+        # Giữ thứ tự gốc; câu cùng chunk nối bằng khoảng trắng, khác chunk xuống dòng
+        chosen.sort(key=lambda i: (items[i][0], items[i][1]))
+        lines, current_chunk = [], None
+        for idx in chosen:
+            chunk_idx, _, sentence = items[idx]
+            if chunk_idx == current_chunk:
+                lines[-1] += " " + sentence
+            else:
+                lines.append(sentence)
+                current_chunk = chunk_idx
+        return "\n".join(lines)
+
+    def extract(self, query: str, docs: Sequence[Any], budget: int) -> str:
+        """Tóm tắt trích xuất cục bộ (không LLM): các câu liên quan nhất của docs trong budget token"""
+        chunks = self.dedup_chunks([getattr(doc, "page_content", doc) for doc in docs])
+        return self._pack(query, chunks, budget) if chunks else ""
+
+    def trim_history(self, turns: Sequence[Tuple[str, str]]) -> str:
+        """
+        Giữ các lượt (câu hỏi, trả lời) gần nhất trong history_budget — bỏ nguyên lượt, không cắt ngang
+        câu trả lời nhiều dòng. Lượt mới nhất dài hơn cả ngân sách → chỉ giữ câu hỏi của lượt đó.
+        """
+        kept, used = [], 0
+        for user_input, assistant_output in reversed(turns or ()):
+            rendered = render_turn(user_input, assistant_output)
+            cost = estimate_tokens(rendered)
+            if used + cost > self.history_budget:
+                if not kept:
+                    kept.append(f"User: {user_input}\n")
+                break
+            kept.append(rendered)
+            used += cost
+        return "".join(reversed(kept))
+
+    def build(self, query: str, docs: Sequence[Any], intent: Optional[str] = None,
+              chat_history: Sequence[Tuple[str, str]] = ()) -> Tuple[str, str]:
+        """Trả (context, chat_history) đã rút gọn cho prompt; chat_history: các lượt (câu hỏi, trả lời)"""
+        raw_texts = [getattr(doc, "page_content", doc) for doc in docs]
+        tokens_before = (estimate_tokens("\n".join(raw_texts))
+                         + sum(estimate_tokens(render_turn(*turn)) for turn in chat_history or ()))
+
+        chunks = self.dedup_chunks(raw_texts)
+        context = "\n".join(chunks)
+        budget = self.budget_for(intent)
+        if estimate_tokens(context) > budget:
+            context = self._pack(query, chunks, budget)
+        history = self.trim_history(chat_history)
+
+        tokens_after = estimate_tokens(context) + estimate_tokens(history)
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["tokens_before"] += tokens_before
+            self.stats["tokens_after"] += tokens_after
+        return context, history
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["tokens_saved"] = stats["tokens_before"] - stats["tokens_after"]
+        stats["saved_ratio"] = round(stats["tokens_saved"] / stats["tokens_before"], 4) if stats["tokens_before"] else 0.0
+        stats["intent_budgets"] = dict(self.intent_budgets)
+        return stats
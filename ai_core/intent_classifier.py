@@ -0,0 +1,144 @@
+# ai_core/intent_classifier.py
+import logging
+import os
+from typing import Callable, Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Tập intent giống prompt trong NLUProcessor.setup_intent_detection
+INTENT_LABELS = ("definition", "safety_advice", "location_info", "report_uxo", "ask_hotline", "general")
+
+DEFAULT_EXEMPLARS_PATH = os.getenv("INTENT_EXEMPLARS_PATH", "data/intent_exemplars.npz")
+
+# Câu mẫu khởi tạo ngân hàng exemplar khi chưa có log
+SEED_EXAMPLES: Dict[str, List[str]] = {
+    "definition": [
+        "mìn là gì", "bom mìn chưa nổ là gì", "UXO là gì", "vật nổ chưa nổ là gì",
+        "bom bi là gì", "what is UXO", "what is a landmine",
+    ],
+    "safety_advice": [
+        "tìm thấy bom phải làm gì", "thấy vật lạ nghi là mìn thì làm sao",
+        "làm gì khi phát hiện bom", "cách phòng tránh tai nạn bom mìn",
+        "trẻ em nhặt được đạn phải làm gì", "what should I do if I find a bomb",
+    ],
+    "location_info": [
+        "Quảng Trị có nhiều bom mìn không", "khu vực nào còn nhiều bom mìn",
+        "Quảng Bình có gì đặc biệt", "bom mìn tập trung ở đâu",
+        "which provinces are most contaminated",
+    ],
+    "report_uxo": [
+        "tôi muốn báo cáo vật nổ", "báo cáo phát hiện bom", "tôi vừa phát hiện một quả đạn trong vườn",
+        "báo vị trí bom mìn", "I want to report an unexploded bomb",
+    ],
+    "ask_hotline": [
+        "số hotline là gì", "cho tôi số điện thoại", "hotline Quảng Trị",
+        "số điện thoại báo bom mìn", "đường dây nóng xử lý bom mìn", "hotline number",
+    ],
+    "general": [
+        "xin chào", "cảm ơn", "bạn là ai", "bạn có thể giúp gì", "hello", "thank you",
+    ],
+}
+
+
+class EmbeddingIntentClassifier:
+    """
+    Phân loại intent cục bộ bằng kNN cosine trên ngân hàng câu mẫu (ma trận NumPy).
+    Chỉ dùng kết quả khi margin giữa 2 intent dẫn đầu đủ lớn, còn lại fallback LLM.
+    """
+
+    def __init__(self, embed_query: Callable[[str], np.ndarray],
+                 embed_texts: Callable[[Sequence[str]], np.ndarray],
+                 k: int = 5, margin_threshold: Optional[float] = None,
+                 min_similarity: Optional[float] = None):
+        self.embed_query = embed_query
+        self.embed_texts = embed_texts
+        self.k = k
+        self.margin_threshold = (
+            margin_threshold if margin_threshold is not None
+            else float(os.getenv("INTENT_KNN_MARGIN", 0.5))
+        )
+        self.min_similarity = (
+            min_similarity if min_similarity is not None
+            else float(os.getenv("INTENT_KNN_MIN_SIMILARITY", 0.55))
+        )
+        self.labels: Tuple[str, ...] = INTENT_LABELS
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.label_ids = np.zeros(0, dtype=np.int64)
+        self.texts: List[str] = []
+
+    # ================= Exemplar bank =================
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def fit(self, examples: Sequence[Tuple[str, str]]) -> "EmbeddingIntentClassifier":
+        """examples: [(câu hỏi, intent)] — intent lạ bị bỏ qua"""
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        kept = [(text, label_index[label]) for text, label in examples if text and label in label_index]
+        self.texts = [text for text, _ in kept]
+        self.label_ids = np.array([label_id for _, label_id in kept], dtype=np.int64)
+        self.matrix = np.asarray(self.embed_texts(self.texts), dtype=np.float32)
+        logger.info(f"✅ Intent exemplar bank: {len(self.texts)} câu mẫu")
+        return self
+
+    @staticmethod
+    def seed_examples() -> List[Tuple[str, str]]:
+        return [(text, label) for label, texts in SEED_EXAMPLES.items() for text in texts]
+
+    def save(self, path: str = DEFAULT_EXEMPLARS_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            path,
+            matrix=self.matrix,
+            label_ids=self.label_ids,
+            labels=np.array(self.labels),
+            texts=np.array(self.texts),
+        )
+
+    def load(self, path: str = DEFAULT_EXEMPLARS_PATH) -> "EmbeddingIntentClassifier":
+        data = np.load(path, allow_pickle=False)
+        self.matrix = data["matrix"].astype(np.float32)
+        self.label_ids = data["label_ids"].astype(np.int64)
+        self.labels = tuple(str(label) for label in data["labels"])
+        self.texts = [str(text) for text in data["texts"]]
+        logger.info(f"✅ Loaded intent exemplar bank ({len(self.texts)} câu) từ {path}")
+        return self
+
+    def load_or_seed(self, path: str = DEFAULT_EXEMPLARS_PATH) -> "EmbeddingIntentClassifier":
+        if os.path.exists(path):
+            return self.load(path)
+        return self.fit(self.seed_examples())
+
+    # ================= Classification =================
+    def classify_vector(self, query_vector: np.ndarray) -> Dict[str, Any]:
+        """kNN cosine (vector đã chuẩn hoá) — chỉ phép nhân ma trận + argpartition"""
+        n = len(self.texts)
+        if n == 0:
+            return {"intent": None, "confidence": 0.0, "margin": 0.0, "similarity": 0.0}
+
+        sims = self.matrix @ query_vector
+        k = min(self.k, n)
+        top = np.argpartition(-sims, k - 1)[:k]
+        weights = np.clip(sims[top], 0.0, None)
+        scores = np.bincount(self.label_ids[top], weights=weights, minlength=len(self.labels))
+
+        order = np.argsort(scores)[::-1]
+        best, runner_up = scores[order[0]], scores[order[1]]
+        total = float(scores.sum())
+        return {
+            "intent": self.labels[order[0]],
+            "confidence": float(best / total) if total > 0 else 0.0,
+            "margin": float((best - runner_up) / total) if total > 0 else 0.0,
+            "similarity": float(sims[top].max()),
+        }
+
+    def classify(self, question: str) -> Dict[str, Any]:
+        return self.classify_vector(self.embed_query(question))
+
+    def is_confident(self, result: Dict[str, Any]) -> bool:
+        return (
+            result.get("intent") is not None
+            and result["margin"] >= self.margin_threshold
+            and result["similarity"] >= self.min_similarity
+        )
@@ -0,0 +1,163 @@
+# ai_core/intent_rules.py
+import re
+import unicodedata
+from typing import Dict, Any, List, Optional
+
+# ========================
+# Helpers
+# ========================
+def _strip_accents(s: str) -> str:
+    """Bỏ dấu tiếng Việt để so khớp keyword dễ hơn."""
+    if not isinstance(s, str):
+        return ""
+    # "đ" không tách dấu được bằng NFD → thay tay
+    s = s.replace("đ", "d").replace("Đ", "D")
+    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+
+def _contains_any(haystack: str, needles) -> bool:
+    return any(n in haystack for n in needles)
+
+# Các từ gợi ý câu hỏi KHÔNG phải hotline (để không ép về hotline)
+QUESTION_TRIGGERS = [
+    "ở đâu", "o dau", "là gì", "la gi", "giới thiệu", "gioi thieu",
+    "thông tin", "thong tin", "bao nhiêu", "bao nhieu", "vì sao", "vi sao", "?"
+]
+
+# Từ khoá hotline
+HOTLINE_KEYWORDS = [
+    "hotline", "số điện thoại", "so dien thoai", "điện thoại", "dien thoai",
+    "đường dây nóng", "duong day nong", "gọi", "goi", "liên hệ", "lien he"
+]
+
+# Từ khoá hotline "chắc chắn" (không mơ hồ như "gọi", "liên hệ" → "gọi là gì?")
+STRONG_HOTLINE_KEYWORDS = [
+    "hotline", "so dien thoai", "sdt", "duong day nong", "phone number",
+]
+
+# Từ khoá (không dấu) cho chế độ degraded khi không gọi được LLM
+REPORT_KEYWORDS = ["bao cao", "trinh bao", "khai bao", "report"]
+SAFETY_KEYWORDS = [
+    "lam gi", "lam sao", "an toan", "nguy hiem", "phat hien", "nhat duoc", "tim thay",
+    "xu ly", "cham vao", "what should", "safe", "found",
+]
+
+# Danh sách địa danh phổ biến (có cả có dấu & không dấu, để match nhanh)
+LOCATION_TOKENS = [
+    "quảng bình","quang binh","qb",
+    "quảng trị","quang tri","qt",
+    "thừa thiên huế","thua thien hue","huế","hue","tth",
+    "đà nẵng","da nang","dn",
+    "quảng nam","quang nam","qn",
+    "nghệ an","nghe an","na",
+    "hà tĩnh","ha tinh","ht",
+    "thanh hóa","thanh hoa","th",
+    # có thể bổ sung thêm...
+]
+
+# Địa danh (không dấu) → tên hiển thị, dùng làm entity "location"
+LOCATION_NAMES = {
+    "quang binh": "Quảng Bình", "qb": "Quảng Bình",
+    "quang tri": "Quảng Trị", "qt": "Quảng Trị",
+    "thua thien hue": "Thừa Thiên Huế", "hue": "Thừa Thiên Huế", "tth": "Thừa Thiên Huế",
+    "da nang": "Đà Nẵng", "dn": "Đà Nẵng",
+    "quang nam": "Quảng Nam", "qn": "Quảng Nam",
+    "nghe an": "Nghệ An", "na": "Nghệ An",
+    "ha tinh": "Hà Tĩnh", "ht": "Hà Tĩnh",
+    "thanh hoa": "Thanh Hóa", "th": "Thanh Hóa",
+}
+
+# Match theo ranh giới từ để "th" không khớp nhầm "thanh", "na" không khớp "nang"...
+_LOCATION_PATTERNS = [
+    (re.compile(rf"(?<!\w){re.escape(token)}(?!\w)"), name)
+    for token, name in sorted(LOCATION_NAMES.items(), key=lambda kv: -len(kv[0]))
+]
+
+
+def find_locations(text: str) -> List[str]:
+    """Trích xuất địa danh (tên hiển thị, không trùng lặp) bằng rule."""
+    t_ascii = _strip_accents((text or "").lower())
+    found: List[str] = []
+    for pattern, name in _LOCATION_PATTERNS:
+        if name not in found and pattern.search(t_ascii):
+            found.append(name)
+    return found
+
+
+# ========================
+# Rule engine
+# ========================
+class IntentRuleEngine:
+    """
+    Bộ luật xác định intent KHÔNG cần LLM.
+    Chỉ trả kết quả khi luật đủ chắc chắn (decisive), ngược lại trả None để fallback LLM.
+    """
+
+    def __init__(self, max_followup_words: int = 4, max_bare_hotline_words: int = 6):
+        self.max_followup_words = max_followup_words
+        self.max_bare_hotline_words = max_bare_hotline_words
+
+    def match(self, question: str, last_intent: str = "",
+              awaiting_hotline_location: bool = False) -> Optional[Dict[str, Any]]:
+        t_lc = (question or "").strip().lower()
+        t_ascii = _strip_accents(t_lc)
+        words = t_ascii.split()
+        if not words:
+            return None
+
+        locations = find_locations(t_ascii)
+        has_strong_hotline = _contains_any(t_ascii, STRONG_HOTLINE_KEYWORDS)
+        has_question_word = _contains_any(t_lc, QUESTION_TRIGGERS) or _contains_any(t_ascii, QUESTION_TRIGGERS)
+        has_hotline_kw = _contains_any(t_lc, HOTLINE_KEYWORDS) or _contains_any(t_ascii, HOTLINE_KEYWORDS)
+
+        # Luật 1: "hotline Quảng Trị", "số điện thoại Huế"
+        if has_strong_hotline and locations:
+            return self._result("ask_hotline", 0.97, locations, "hotline_keyword+location")
+
+        # Luật 2: bot vừa hỏi khu vực → người dùng chỉ trả lời địa danh
+        if (
+            locations
+            and len(words) <= self.max_followup_words
+            and not has_question_word
+            and not has_hotline_kw
+            and (awaiting_hotline_location or last_intent == "ask_hotline")
+        ):
+            return self._result("ask_hotline", 0.95, locations, "hotline_followup_location")
+
+        # Luật 3: "cho tôi số hotline" (không địa danh) → bot sẽ hỏi lại khu vực
+        if has_strong_hotline and len(words) <= self.max_bare_hotline_words:
+            return self._result("ask_hotline", 0.9, [], "hotline_keyword")
+
+        return None
+
+    def guess(self, question: str, last_intent: str = "",
+              awaiting_hotline_location: bool = False) -> Dict[str, Any]:
+        """
+        Chế độ degraded (LLM không dùng được): luôn trả 1 intent theo từ khoá, độ tin cậy thấp.
+        Ưu tiên luật chắc chắn của match(), sau đó tới từ khoá hotline / báo cáo / an toàn / địa điểm.
+        """
+        matched = self.match(question, last_intent, awaiting_hotline_location)
+        if matched is not None:
+            return matched
+        t_lc = (question or "").strip().lower()
+        t_ascii = _strip_accents(t_lc)
+        locations = find_locations(t_ascii)
+        if _contains_any(t_lc, HOTLINE_KEYWORDS) or _contains_any(t_ascii, HOTLINE_KEYWORDS):
+            return self._result("ask_hotline", 0.6, locations, "degraded_hotline_keyword")
+        if _contains_any(t_ascii, REPORT_KEYWORDS):
+            return self._result("report_uxo", 0.5, locations, "degraded_report_keyword")
+        if _contains_any(t_ascii, SAFETY_KEYWORDS):
+            return self._result("safety_advice", 0.5, locations, "degraded_safety_keyword")
+        if "o dau" in t_ascii or locations:
+            return self._result("location_info", 0.5, locations, "degraded_location")
+        if "la gi" in t_ascii or "what is" in t_ascii:
+            return self._result("definition", 0.5, locations, "degraded_definition")
+        return self._result("general", 0.3, locations, "degraded_default")
+
+    @staticmethod
+    def _result(intent: str, confidence: float, locations: List[str], rule: str) -> Dict[str, Any]:
+        return {
+            "intent": intent,
+            "confidence": confidence,
+            "entities": {"location": locations, "uxo_type": [], "action": []},
+            "rule": rule,
+        }
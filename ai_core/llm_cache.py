@@ -0,0 +1,146 @@
+# ai_core/llm_cache.py
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from utils.prefork import register_after_fork
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite3")
+
+
+class LLMResponseCache:
+    """
+    Cache prompt → response của LLM trên file SQLite (WAL), tồn tại qua các lần restart.
+    Key = sha256(model | temperature | max_output_tokens | prompt). Vượt max_bytes → xoá entry ít được
+    dùng nhất (LRU) đến khi còn ~90% dung lượng. max_bytes là giới hạn của cả file: tổng dung lượng
+    đọc từ DB trong transaction ghi (các worker prefork dùng chung 1 file), không đếm riêng từng process.
+    """
+
+    def __init__(self, path: str = DEFAULT_LLM_CACHE_PATH, max_bytes: Optional[int] = None):
+        self.path = path
+        self.max_bytes = (
+            max_bytes if max_bytes is not None
+            else int(float(os.getenv("LLM_CACHE_MAX_MB", 64)) * 1024 * 1024)
+        )
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        register_after_fork(self._after_fork)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+        # Index phủ cho SUM(size): không phải đọc cả cột response mỗi lần ghi
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_size ON llm_cache(size)")
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        logger.info(f"✅ LLM response cache: {path} ({self._total_bytes_locked() / 1024:.0f} KB)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+
+    def _after_fork(self):
+        """Kết nối SQLite không được dùng chung giữa các process → worker mở kết nối riêng"""
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+
+    @staticmethod
+    def make_key(model: str, temperature: float, prompt: str, max_output_tokens: Optional[int] = None) -> str:
+        raw = f"{model}|{temperature!r}|{max_output_tokens!r}|{prompt}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, key: str, response: str, model: str = ""):
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE: ghi + đo tổng + evict là 1 transaction, worker khác không chen giữa
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, model, response, size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, response, size, now, now),
+                )
+                self.stats["stores"] += 1
+                total = self._total_bytes_locked()
+                if total > self.max_bytes:
+                    self._evict_locked(total, int(self.max_bytes * 0.9))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _total_bytes_locked(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    def _evict_locked(self, total_bytes: int, target_bytes: int):
+        rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall()
+        victims = []
+        for key, size in rows:
+            if total_bytes <= target_bytes:
+                break
+            victims.append((key,))
+            total_bytes -= size
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+        self.stats["evictions"] += len(victims)
+        logger.info(f"🧹 LLM cache evicted {len(victims)} entries")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            stats["size_bytes"] = self._total_bytes_locked()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+_default_cache: Optional[LLMResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_llm_cache() -> Optional[LLMResponseCache]:
+    """Cache dùng chung cho mọi GeminiLLM, bật bằng LLM_CACHE_ENABLED=1 (mặc định tắt)"""
+    global _default_cache
+    if os.getenv("LLM_CACHE_ENABLED", "0") != "1":
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            try:
+                _default_cache = LLMResponseCache()
+            except Exception as e:
+                logger.warning(f"⚠️ Không mở được LLM cache: {e}. Tiếp tục không cache.")
+                return None
+        return _default_cache
@@ -1,66 +1,307 @@
 # ai_core/llm_chain.py
 import logging
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from typing import Dict, Union
+from typing import AsyncIterator, Dict, List, Optional, Union
+import asyncio
 import google.generativeai as genai
 import os
-from langchain_core.output_parsers import BaseOutputParser
-from langchain_core.runnables import Runnable
+from ai_core.llm_cache import LLMResponseCache, get_default_llm_cache
+from ai_core.llm_gateway import (GeminiGateway, attempt_budget, get_default_breaker, get_default_gateway,
+                                  is_attempt_timeout, is_upstream_failure, run_attempt)
+from ai_core.prompt_runtime import PromptChain, PromptTemplate
+from utils.circuit_breaker import CircuitBreaker
+from utils.deadline import DeadlineExceeded
+from utils.executors import run_in
+import time
 
 from dotenv import load_dotenv
 load_dotenv()  # nạp file .env
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+def _configure_genai():
+    """GEMINI_API_ENDPOINT (vd: http://127.0.0.1:8090 của scripts.fake_llm_server) → gọi qua REST tới endpoint đó"""
+    endpoint = os.getenv("GEMINI_API_ENDPOINT")
+    if endpoint:
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"), transport="rest",
+                        client_options={"api_endpoint": endpoint})
+    else:
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+
+_configure_genai()
 
 logger = logging.getLogger(__name__)
 
-# ================= Gemini Wrapper cho LangChain =================
-class GeminiLLM(Runnable):
+# ================= Gemini Wrapper =================
+class GeminiLLM:
     """
-    Wrapper Gemini LLM tương thích LangChain 2.x
+    Wrapper Gemini LLM: invoke / ainvoke / astream nhận prompt str (PromptChain truyền vào),
+    dict hoặc PromptValue của LangChain (có to_string()).
+    cache: cache prompt → response (mặc định lấy cache dùng chung nếu LLM_CACHE_ENABLED=1);
+    từng lời gọi có thể bỏ qua cache bằng use_cache=False.
+    gateway: giới hạn concurrency (AIMD) + rate limit + retry/timeout cho mọi lời gọi Gemini
+    (mặc định dùng gateway chung của process).
+    breaker: circuit breaker quanh toàn bộ lời gọi (sau retry); đang mở → CircuitOpenError ngay,
+    caller trả lời dạng degraded.
+    max_output_tokens / timeout: giới hạn sinh và tổng thời gian 1 lời gọi (gồm retry) của tier
+    (ai_core.model_router); metrics: TierMetrics ghi độ trễ + số token của mỗi lời gọi.
     """
-    def __init__(self, model: str = "gemini-1.5-flash", temperature: float = 0.2):
+    def __init__(self, model: str = "gemini-1.5-flash", temperature: float = 0.2,
+                 cache: Optional[LLMResponseCache] = None, gateway: Optional[GeminiGateway] = None,
+                 breaker: Optional[CircuitBreaker] = None, max_output_tokens: Optional[int] = None,
+                 timeout: Optional[float] = None, metrics=None):
         self.model = model
         self.temperature = temperature
+        self.max_output_tokens = max_output_tokens
+        self.timeout = timeout
+        self.metrics = metrics
+        self.cache = cache if cache is not None else get_default_llm_cache()
+        self.gateway = gateway if gateway is not None else get_default_gateway()
+        self.breaker = breaker if breaker is not None else get_default_breaker()
         if "GOOGLE_API_KEY" in os.environ:
-            genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
-
-    def invoke(self, inputs: Union[str, Dict], config=None, **kwargs) -> str:
-        if "stop" in kwargs:
-            kwargs.pop("stop")
+            _configure_genai()
 
+    def _build_prompt(self, inputs: Union[str, Dict]) -> str:
         if isinstance(inputs, dict):
-            prompt = "\n".join(f"{k}: {v}" for k, v in inputs.items())
-        else:
-            prompt = str(inputs)
+            return "\n".join(f"{k}: {v}" for k, v in inputs.items())
+        # PromptValue của LangChain (LLMChain truyền vào) → lấy text gốc
+        if hasattr(inputs, "to_string"):
+            return inputs.to_string()
+        return str(inputs)
 
+    def _get_model_instance(self):
         if not hasattr(self, "model_instance"):
             self.model_instance = genai.GenerativeModel(self.model)
+        return self.model_instance
 
-        response = self.model_instance.generate_content(
-            prompt,
-            generation_config={"temperature": self.temperature}
-        )
+    async def warm_up(self):
+        """
+        Tạo trước GenerativeModel + client sync / async (không gọi API, không tốn quota) để request đầu
+        không trả chi phí khởi tạo. Chạy trên event loop của worker: client gRPC async gắn với loop
+        tạo ra nó, và client gRPC không dùng chung được qua fork (app.serve) → không tạo ở master.
+        """
+        model = self._get_model_instance()
+        from google.generativeai import client as genai_client
+        # GenerativeModel tạo client ở lần generate đầu tiên (_client / _async_client = None)
+        if getattr(model, "_client", False) is None:
+            model._client = genai_client.get_default_generative_client()
+        if getattr(model, "_async_client", False) is None:
+            model._async_client = genai_client.get_default_generative_async_client()
+        return model
+
+    def _generation_config(self) -> Dict:
+        config = {"temperature": self.temperature}
+        if getattr(self, "max_output_tokens", None):
+            config["max_output_tokens"] = self.max_output_tokens
+        return config
 
+    def _record_call(self, latency: float, failed: bool):
+        metrics = getattr(self, "metrics", None)
+        if metrics is not None:
+            metrics.record_call(latency, failed)
+
+    @staticmethod
+    def _record_breaker_failure(breaker: Optional[CircuitBreaker], latency: float, exc: BaseException):
+        """Chỉ lỗi của upstream mới tính là thất bại; hết deadline / huỷ / quá tải cục bộ không tính
+        thành công lẫn thất bại (trả lại lượt thử half_open)"""
+        if breaker is None:
+            return
+        if is_upstream_failure(exc):
+            breaker.record(latency, failed=True)
+        else:
+            breaker.cancel()
+
+    def _record_usage(self, response):
+        """usage_metadata của Gemini (response thường hoặc chunk cuối của stream)"""
+        metrics = getattr(self, "metrics", None)
+        usage = getattr(response, "usage_metadata", None)
+        if metrics is not None and usage is not None:
+            metrics.record_tokens(getattr(usage, "prompt_token_count", 0) or 0,
+                                  getattr(usage, "candidates_token_count", 0) or 0)
+
+    @staticmethod
+    def _extract_text(response) -> str:
         # Lấy text sạch
         try:
             return response.candidates[0].content.parts[0].text.strip()
         except Exception:
             return response.text.strip()
 
-# ================= LLMChain Manager =================
+    # ================= Gọi Gemini qua gateway =================
+    def _generate(self, prompt: str):
+        model = self._get_model_instance()
+        gateway = getattr(self, "gateway", None)
+        breaker = getattr(self, "breaker", None)
+        if breaker is not None:
+            breaker.before_call()
+        generation_config = self._generation_config()
+        start = time.perf_counter()
+        # Timeout của tier = budget của lời gọi (gồm retry); hết budget là upstream chậm, khác với hết
+        # deadline của request (DeadlineExceeded)
+        tier_timeout = getattr(self, "timeout", None)
+        try:
+            if gateway is None:
+                timeout, request_bound = attempt_budget(tier_timeout)
+                try:
+                    result = model.generate_content(
+                        prompt,
+                        generation_config=generation_config,
+                        request_options={"timeout": timeout} if timeout is not None else None
+                    )
+                except Exception as e:
+                    if request_bound and is_attempt_timeout(e, time.perf_counter() - start, timeout):
+                        raise DeadlineExceeded("Hết deadline (gemini)") from e
+                    raise
+            else:
+                # Timeout tính lại mỗi lần retry theo budget / deadline còn lại
+                result = gateway.call(lambda: model.generate_content(
+                    prompt,
+                    generation_config=generation_config,
+                    request_options={"timeout": gateway.attempt_timeout()}
+                ), budget=tier_timeout)
+        except Exception as e:
+            latency = time.perf_counter() - start
+            self._record_breaker_failure(breaker, latency, e)
+            self._record_call(latency, failed=True)
+            raise
+        latency = time.perf_counter() - start
+        if breaker is not None:
+            breaker.record(latency, failed=False)
+        self._record_call(latency, failed=False)
+        self._record_usage(result)
+        return result
+
+    async def _agenerate(self, prompt: str, stream: bool = False):
+        """stream=True: gateway chỉ bao phần mở stream (retry được trước khi có chunk đầu tiên)"""
+        model = self._get_model_instance()
+        gateway = getattr(self, "gateway", None)
+        breaker = getattr(self, "breaker", None)
+        if breaker is not None:
+            breaker.before_call()
+        generation_config = self._generation_config()
+        start = time.perf_counter()
+        tier_timeout = getattr(self, "timeout", None)
+        try:
+            if gateway is None:
+                timeout, request_bound = attempt_budget(tier_timeout)
+                result = await run_attempt(model.generate_content_async(
+                    prompt, generation_config=generation_config, stream=stream
+                ), timeout, request_bound)
+            else:
+                result = await gateway.acall(lambda: model.generate_content_async(
+                    prompt,
+                    generation_config=generation_config,
+                    stream=stream,
+                    request_options={"timeout": gateway.attempt_timeout()}
+                ), budget=tier_timeout)
+        except asyncio.CancelledError:
+            if breaker is not None:
+                breaker.cancel()
+            raise
+        except Exception as e:
+            latency = time.perf_counter() - start
+            self._record_breaker_failure(breaker, latency, e)
+            self._record_call(latency, failed=True)
+            raise
+        latency = time.perf_counter() - start
+        if breaker is not None:
+            breaker.record(latency, failed=False)
+        # stream: độ trễ tới lúc mở stream, token ghi ở chunk cuối (astream)
+        self._record_call(latency, failed=False)
+        if not stream:
+            self._record_usage(result)
+        return result
+
+    # ================= Response cache =================
+    def _active_cache(self, use_cache: bool) -> Optional[LLMResponseCache]:
+        return getattr(self, "cache", None) if use_cache else None
+
+    def _cache_key(self, prompt: str) -> str:
+        return LLMResponseCache.make_key(self.model, self.temperature, prompt,
+                                         getattr(self, "max_output_tokens", None))
+
+    def invoke(self, inputs: Union[str, Dict], config=None, use_cache: bool = True, **kwargs) -> str:
+        if "stop" in kwargs:
+            kwargs.pop("stop")
+
+        prompt = self._build_prompt(inputs)
+        cache = self._active_cache(use_cache)
+        if cache is not None:
+            cached = cache.get(self._cache_key(prompt))
+            if cached is not None:
+                return cached
+
+        text = self._extract_text(self._generate(prompt))
+        if cache is not None and text:
+            cache.put(self._cache_key(prompt), text, model=self.model)
+        return text
+
+    async def ainvoke(self, inputs: Union[str, Dict], config=None, use_cache: bool = True, **kwargs) -> str:
+        """Bản async: gọi thẳng generate_content_async, không chiếm thread của threadpool"""
+        if "stop" in kwargs:
+            kwargs.pop("stop")
+
+        prompt = self._build_prompt(inputs)
+        cache = self._active_cache(use_cache)
+        if cache is not None:
+            cached = await run_in("db", cache.get, self._cache_key(prompt))
+            if cached is not None:
+                return cached
+
+        text = self._extract_text(await self._agenerate(prompt))
+        if cache is not None and text:
+            await run_in("db", cache.put, self._cache_key(prompt), text, self.model)
+        return text
+
+    async def astream(self, inputs: Union[str, Dict], config=None, use_cache: bool = True,
+                      **kwargs) -> AsyncIterator[str]:
+        """Stream từng đoạn text từ Gemini (generate_content_async(..., stream=True))"""
+        if "stop" in kwargs:
+            kwargs.pop("stop")
+
+        prompt = self._build_prompt(inputs)
+        cache = self._active_cache(use_cache)
+        if cache is not None:
+            cached = await run_in("db", cache.get, self._cache_key(prompt))
+            if cached is not None:
+                yield cached
+                return
+
+        response = await self._agenerate(prompt, stream=True)
+        parts: List[str] = []
+        last_chunk = None
+        async for chunk in response:
+            last_chunk = chunk
+            try:
+                text = chunk.text
+            except Exception:
+                # Chunk không có text (vd: bị chặn bởi safety filter)
+                continue
+            if text:
+                parts.append(text)
+                yield text
+
+        # Chỉ lưu khi stream chạy hết (client ngắt giữa chừng → generator bị đóng, không tới đây)
+        if last_chunk is not None:
+            self._record_usage(last_chunk)
+        full_text = "".join(parts).strip()
+        if cache is not None and full_text:
+            await run_in("db", cache.put, self._cache_key(prompt), full_text, self.model)
+
+# ================= Chain Manager =================
 class LLMChainManager:
     """
-    Quản lý nhiều LLMChain dùng Gemini
+    Quản lý nhiều PromptChain (ai_core.prompt_runtime) dùng Gemini
     """
-    def __init__(self, model: str = "gemini-1.5-t", temperature: float = 0.2):
-        self.llm = GeminiLLM(model=model, temperature=temperature)
-        self.chains: Dict[str, LLMChain] = {}
+    def __init__(self, model: Optional[str] = None, temperature: float = 0.2, tier: str = "fast"):
+        """model=None → LLM của tier trong router mặc định (các chain ở đây là chain NLU → "fast")"""
+        if model is None:
+            from ai_core.model_router import get_default_router
+            self.llm = get_default_router().llm_for_tier(tier)
+        else:
+            self.llm = GeminiLLM(model=model, temperature=temperature)
+        self.chains: Dict[str, PromptChain] = {}
 
     def create_chain(self, name: str, prompt_template: str, input_vars: list, parser=None):
         prompt = PromptTemplate(template=prompt_template, input_variables=input_vars)
-        chain = LLMChain(
+        chain = PromptChain(
             llm=self.llm,
             prompt=prompt,
             output_parser=parser,
@@ -70,7 +311,7 @@ class LLMChainManager:
         logger.info(f"✅ Created Gemini chain: {name}")
         return chain
 
-    def get_chain(self, name: str) -> LLMChain:
+    def get_chain(self, name: str) -> PromptChain:
         """Lấy chain đã tạo theo tên"""
         return self.chains.get(name, None)
 
@@ -0,0 +1,464 @@
+# ai_core/llm_gateway.py
+"""
+Gateway phía client cho mọi lời gọi Gemini:
+  - giới hạn concurrency thích ứng kiểu AIMD (thành công → +1/limit, 429/503/timeout → ×0.5)
+  - token bucket theo quota (GEMINI_RPM)
+  - retry với exponential backoff + full jitter cho 429 / 5xx / timeout
+  - tôn trọng deadline của request (utils.deadline) và budget của lời gọi (timeout của tier): timeout mỗi
+    lần gọi, chờ hàng đợi và backoff không vượt quá thời gian còn lại. Hết giờ vì deadline của request
+    → DeadlineExceeded (không giảm limit); hết GEMINI_TIMEOUT / budget của tier → upstream chậm
+    (giảm limit, retry nếu còn thời gian, cuối cùng TimeoutError → tính vào circuit breaker)
+  - metrics: độ sâu hàng đợi, thời gian chờ, in-flight, limit hiện tại, số retry...
+Dùng chung được cho code sync (thread) và async: hàng đợi là deque các waiter,
+slot được trao thẳng cho waiter đầu tiên khi có lời gọi kết thúc.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from utils.circuit_breaker import CircuitBreaker
+from utils.deadline import DeadlineExceeded, bound_timeout, remaining
+from utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+OVERLOAD_STATUS = {429, 503}
+
+# Timeout của lần gọi hiện tại (gateway đặt trước khi gọi fn) → attempt_timeout() trong fn đọc được
+_attempt_timeout: ContextVar[Optional[float]] = ContextVar("gemini_attempt_timeout", default=None)
+
+
+class LLMOverloadedError(RuntimeError):
+    """Hàng đợi gateway đã đầy — từ chối ngay thay vì xếp hàng vô hạn"""
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    """HTTP status của lỗi (google.api_core có .code, client HTTP thường có .status_code / .response)"""
+    for attr in ("code", "status_code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def _is_timeout(exc: BaseException) -> bool:
+    return isinstance(exc, (asyncio.TimeoutError, TimeoutError)) or _status_code(exc) == 504
+
+
+def is_attempt_timeout(exc: BaseException, latency: float, timeout: Optional[float]) -> bool:
+    """
+    Lời gọi sync lỗi vì hết timeout của chính nó: client báo timeout (504 / TimeoutError) hoặc lỗi khác
+    (vd: ReadTimeout của transport REST) xảy ra khi đã chạy hết timeout
+    """
+    return _is_timeout(exc) or (timeout is not None and latency >= timeout)
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """
+    Lỗi do phía Gemini (5xx, 429, timeout của chính lời gọi, lỗi mạng) → tính vào circuit breaker.
+    Hết deadline của request, hàng đợi gateway đầy, huỷ, lỗi 4xx của prompt → không phải upstream hỏng.
+    """
+    if isinstance(exc, (DeadlineExceeded, LLMOverloadedError, asyncio.CancelledError)):
+        return False
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError, OSError))
+
+
+def attempt_budget(timeout: Optional[float], call_deadline: Optional[float] = None) -> Tuple[Optional[float], bool]:
+    """
+    Timeout của 1 lần gọi = min(timeout, budget còn lại của lời gọi, deadline còn lại của request),
+    kèm cờ "deadline của request là giới hạn chặt nhất": hết giờ khi đó là DeadlineExceeded,
+    ngược lại là upstream chậm (timeout thật). Request đã hết deadline → DeadlineExceeded ngay.
+    """
+    if call_deadline is not None:
+        left = call_deadline - time.monotonic()
+        timeout = left if timeout is None else min(timeout, left)
+    request_left = remaining()
+    if request_left is not None and (timeout is None or request_left <= timeout):
+        if request_left <= 0:
+            raise DeadlineExceeded("Hết deadline (gemini)")
+        return request_left, True
+    return (None if timeout is None else max(0.0, timeout)), False
+
+
+async def run_attempt(awaitable: Awaitable[T], timeout: Optional[float], request_bound: bool) -> T:
+    """await 1 lần gọi với timeout từ attempt_budget: hết giờ do deadline request → DeadlineExceeded,
+    do timeout của lời gọi → asyncio.TimeoutError (lỗi upstream)"""
+    try:
+        return await asyncio.wait_for(awaitable, timeout=timeout)
+    except asyncio.TimeoutError as e:
+        if isinstance(e, DeadlineExceeded):
+            raise
+        if request_bound:
+            raise DeadlineExceeded("Hết deadline (gemini)") from None
+        raise
+
+
+class _Waiter:
+    __slots__ = ("loop", "future", "event", "enqueued_at")
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.enqueued_at = time.perf_counter()
+
+    def wake(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._set_result)
+        else:
+            self.event.set()
+
+    def _set_result(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class GeminiGateway:
+    def __init__(self, initial_limit: Optional[float] = None, min_limit: Optional[float] = None,
+                 max_limit: Optional[float] = None, requests_per_minute: Optional[float] = None,
+                 burst: Optional[float] = None, timeout: Optional[float] = None,
+                 max_retries: Optional[int] = None, backoff_base: Optional[float] = None,
+                 backoff_max: Optional[float] = None, max_queue: Optional[int] = None):
+        def env(value, name, default, cast=float):
+            return value if value is not None else cast(os.getenv(name, default))
+
+        self.min_limit = env(min_limit, "GEMINI_MIN_CONCURRENCY", 1)
+        self.max_limit = env(max_limit, "GEMINI_MAX_CONCURRENCY", 32)
+        self.limit = min(self.max_limit, max(self.min_limit, env(initial_limit, "GEMINI_INITIAL_CONCURRENCY", 8)))
+        self.timeout = env(timeout, "GEMINI_TIMEOUT", 30)
+        self.max_retries = env(max_retries, "GEMINI_MAX_RETRIES", 3, int)
+        self.backoff_base = env(backoff_base, "GEMINI_BACKOFF_BASE", 0.5)
+        self.backoff_max = env(backoff_max, "GEMINI_BACKOFF_MAX", 8)
+        self.max_queue = env(max_queue, "GEMINI_MAX_QUEUE", 1000, int)
+
+        rpm = env(requests_per_minute, "GEMINI_RPM", 0)
+        burst = env(burst, "GEMINI_RATE_BURST", 0)
+        self.bucket = TokenBucket(rpm / 60.0, burst or None) if rpm > 0 else None
+
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._rate_waiting = 0
+        self._waiters: "deque[_Waiter]" = deque()
+        self._last_decrease = 0.0
+        self._wait_samples: "deque[float]" = deque(maxlen=1000)
+        self.stats = {
+            "calls": 0, "success": 0, "failure": 0, "retries": 0, "rejected": 0,
+            "rate_limited": 0, "server_errors": 0, "timeouts": 0, "max_queue_depth": 0, "deadline_exceeded": 0,
+        }
+
+    # ================= AIMD concurrency =================
+    def _try_acquire_locked(self) -> bool:
+        if self._inflight < int(self.limit) and not self._waiters:
+            self._inflight += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise LLMOverloadedError(f"Gemini gateway queue full ({self.max_queue})")
+        return False
+
+    def _enqueue_locked(self, waiter: _Waiter):
+        self._waiters.append(waiter)
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self._waiters))
+
+    def _release_locked(self):
+        self._inflight -= 1
+        # Trao slot trực tiếp cho waiter (in-flight giữ nguyên)
+        while self._waiters and self._inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            self._inflight += 1
+            waiter.wake()
+
+    def _on_success(self):
+        with self._lock:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.stats["success"] += 1
+            self._release_locked()
+
+    def _on_overload(self, latency: float):
+        """Giảm một nửa, tối đa 1 lần mỗi ~latency (nhiều lỗi cùng đợt chỉ tính 1 lần)"""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease >= max(latency, 0.1):
+                old = self.limit
+                self.limit = max(self.min_limit, self.limit * 0.5)
+                self._last_decrease = now
+                logger.info(f"📉 Gemini concurrency limit {old:.1f} → {self.limit:.1f}")
+
+    def _release(self):
+        with self._lock:
+            self._release_locked()
+
+    def _acquire_sync(self, call_deadline: Optional[float] = None) -> float:
+        with self._lock:
+            if self._try_acquire_locked():
+                return 0.0
+            waiter = _Waiter()
+            self._enqueue_locked(waiter)
+        left = self._time_left(call_deadline)
+        if not waiter.event.wait(timeout=None if left is None else max(0.0, left)):
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    self.stats["deadline_exceeded"] += 1
+                    raise DeadlineExceeded("Hết deadline (gemini queue)")
+            # Slot được trao đúng lúc hết giờ → vẫn dùng
+        return time.perf_counter() - waiter.enqueued_at
+
+    async def _acquire_async(self) -> float:
+        with self._lock:
+            if self._try_acquire_locked():
+                return 0.0
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._enqueue_locked(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    # Slot đã được trao nhưng caller bị huỷ → trả lại
+                    self._release_locked()
+            raise
+        return time.perf_counter() - waiter.enqueued_at
+
+    def _record_wait(self, seconds: float):
+        """Thời gian chờ trước khi được gọi = chờ token bucket + chờ slot concurrency"""
+        with self._lock:
+            self._wait_samples.append(seconds)
+
+    # ================= Retry policy =================
+    def _classify_failure(self, exc: BaseException) -> bool:
+        """Cập nhật metrics, trả True nếu lỗi nên retry"""
+        status = _status_code(exc)
+        with self._lock:
+            if _is_timeout(exc):
+                self.stats["timeouts"] += 1
+                return True
+            if status == 429:
+                self.stats["rate_limited"] += 1
+            elif status is not None and status >= 500:
+                self.stats["server_errors"] += 1
+        return status in RETRYABLE_STATUS
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        retry_after = getattr(exc, "retry_after", None)
+        if isinstance(retry_after, (int, float)):
+            delay = max(delay, float(retry_after))
+        return delay
+
+    def _handle_failure(self, exc: BaseException, latency: float, attempt: int,
+                        call_deadline: Optional[float] = None) -> Optional[float]:
+        """
+        Lời gọi lỗi: cập nhật limit + metrics, trả thời gian backoff nếu nên retry, None nếu bỏ cuộc
+        (kể cả khi không còn đủ thời gian để retry → caller ném lại lỗi upstream gốc cho breaker)
+        """
+        retryable = self._classify_failure(exc)
+        if _is_timeout(exc) or _status_code(exc) in OVERLOAD_STATUS:
+            self._on_overload(latency)
+        self._release()
+        backoff = self._backoff(attempt, exc) if retryable and attempt < self.max_retries else None
+        if backoff is not None:
+            left = self._time_left(call_deadline)
+            if left is not None and backoff >= left:
+                backoff = None
+        with self._lock:
+            if backoff is None:
+                self.stats["failure"] += 1
+            else:
+                self.stats["retries"] += 1
+        return backoff
+
+    def _rate_wait(self) -> float:
+        delay = self.bucket.reserve() if self.bucket is not None else 0.0
+        if delay > 0:
+            with self._lock:
+                self._rate_waiting += 1
+        return delay
+
+    def _rate_wait_done(self, delay: float):
+        if delay > 0:
+            with self._lock:
+                self._rate_waiting -= 1
+
+    # ================= Deadline =================
+    @staticmethod
+    def _time_left(call_deadline: Optional[float]) -> Optional[float]:
+        """Thời gian còn lại = min(deadline của request, budget của lời gọi)"""
+        left = remaining()
+        if call_deadline is not None:
+            budget_left = call_deadline - time.monotonic()
+            left = budget_left if left is None else min(left, budget_left)
+        return left
+
+    def attempt_timeout(self) -> float:
+        """Timeout của lần gọi hiện tại (gọi bên trong fn): GEMINI_TIMEOUT, không vượt budget của lời gọi
+        và deadline còn lại của request"""
+        timeout = _attempt_timeout.get()
+        return timeout if timeout is not None else bound_timeout(self.timeout, "gemini")
+
+    def _deadline_exceeded(self, stage: str) -> DeadlineExceeded:
+        with self._lock:
+            self.stats["deadline_exceeded"] += 1
+        return DeadlineExceeded(f"Hết deadline ({stage})")
+
+    def _check_wait(self, seconds: float, stage: str, call_deadline: Optional[float] = None):
+        """Chờ rate limit lâu hơn thời gian còn lại → bỏ luôn, không chờ vô ích"""
+        left = self._time_left(call_deadline)
+        if left is not None and seconds >= left:
+            raise self._deadline_exceeded(stage)
+
+    # ================= Public API =================
+    def call(self, fn: Callable[[], T], budget: Optional[float] = None) -> T:
+        """
+        Gọi fn (sync, tự đặt timeout = attempt_timeout()) qua limiter + rate limit + retry.
+        budget: tổng thời gian của lời gọi, gồm cả retry (timeout của tier)
+        """
+        call_deadline = time.monotonic() + budget if budget else None
+        with self._lock:
+            self.stats["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            delay = self._rate_wait()
+            try:
+                self._check_wait(delay, "gemini rate limit", call_deadline)
+                if delay > 0:
+                    time.sleep(delay)
+            finally:
+                self._rate_wait_done(delay)
+            self._record_wait(delay + self._acquire_sync(call_deadline))
+            start = time.perf_counter()
+            try:
+                timeout, request_bound = attempt_budget(self.timeout, call_deadline)
+            except DeadlineExceeded:
+                self._release()
+                raise self._deadline_exceeded("gemini") from None
+            token = _attempt_timeout.set(timeout)
+            try:
+                result = fn()
+            except Exception as e:
+                latency = time.perf_counter() - start
+                timed_out = is_attempt_timeout(e, latency, timeout)
+                if timed_out and request_bound:
+                    # Giống acall: hết deadline của request → không giảm limit, không tính lỗi upstream
+                    self._release()
+                    raise self._deadline_exceeded("gemini") from e
+                failure = TimeoutError(str(e)) if timed_out and not _is_timeout(e) else e
+                backoff = self._handle_failure(failure, latency, attempt, call_deadline)
+                if backoff is None:
+                    raise
+                time.sleep(backoff)
+                continue
+            finally:
+                _attempt_timeout.reset(token)
+            self._on_success()
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], budget: Optional[float] = None) -> T:
+        """
+        Bản async: fn trả coroutine, bị huỷ sau attempt_timeout() giây.
+        Hết giờ vì deadline của request → DeadlineExceeded; vì GEMINI_TIMEOUT / budget → lỗi upstream
+        """
+        call_deadline = time.monotonic() + budget if budget else None
+        with self._lock:
+            self.stats["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            delay = self._rate_wait()
+            try:
+                self._check_wait(delay, "gemini rate limit", call_deadline)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            finally:
+                self._rate_wait_done(delay)
+            left = self._time_left(call_deadline)
+            try:
+                waited = await asyncio.wait_for(self._acquire_async(), timeout=None if left is None else max(0.0, left))
+            except asyncio.TimeoutError:
+                raise self._deadline_exceeded("gemini queue") from None
+            self._record_wait(delay + waited)
+            start = time.perf_counter()
+            try:
+                timeout, request_bound = attempt_budget(self.timeout, call_deadline)
+            except DeadlineExceeded:
+                self._release()
+                raise self._deadline_exceeded("gemini") from None
+            token = _attempt_timeout.set(timeout)
+            try:
+                awaitable = fn()
+            finally:
+                _attempt_timeout.reset(token)
+            try:
+                result = await run_attempt(awaitable, timeout, request_bound)
+            except asyncio.CancelledError:
+                self._release()
+                raise
+            except DeadlineExceeded:
+                # Hết deadline của request chứ không phải upstream quá tải → không giảm limit
+                self._release()
+                raise self._deadline_exceeded("gemini") from None
+            except Exception as e:
+                backoff = self._handle_failure(e, time.perf_counter() - start, attempt, call_deadline)
+                if backoff is None:
+                    raise
+                await asyncio.sleep(backoff)
+                continue
+            self._on_success()
+            return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["limit"] = round(self.limit, 2)
+            stats["inflight"] = self._inflight
+            stats["queue_depth"] = len(self._waiters)
+            stats["rate_waiting"] = self._rate_waiting
+            waits = sorted(self._wait_samples)
+        if waits:
+            stats["wait_ms_avg"] = round(sum(waits) / len(waits) * 1000, 1)
+            stats["wait_ms_p95"] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1)
+        else:
+            stats["wait_ms_avg"] = stats["wait_ms_p95"] = 0.0
+        return stats
+
+
+_default_gateway: Optional[GeminiGateway] = None
+_default_gateway_lock = threading.Lock()
+
+
+def get_default_gateway() -> Optional[GeminiGateway]:
+    """Gateway dùng chung cho mọi GeminiLLM (quota tính theo API key); tắt bằng GEMINI_GATEWAY_ENABLED=0"""
+    global _default_gateway
+    if os.getenv("GEMINI_GATEWAY_ENABLED", "1") != "1":
+        return None
+    with _default_gateway_lock:
+        if _default_gateway is None:
+            _default_gateway = GeminiGateway()
+        return _default_gateway
+
+
+_default_breaker: Optional[CircuitBreaker] = None
+
+
+def get_default_breaker() -> Optional[CircuitBreaker]:
+    """Circuit breaker dùng chung cho mọi GeminiLLM; tắt bằng LLM_BREAKER_ENABLED=0"""
+    global _default_breaker
+    if os.getenv("LLM_BREAKER_ENABLED", "1") != "1":
+        return None
+    with _default_gateway_lock:
+        if _default_breaker is None:
+            _default_breaker = CircuitBreaker(name="gemini")
+        return _default_breaker
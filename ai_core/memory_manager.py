@@ -1,71 +1,298 @@
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.schema import BaseMessage
-from typing import Dict, List
+import logging
+from contextvars import ContextVar
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+from utils.executors import run_in
+from utils.session_registry import SessionRegistry
+from utils.session_store import SessionStore, SessionStoreUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Session đã nạp từ store trong request hiện tại (aload_session) → getter đồng bộ không đọc store nữa
+_loaded_sessions: ContextVar[FrozenSet[str]] = ContextVar("loaded_sessions", default=frozenset())
+
+
+def render_turn(user_input: str, assistant_output: str) -> str:
+    """1 lượt hội thoại dạng text trong prompt"""
+    return f"User: {user_input}\nAssistant: {assistant_output}\n"
+
+
+class ChatMessage:
+    """Message nhẹ, cùng thuộc tính type/content với BaseMessage của LangChain ("human" / "ai")"""
+    __slots__ = ("type", "content")
+
+    def __init__(self, type: str, content: str):
+        self.type = type
+        self.content = content
+
+    def __repr__(self) -> str:
+        return f"ChatMessage(type={self.type!r}, content={self.content[:30]!r})"
+
+
+class ConversationWindow:
+    """
+    Cửa sổ k lượt hội thoại gần nhất của 1 session: ring buffer cố định k ô (list cấp phát sẵn),
+    chuỗi lịch sử "User:/Assistant:" được render sẵn và cập nhật dần ở mỗi lượt mới
+    → đọc lịch sử / tin nhắn assistant cuối đều O(1).
+    """
+    __slots__ = ("k", "_users", "_assistants", "_lengths", "_start", "_size",
+                 "_history", "last_intent", "last_question")
+
+    def __init__(self, k: int):
+        self.k = k
+        self._users: List[Optional[str]] = [None] * k
+        self._assistants: List[Optional[str]] = [None] * k
+        self._lengths = [0] * k     # độ dài phần render của từng lượt
+        self._start = 0             # ô chứa lượt cũ nhất
+        self._size = 0
+        self._history = ""
+        self.last_intent: Optional[str] = None
+        self.last_question: Optional[str] = None
+
+    def append(self, user_input: str, assistant_output: str):
+        rendered = render_turn(user_input, assistant_output)
+        if self._size < self.k:
+            slot = (self._start + self._size) % self.k
+            self._size += 1
+            self._history += rendered
+        else:
+            # Đầy → ghi đè lượt cũ nhất, cắt phần render của nó ở đầu chuỗi
+            slot = self._start
+            self._start = (self._start + 1) % self.k
+            self._history = self._history[self._lengths[slot]:] + rendered
+        self._users[slot] = user_input
+        self._assistants[slot] = assistant_output
+        self._lengths[slot] = len(rendered)
+
+    def turns(self) -> List[Tuple[str, str]]:
+        """Các lượt (câu hỏi, trả lời) theo thứ tự thời gian"""
+        slots = [(self._start + i) % self.k for i in range(self._size)]
+        return [(self._users[s], self._assistants[s]) for s in slots]
+
+    def messages(self) -> List[ChatMessage]:
+        result = []
+        for user_input, assistant_output in self.turns():
+            result.append(ChatMessage("human", user_input))
+            result.append(ChatMessage("ai", assistant_output))
+        return result
+
+    @property
+    def history(self) -> str:
+        return self._history
+
+    @property
+    def last_assistant_message(self) -> str:
+        if not self._size:
+            return ""
+        return self._assistants[(self._start + self._size - 1) % self.k] or ""
+
+    @property
+    def message_count(self) -> int:
+        return 2 * self._size
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def size_bytes(self) -> int:
+        """Ước lượng dung lượng state (ký tự) cho registry"""
+        return len(self._history) + len(self.last_question or "") + len(self.last_intent or "")
+
 
 class UXOMemoryManager:
-    def __init__(self, k=3):
-        self.memories: Dict[str, ConversationBufferWindowMemory] = {}  # Lưu trữ memory cho từng session
-        self.last_intents: Dict[str, str] = {}  # 🔹 Lưu intent cuối cùng riêng
-        self.last_questions: Dict[str, str] = {}   # 🔹 NEW: Lưu câu hỏi cuối
-        self.k = k  # Số lượng tin nhắn lưu trong memory
-    
-    def get_memory(self, session_id: str) -> ConversationBufferWindowMemory:
+    # Số lần thử lại khi worker khác ghi state của session trước mình (compare-and-set thua)
+    PERSIST_ATTEMPTS = 5
+
+    def __init__(self, k=3, session_registry: Optional[SessionRegistry] = None,
+                 session_store: Optional[SessionStore] = None):
+        self.memories: Dict[str, ConversationWindow] = {}  # Cửa sổ hội thoại (kèm intent / câu hỏi cuối) cho từng session
+        self.k = k  # Số lượt hội thoại lưu trong memory
+        # Store dùng chung giữa các worker: memories chỉ còn là cache cục bộ,
+        # _versions ghi version state đã nạp để biết khi nào worker khác vừa cập nhật
+        self.session_store = session_store
+        self._versions: Dict[str, int] = {}
+        self.session_registry = None
+        if session_registry is not None:
+            self.attach_registry(session_registry)
+
+    def attach_store(self, session_store: SessionStore):
+        """Gắn store dùng chung (gọi trước attach_registry)"""
+        self.session_store = session_store
+
+    def attach_registry(self, session_registry: SessionRegistry):
+        """Registry xoá session (TTL / LRU / cap) → dọn state cục bộ của session đó
+        (có session store thì state bền vẫn còn, lần sau được nạp lại từ store)"""
+        self.session_registry = session_registry
+        listener = self.evict_local if self.session_store is not None else self.clear_memory
+        session_registry.add_eviction_listener(listener)
+
+    # ================= Session store =================
+    @staticmethod
+    def _store_key(session_id: str) -> str:
+        return f"memory:{session_id}"
+
+    def _sync_from_store(self, session_id: str, force: bool = False):
+        """Read-through: nạp lại memory nếu state trong store mới hơn bản cục bộ.
+        Session đã được aload_session nạp trong request này thì bỏ qua (trừ khi force)"""
+        if self.session_store is None:
+            return
+        if not force and session_id in _loaded_sessions.get():
+            return
+        state = self.session_store.get(self._store_key(session_id))
+        if state is None:
+            if session_id in self._versions:  # đã bị xoá ở worker khác
+                self.evict_local(session_id)
+            return
+        if state.get("version") == self._versions.get(session_id):
+            return
+        self._load_turns(session_id, state.get("turns", []), state.get("last_intent"), state.get("last_question"))
+        self._versions[session_id] = state.get("version", 0)
+
+    def _load_turns(self, session_id: str, turns: Iterable[Tuple[str, str]],
+                    last_intent: Optional[str], last_question: Optional[str]):
+        window = ConversationWindow(self.k)
+        for user_input, assistant_output in turns:
+            window.append(user_input, assistant_output)
+        window.last_intent = last_intent or None
+        window.last_question = last_question or None
+        self.memories[session_id] = window
+
+    async def aload_session(self, session_id: str):
+        """
+        Nạp state của session từ store 1 lần cho request hiện tại, trên pool "db" (không chặn event loop).
+        Các getter đồng bộ gọi sau đó trong cùng request (context hiện tại và các run_in con)
+        chỉ đọc bản cục bộ vừa nạp.
+        """
+        if self.session_store is None:
+            return
+        await run_in("db", self._sync_from_store, session_id, True)
+        _loaded_sessions.set(_loaded_sessions.get() | {session_id})
+
+    def _persist(self, session_id: str) -> bool:
+        """Compare-and-set state hiện tại vào store với version đã nạp; False nếu worker khác ghi trước"""
+        window = self.memories[session_id]
+        expected = self._versions.get(session_id, 0)
+        ok = self.session_store.compare_and_set(self._store_key(session_id), expected, {
+            "turns": [list(turn) for turn in window.turns()],
+            "last_intent": window.last_intent,
+            "last_question": window.last_question,
+            "version": expected + 1,
+        })
+        if ok:
+            self._versions[session_id] = expected + 1
+        return ok
+
+    def _update(self, session_id: str, apply: Callable[[ConversationWindow], None]) -> ConversationWindow:
+        """
+        Sửa memory của session rồi ghi vào store. Thua compare-and-set (worker khác vừa thêm lượt)
+        → bỏ bản cục bộ, nạp lại state mới nhất và áp lại thay đổi, thay vì ghi đè mất lượt của worker kia.
+        Store lỗi → giữ thay đổi ở bản cục bộ, không ghi (store có lại thì bản trong store được nạp lại).
+        """
+        self._sync_from_store(session_id)
+        for attempt in range(self.PERSIST_ATTEMPTS):
+            window = self.get_memory(session_id)
+            apply(window)
+            try:
+                if self.session_store is None or self._persist(session_id):
+                    return window
+            except SessionStoreUnavailable as e:
+                logger.warning(f"⚠️ Chưa ghi được memory session {session_id} vào store: {e}")
+                return window
+            logger.debug("🔁 Session %s vừa được worker khác cập nhật, nạp lại (lần %d)", session_id, attempt + 1)
+            self.evict_local(session_id)
+            self._sync_from_store(session_id, force=True)
+        logger.warning(f"⚠️ Không ghi được memory session {session_id} sau {self.PERSIST_ATTEMPTS} lần thử")
+        return self.get_memory(session_id)
+
+    def has_session(self, session_id: str) -> bool:
+        self._sync_from_store(session_id)
+        return session_id in self.memories
+
+    def rehydrate(self, session_id: str, turns: List[Tuple[str, str, Optional[str]]]):
+        """Dựng lại memory từ lịch sử (vd: chat_logs) — turns theo thứ tự thời gian: (câu hỏi, trả lời, intent)"""
+        turns = turns[-self.k:]
+        if not turns:
+            return
+        last_intent = next((intent for _, _, intent in reversed(turns) if intent), None)
+        self._load_turns(session_id, [(q, a) for q, a, _ in turns], last_intent, turns[-1][0])
+        try:
+            persisted = self.session_store is None or self._persist(session_id)
+        except SessionStoreUnavailable as e:
+            logger.warning(f"⚠️ Chưa ghi được memory session {session_id} vào store: {e}")
+            persisted = True   # dùng bản dựng lại ở cục bộ
+        if not persisted:
+            # Worker khác đã có state mới hơn cho session → dùng bản đó
+            self.evict_local(session_id)
+            self._sync_from_store(session_id, force=True)
+            return
+        logger.info(f"♻️ Rehydrated {len(turns)} turns for session {session_id}")
+
+    def evict_local(self, session_id: str):
+        """Chỉ xoá cache cục bộ, không đụng tới store"""
+        self.memories.pop(session_id, None)
+        self._versions.pop(session_id, None)
+
+    def get_memory(self, session_id: str) -> ConversationWindow:
         """Lấy memory cho session, tạo mới nếu chưa có"""
-        if session_id not in self.memories: 
-            memory = ConversationBufferWindowMemory( 
-                k=self.k, return_messages=True, memory_key="chat_history", output_key="output" ) 
-            self.memories[session_id] = memory 
-        return self.memories[session_id]
-    
+        window = self.memories.get(session_id)
+        if window is None:
+            window = self.memories[session_id] = ConversationWindow(self.k)
+        return window
+
     def save_context(self, session_id: str, user_input: str, assistant_output: str, intent: str = None):
-        """Lưu ngữ cảnh hội thoại kèm intent"""
-        memory = self.get_memory(session_id)
-        memory.save_context(
-            {"input": user_input},  # ✅ input format chuẩn
-            {"output": assistant_output}  # ✅ output format chuẩn
-        )
-        if intent:
-            self.last_intents[session_id] = intent
-        self.last_questions[session_id] = user_input   # 🔹 Lưu câu hỏi cuối
-        print(f"💾 Saved context: {user_input[:50]}... -> {assistant_output[:50]}... | intent={intent}")
+        """Lưu ngữ cảnh hội thoại kèm intent (có session store: ghi đồng bộ → gọi qua run_in("db") từ code async)"""
+        def apply(window: ConversationWindow):
+            window.append(user_input, assistant_output)
+            if intent:
+                window.last_intent = intent
+            window.last_question = user_input   # 🔹 Lưu câu hỏi cuối
+
+        window = self._update(session_id, apply)
+        if self.session_registry is not None:
+            self.session_registry.update_size(session_id, window.size_bytes)
+        logger.debug("💾 Saved context: %.50s... -> %.50s... | intent=%s", user_input, assistant_output, intent)
+
+    def get_turns(self, session_id: str) -> List[Tuple[str, str]]:
+        """Các lượt (câu hỏi, trả lời) theo thứ tự thời gian — để cắt lịch sử theo nguyên lượt"""
+        self._sync_from_store(session_id)
+        window = self.memories.get(session_id)
+        return window.turns() if window is not None else []
 
     def get_chat_history(self, session_id: str) -> str:
-        """Lấy lịch sử chat dạng text"""
-        try:
-            memory = self.get_memory(session_id)
-            memory_vars = memory.load_memory_variables({})
-            chat_history = memory_vars.get("chat_history", [])
-            
-            if not chat_history:  # ✅ tránh lỗi khi chưa có gì
-                return ""
-            history_text = ""
-            for msg in chat_history:
-                if hasattr(msg, 'type') and hasattr(msg, 'content'):
-                    role = "User" if msg.type == "human" else "Assistant"
-                    history_text += f"{role}: {msg.content}\n"
-            
-            print(f"📝 Chat history for {session_id}: {history_text}")
-            return history_text
-            
-        except Exception as e:
-            print(f"❌ Error getting chat history: {e}")
-            return ""
-    
+        """Lấy lịch sử chat dạng text (render sẵn, không dựng lại mỗi request)"""
+        self._sync_from_store(session_id)
+        window = self.memories.get(session_id)
+        return window.history if window is not None else ""
+
     def clear_memory(self, session_id: str):
-        """Xóa memory của session"""
-        if session_id in self.memories:
-            del self.memories[session_id]
-        if session_id in self.last_intents:
-            del self.last_intents[session_id]
+        """Xóa toàn bộ state của session (memory, intent cuối, câu hỏi cuối), kể cả trong store"""
+        self.evict_local(session_id)
+        if self.session_store is not None:
+            self.session_store.delete(self._store_key(session_id))
+
+    def get_messages(self, session_id: str) -> List[ChatMessage]:
+        """Trả về danh sách message trong session (không tạo memory cho session chưa có)"""
+        self._sync_from_store(session_id)
+        window = self.memories.get(session_id)
+        return window.messages() if window is not None else []
 
-    def get_messages(self, session_id: str) -> List[BaseMessage]:
-        """Trả về danh sách message trong session"""
-        memory = self.get_memory(session_id)
-        return memory.chat_memory.messages  
+    def get_message_count(self, session_id: str) -> int:
+        self._sync_from_store(session_id)
+        window = self.memories.get(session_id)
+        return window.message_count if window is not None else 0
+
+    def get_last_assistant_message(self, session_id: str) -> str:
+        """Tin nhắn assistant gần nhất, O(1)"""
+        self._sync_from_store(session_id)
+        window = self.memories.get(session_id)
+        return window.last_assistant_message if window is not None else ""
 
     def get_last_intent(self, session_id: str) -> str:
-        return self.last_intents.get(session_id, "general")
-    
+        self._sync_from_store(session_id)
+        window = self.memories.get(session_id)
+        return (window.last_intent if window is not None else None) or "general"
+
     def get_last_question(self, session_id: str) -> str:
         """Lấy câu hỏi cuối cùng của user"""
-        return self.last_questions.get(session_id, "")
+        self._sync_from_store(session_id)
+        window = self.memories.get(session_id)
+        return (window.last_question if window is not None else None) or ""
@@ -0,0 +1,188 @@
+# ai_core/model_router.py
+"""
+Định tuyến model Gemini theo điểm gọi (call site):
+  nlu.intent / nlu.entity / nlu.joint  → tier "fast"     (prompt JSON ngắn, cần nhanh + rẻ)
+  answer.<intent>                      → tier "standard" (câu trả lời RAG, giữ model trả lời hiện tại)
+Mỗi tier có model, temperature, max_output_tokens và timeout (tổng thời gian 1 lời gọi, gồm retry) riêng;
+các tier dùng chung cache / gateway / breaker của process.
+Cấu hình:
+  LLM_TIER_<TIER>_MODEL / _TEMPERATURE / _MAX_TOKENS / _TIMEOUT   (vd: LLM_TIER_FAST_MODEL=gemini-1.5-flash-8b)
+  LLM_ROUTE_<SITE>=<tier>   (site viết hoa, '.' → '_', vd: LLM_ROUTE_ANSWER_SAFETY_ADVICE=strong)
+Số liệu theo tier (số lời gọi, lỗi, độ trễ p50/p95, token vào / ra) ở get_stats() → /health "llm_tiers".
+"""
+import os
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from ai_core.llm_chain import GeminiLLM
+
+# tier → (model, temperature, max_output_tokens, timeout giây)
+TIER_DEFAULTS: Dict[str, tuple] = {
+    "fast": ("gemini-1.5-flash-8b", 0.0, 256, 10.0),
+    "standard": ("gemini-1.5-flash", 0.2, 2048, 30.0),
+    "strong": ("gemini-1.5-pro", 0.2, 4096, 45.0),
+}
+
+# call site → tier; site không có trong bảng thì thử tiền tố ("answer.safety_advice" → "answer")
+ROUTE_DEFAULTS: Dict[str, str] = {
+    "nlu.intent": "fast",
+    "nlu.entity": "fast",
+    "nlu.joint": "fast",
+    "answer": "standard",
+}
+
+DEFAULT_TIER = "standard"
+
+
+def _percentile(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class TierMetrics:
+    """Độ trễ + token của mọi lời gọi Gemini trong 1 tier (GeminiLLM gọi record_call / record_tokens)"""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._latencies: "deque[float]" = deque(maxlen=window)
+        self.stats = {"calls": 0, "errors": 0, "prompt_tokens": 0, "output_tokens": 0, "responses_with_usage": 0}
+
+    def record_call(self, latency: float, failed: bool):
+        with self._lock:
+            self.stats["calls"] += 1
+            if failed:
+                self.stats["errors"] += 1
+            else:
+                self._latencies.append(latency)
+
+    def record_tokens(self, prompt_tokens: int, output_tokens: int):
+        with self._lock:
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["output_tokens"] += output_tokens
+            self.stats["responses_with_usage"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            latencies = list(self._latencies)
+        with_usage = stats["responses_with_usage"]
+        stats.update(
+            latency_ms_p50=round(_percentile(latencies, 0.5) * 1000, 1),
+            latency_ms_p95=round(_percentile(latencies, 0.95) * 1000, 1),
+            avg_prompt_tokens=round(stats["prompt_tokens"] / with_usage, 1) if with_usage else 0.0,
+            avg_output_tokens=round(stats["output_tokens"] / with_usage, 1) if with_usage else 0.0,
+        )
+        return stats
+
+
+class ModelTier:
+    def __init__(self, name: str, model: str, temperature: float, max_output_tokens: Optional[int],
+                 timeout: Optional[float]):
+        self.name = name
+        self.model = model
+        self.temperature = temperature
+        self.max_output_tokens = max_output_tokens
+        self.timeout = timeout
+        self.metrics = TierMetrics()
+
+    @classmethod
+    def from_env(cls, name: str) -> "ModelTier":
+        model, temperature, max_tokens, timeout = TIER_DEFAULTS.get(name, TIER_DEFAULTS[DEFAULT_TIER])
+        prefix = f"LLM_TIER_{name.upper()}_"
+        return cls(
+            name,
+            model=os.getenv(prefix + "MODEL", model),
+            temperature=float(os.getenv(prefix + "TEMPERATURE", temperature)),
+            max_output_tokens=int(os.getenv(prefix + "MAX_TOKENS", max_tokens)) or None,
+            timeout=float(os.getenv(prefix + "TIMEOUT", timeout)) or None,
+        )
+
+
+class ModelRouter:
+    def __init__(self, routes: Optional[Dict[str, str]] = None, tiers: Optional[Dict[str, ModelTier]] = None,
+                 cache=None, gateway=None, breaker=None):
+        """
+        routes / tiers: None → đọc từ env (mặc định ROUTE_DEFAULTS / TIER_DEFAULTS)
+        cache / gateway / breaker: None → GeminiLLM tự lấy bản dùng chung của process
+        """
+        self.routes = dict(routes) if routes is not None else self._routes_from_env()
+        self.tiers: Dict[str, ModelTier] = dict(tiers) if tiers is not None else {}
+        self._shared = {"cache": cache, "gateway": gateway, "breaker": breaker}
+        self._llms: Dict[str, GeminiLLM] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _routes_from_env() -> Dict[str, str]:
+        routes = dict(ROUTE_DEFAULTS)
+        prefix = "LLM_ROUTE_"
+        for key, value in os.environ.items():
+            if key.startswith(prefix) and value:
+                routes[key[len(prefix):].lower().replace("_", ".", 1)] = value.lower()
+        return routes
+
+    def tier_for(self, site: str) -> str:
+        """'answer.safety_advice' → route riêng nếu có, không thì route của 'answer', không thì DEFAULT_TIER"""
+        while site:
+            if site in self.routes:
+                return self.routes[site]
+            site = site.rpartition(".")[0]
+        return DEFAULT_TIER
+
+    def get_tier(self, name: str) -> ModelTier:
+        tier = self.tiers.get(name)
+        if tier is None:
+            with self._lock:
+                tier = self.tiers.setdefault(name, ModelTier.from_env(name))
+        return tier
+
+    def llm_for_tier(self, name: str) -> GeminiLLM:
+        llm = self._llms.get(name)
+        if llm is not None:
+            return llm
+        tier = self.get_tier(name)
+        with self._lock:
+            if name not in self._llms:
+                self._llms[name] = GeminiLLM(
+                    model=tier.model, temperature=tier.temperature,
+                    max_output_tokens=tier.max_output_tokens, timeout=tier.timeout,
+                    metrics=tier.metrics, **self._shared,
+                )
+            return self._llms[name]
+
+    def llm_for(self, site: str) -> GeminiLLM:
+        """GeminiLLM của tier ứng với call site (vd: "nlu.joint", "answer.definition")"""
+        return self.llm_for_tier(self.tier_for(site))
+
+    def routed_llms(self) -> List[GeminiLLM]:
+        """GeminiLLM của mọi tier có route trỏ tới (+ tier mặc định) — để warm-up client lúc khởi động"""
+        names = sorted(set(self.routes.values()) | {DEFAULT_TIER})
+        return [self.llm_for_tier(name) for name in names]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tiers = dict(self.tiers)
+        return {
+            "routes": dict(self.routes),
+            "tiers": {
+                name: {"model": tier.model, "temperature": tier.temperature,
+                       "max_output_tokens": tier.max_output_tokens, "timeout": tier.timeout,
+                       **tier.metrics.get_stats()}
+                for name, tier in tiers.items()
+            },
+        }
+
+
+_default_router: Optional[ModelRouter] = None
+_default_router_lock = threading.Lock()
+
+
+def get_default_router() -> ModelRouter:
+    """Router dùng chung của process (LLMChainManager, app)"""
+    global _default_router
+    with _default_router_lock:
+        if _default_router is None:
+            _default_router = ModelRouter()
+        return _default_router
@@ -1,47 +1,30 @@
 # ai_core/nlu_processor.py
-import json
-import re
 import logging
-import unicodedata
-from typing import Dict, Any
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from langchain_core.output_parsers import BaseOutputParser
-
+import os
+import threading
+from typing import Dict, Any, List, Optional
 from .llm_chain import GeminiLLM  # Wrapper LLM tuỳ chỉnh
+from .prompt_runtime import JSONOutputParser, PromptChain, PromptTemplate
+from utils.deadline import deadline_scope
+from utils.executors import run_in
 
 # ========================
 # Logging setup
 # ========================
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
 
 
 # ========================
 # Output Parser
 # ========================
-class NLUOutputParser(BaseOutputParser):
-    """Parser an toàn cho output từ LLM (JSON -> Dict)"""
+class NLUOutputParser(JSONOutputParser):
+    """Parser an toàn cho output từ LLM (JSON -> Dict), parse đúng 1 lần"""
 
     def parse(self, text: str) -> Dict[str, Any]:
-        try:
-            logger.debug(f"🔹 Raw LLM output: {text}")
-            # Tìm JSON trong text
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
-            if json_match:
-                parsed = json.loads(json_match.group())
-                logger.debug(f"✅ Parsed JSON: {parsed}")
-                return parsed
-            else:
-                logger.warning("⚠️ Không tìm thấy JSON trong output")
-                return {}
-        except Exception as e:
-            logger.error(f"❌ Parse lỗi: {e}")
-            return {}
-
-    def get_format_instructions(self) -> str:
-        """Hướng dẫn format JSON cho LLM (có thể dùng trong prompt)."""
-        return "Trả lời dưới dạng JSON hợp lệ."
+        logger.debug("🔹 Raw LLM output: %s", text)
+        parsed = super().parse(text)
+        logger.debug("✅ Parsed JSON: %s", parsed)
+        return parsed
 
 # ========================
 # Context Memory (simple)
@@ -64,55 +47,44 @@ class ContextMemory:
         }
     
 # ========================
-# Helpers (NEW)
+# Helpers & keyword lists → ai_core/intent_rules.py
 # ========================
-def _strip_accents(s: str) -> str:
-    """Bỏ dấu tiếng Việt để so khớp keyword dễ hơn."""
-    if not isinstance(s, str):
-        return ""
-    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
-
-def _contains_any(haystack: str, needles) -> bool:
-    return any(n in haystack for n in needles)
-
-# Các từ gợi ý câu hỏi KHÔNG phải hotline (để không ép về hotline)
-QUESTION_TRIGGERS = [
-    "ở đâu", "o dau", "là gì", "la gi", "giới thiệu", "gioi thieu",
-    "thông tin", "thong tin", "bao nhiêu", "bao nhieu", "vì sao", "vi sao", "?"
-]
-
-# Từ khoá hotline
-HOTLINE_KEYWORDS = [
-    "hotline", "số điện thoại", "so dien thoai", "điện thoại", "dien thoai",
-    "đường dây nóng", "duong day nong", "gọi", "goi", "liên hệ", "lien he"
-]
-
-# Danh sách địa danh phổ biến (có cả có dấu & không dấu, để match nhanh)
-LOCATION_TOKENS = [
-    "quảng bình","quang binh","qb",
-    "quảng trị","quang tri","qt",
-    "thừa thiên huế","thua thien hue","huế","hue","tth",
-    "đà nẵng","da nang","dn",
-    "quảng nam","quang nam","qn",
-    "nghệ an","nghe an","na",
-    "hà tĩnh","ha tinh","ht",
-    "thanh hóa","thanh hoa","th",
-    # có thể bổ sung thêm...
-]
+from .intent_rules import (  # noqa: E402 (giữ tên cũ cho code import từ module này)
+    _strip_accents, _contains_any, QUESTION_TRIGGERS, HOTLINE_KEYWORDS, LOCATION_TOKENS,
+    IntentRuleEngine, find_locations,
+)
+
+# Phần deadline còn lại NLU được dùng cho lời gọi LLM (phần còn lại dành cho retrieval + generation)
+NLU_DEADLINE_SHARE = float(os.getenv("NLU_DEADLINE_SHARE", 0.4))
+
 # ========================
 # NLU Processor
 # ========================
 class NLUProcessor:
-    def __init__(self, llm=None, memory_manager=None):
+    def __init__(self, llm=None, memory_manager=None, rule_engine: IntentRuleEngine = None,
+                 intent_classifier=None, router=None):
         """
         llm: object LLM, nếu None sẽ tự khởi tạo GeminiLLM mặc định
+        router: ModelRouter (ai_core.model_router) → chain NLU dùng LLM của tier ứng với
+                nlu.intent / nlu.entity / nlu.joint thay cho llm
         memory_manager: để truy cập last_intent, last_question, chat_history
+        rule_engine: bộ luật chạy TRƯỚC LLM, đủ chắc chắn thì bỏ qua LLM
+        intent_classifier: EmbeddingIntentClassifier (kNN cục bộ), chạy sau rule, trước LLM
         """
-        self.llm = llm or GeminiLLM()
+        self.llm = llm or (router.llm_for("nlu.joint") if router is not None else GeminiLLM())
+        self.router = router
         self.memory_manager = memory_manager
         self.memory = ContextMemory()  # ✅ thêm bộ nhớ ngữ cảnh
+        self.rule_engine = rule_engine or IntentRuleEngine()
+        self.intent_classifier = intent_classifier
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "rule_fast_path": 0, "knn": 0, "llm": 0, "degraded": 0}
         self.setup_intent_detection()
         self.setup_entity_extraction()
+        self.setup_joint_nlu()
+
+    def _llm_for(self, site: str):
+        return self.router.llm_for(site) if self.router is not None else self.llm
 
     # ----------------------------
     # Intent Detection
@@ -148,8 +120,8 @@ class NLUProcessor:
             input_variables=["question", "language"],
         )
 
-        self.intent_chain = LLMChain(
-            llm=self.llm,
+        self.intent_chain = PromptChain(
+            llm=self._llm_for("nlu.intent"),
             prompt=self.intent_prompt,
             output_parser=NLUOutputParser(),
             output_key="answer"
@@ -184,13 +156,64 @@ class NLUProcessor:
             input_variables=["question", "language"],
         )
 
-        self.entity_chain = LLMChain(
-            llm=self.llm,
+        self.entity_chain = PromptChain(
+            llm=self._llm_for("nlu.entity"),
             prompt=self.entity_prompt,
             output_parser=NLUOutputParser(),
             output_key="answer"
         )
 
+    # ----------------------------
+    # Joint NLU (intent + entities trong 1 lần gọi LLM)
+    # ----------------------------
+    def setup_joint_nlu(self):
+        nlu_template = """
+        Phân tích câu hỏi sau: xác định ý định (intent) của người dùng và trích xuất thực thể (entities).
+        Các intent có thể là:
+        - definition: hỏi về định nghĩa, khái niệm
+        - safety_advice: hỏi về hướng dẫn an toàn
+        - location_info: hỏi về thông tin địa điểm (ví dụ: "Quảng Trị có gì đặc biệt?")
+        - report_uxo: báo cáo vật nổ
+        - ask_hotline: hỏi số hotline (ví dụ: "số điện thoại Quảng Trị", "hotline ở đâu?")
+        - general: câu hỏi chung khác
+
+        PHÂN BIỆT QUAN TRỌNG:
+        - "Quảng Trị" → location_info (nếu chỉ là tên địa điểm không ngữ cảnh)
+        - "số điện thoại Quảng Trị" → ask_hotline
+        - "hotline Quảng Trị" → ask_hotline
+
+        Các loại thực thể cần trích xuất:
+        - location: địa điểm, tỉnh thành
+        - uxo_type: loại vật nổ (bom, mìn, lựu đạn, etc.)
+        - action: hành động
+
+        Câu hỏi: {question}
+        Ngôn ngữ: {language}
+
+        Trả lời dưới dạng JSON với cấu trúc:
+        {{
+            "intent": "tên_intent",
+            "confidence": số_thập_phân_từ_0_đến_1,
+            "entities": {{
+                "location": [],
+                "uxo_type": [],
+                "action": []
+            }}
+        }}
+        """
+
+        self.nlu_prompt = PromptTemplate(
+            template=nlu_template,
+            input_variables=["question", "language"],
+        )
+
+        self.nlu_chain = PromptChain(
+            llm=self._llm_for("nlu.joint"),
+            prompt=self.nlu_prompt,
+            output_parser=NLUOutputParser(),
+            output_key="answer"
+        )
+
     # ----------------------------
     # API: Detect Intent
     # ----------------------------
@@ -200,120 +223,241 @@ class NLUProcessor:
         if not self.memory_manager:
             return ""
         try:
-            msgs = self.memory_manager.get_messages(session_id)
-            for m in reversed(msgs):
-                # Trong memory_manager của bạn, msg.type == "human"/"ai"
-                if hasattr(m, "type") and m.type != "human":
-                    return getattr(m, "content", "") or ""
+            return self.memory_manager.get_last_assistant_message(session_id)
         except Exception as e:
             logger.debug(f"⚠️ Không lấy được last assistant message: {e}")
         return ""
 
+    def _get_session_context(self, session_id: str) -> Dict[str, Any]:
+        """last_intent / last_question / bot có đang chờ địa danh hotline không"""
+        context = {"last_intent": "", "last_question": "", "awaiting_hotline_location": False}
+        if self.memory_manager:
+            context["last_intent"] = self.memory_manager.get_last_intent(session_id)
+            context["last_question"] = self.memory_manager.get_last_question(session_id)
+
+            # Nhận diện xem bot có đang hỏi người dùng "hotline ở khu vực nào?" không
+            last_bot = self._get_last_assistant_message(session_id)
+            last_bot_lc = _strip_accents((last_bot or "").lower())
+            if "hotline o khu vuc nao" in last_bot_lc or "ban muon hoi so hotline" in last_bot_lc:
+                context["awaiting_hotline_location"] = True
+        return context
+
+    def _record(self, source: str):
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats[source] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Thống kê tần suất fast path (rule) so với gọi LLM"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        total = stats["requests"]
+        stats["fast_path_ratio"] = round(stats["rule_fast_path"] / total, 4) if total else 0.0
+        stats["llm_avoided_ratio"] = round((total - stats["llm"]) / total, 4) if total else 0.0
+        return stats
+
+    def _try_fast_path(self, question: str, context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Chạy rule engine trước; luật đủ chắc chắn → bỏ qua LLM hoàn toàn"""
+        matched = self.rule_engine.match(
+            question,
+            last_intent=context["last_intent"],
+            awaiting_hotline_location=context["awaiting_hotline_location"],
+        )
+        if matched is None:
+            return None
+        self._record("rule_fast_path")
+        logger.debug(f"⚡ Rule fast path: {matched['rule']} → {matched['intent']}")
+        return {**matched, "source": "rules"}
+
+    def _try_local_classifier(self, question: str) -> Optional[Dict[str, Any]]:
+        """kNN embedding cục bộ; chỉ nhận khi margin vượt ngưỡng, ngược lại để LLM quyết định"""
+        if self.intent_classifier is None:
+            return None
+        try:
+            result = self.intent_classifier.classify(question)
+        except Exception as e:
+            logger.warning(f"⚠️ Intent classifier lỗi, fallback LLM: {e}")
+            return None
+        if not self.intent_classifier.is_confident(result):
+            return None
+        self._record("knn")
+        logger.debug(f"⚡ kNN intent: {result['intent']} (margin={result['margin']:.2f})")
+        return {
+            "intent": result["intent"],
+            "confidence": result["confidence"],
+            "entities": {"location": find_locations(question), "uxo_type": [], "action": []},
+            "source": "knn",
+        }
+
+    async def _atry_local_classifier(self, question: str) -> Optional[Dict[str, Any]]:
+        if self.intent_classifier is None:
+            return None
+        # Forward pass embedding tốn CPU → không chạy trên event loop
+        return await run_in("cpu", self._try_local_classifier, question)
+
+    def _refine_intent(self, parsed: Dict[str, Any], question: str, session_id: str,
+                       context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Áp heuristic ngữ cảnh (follow-up hotline, câu cực ngắn) lên kết quả intent của LLM."""
+        intent = parsed.get("intent")
+        intent = intent.strip() if isinstance(intent, str) and intent.strip() else "unknown"
+        confidence = self._coerce_confidence(parsed.get("confidence"))
+        enriched_text = None
+
+        # 🔹 Context-based refinement (STRICT)
+        context = context or self._get_session_context(session_id)
+        last_intent = context["last_intent"]
+        last_question = context["last_question"]
+        awaiting_hotline_location = context["awaiting_hotline_location"]
+
+        # Chuẩn hoá text để so khớp
+        t_lc = question.strip().lower()
+        t_ascii = _strip_accents(t_lc)
+        words = t_ascii.split()
+        is_short = len(words) <= 4
+
+        has_question_word = _contains_any(t_lc, QUESTION_TRIGGERS) or _contains_any(t_ascii, QUESTION_TRIGGERS)
+        has_hotline_kw = _contains_any(t_lc, HOTLINE_KEYWORDS) or _contains_any(t_ascii, HOTLINE_KEYWORDS)
+        has_location = any(tok in t_lc or tok in t_ascii for tok in LOCATION_TOKENS)
+
+        # 🎯 QUY TẮC MỚI (fix bug bạn gặp):
+        # Chỉ ép về ask_hotline khi:
+        #  - ĐANG CHỜ địa danh cho hotline (bot vừa hỏi khu vực) HOẶC last_intent là ask_hotline
+        #  - Câu rất ngắn & CHỈ là địa danh (không có từ nghi vấn/miêu tả)
+        #  - Không chứa từ khoá hotline (vì khi đó intent đã là ask_hotline tự nhiên)
+        if (
+            has_location
+            and is_short
+            and not has_question_word
+            and not has_hotline_kw
+            and (awaiting_hotline_location or last_intent == "ask_hotline")
+        ):
+            logger.debug("⚡ Follow-up hotline hợp lệ: ép intent = ask_hotline")
+            intent = "ask_hotline"
+            enriched_text = f"{last_question} {question}" if last_question else f"hotline {question}"
+        else:
+            # Nếu câu hỏi có từ nghi vấn như 'ở đâu', 'là gì'... thì KHÔNG ép hotline
+            logger.debug("ℹ️ Không ép intent về hotline (giữ theo LLM hoặc suy luận thường).")
+
+        # Trường hợp câu cực ngắn (<=2 từ) → enrich text để RAG hiểu hơn
+        if not enriched_text and last_question and len(words) <= 2:
+            enriched_text = f"{last_question} {question}"
+            logger.debug(f"🧩 Enriched text (câu cực ngắn): {enriched_text}")
+
+        return {
+            "intent": intent,
+            "confidence": confidence,
+            "last_intent": last_intent,
+            "last_question": last_question,
+            "awaiting_hotline_location": awaiting_hotline_location,
+            "enriched_text": enriched_text
+        }
+
+    @staticmethod
+    def _coerce_confidence(value: Any) -> float:
+        """LLM có thể trả null / chuỗi / số ngoài [0, 1] → 0.0 thay vì làm hỏng cả request"""
+        try:
+            confidence = float(value)
+        except (TypeError, ValueError):
+            return 0.0
+        return min(max(confidence, 0.0), 1.0) if confidence == confidence else 0.0
+
+    @staticmethod
+    def _unknown_intent() -> Dict[str, Any]:
+        return {
+            "intent": "unknown",
+            "confidence": 0.0,
+            "last_intent": "",
+            "last_question": "",
+            "awaiting_hotline_location": False,
+            "enriched_text": None
+        }
+
+    @staticmethod
+    def _empty_entities() -> Dict[str, Any]:
+        return {"entities": {"location": [], "uxo_type": [], "action": []}}
+
+    def _degraded(self, question: str, context: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+        """LLM lỗi / breaker mở / hết deadline → intent theo từ khoá thay vì 'unknown'"""
+        logger.warning(f"⚠️ NLU degraded (LLM không khả dụng: {type(error).__name__}: {error})")
+        self._record("degraded")
+        guessed = self.rule_engine.guess(
+            question,
+            last_intent=context["last_intent"],
+            awaiting_hotline_location=context["awaiting_hotline_location"],
+        )
+        return {**guessed, "source": "degraded"}
+
     def detect_intent(self, question: str, language: str = "vi", session_id: str = "default") -> Dict[str, Any]:
         try:
-            raw = self.intent_chain.invoke({"question": question, "language": language})
-            output_text = raw["answer"] if isinstance(raw, dict) and "answer" in raw else raw
-            if isinstance(output_text, dict):
-                output_text = json.dumps(output_text, ensure_ascii=False)
-            parsed = self.intent_chain.output_parser.parse(output_text)
-
-            intent = parsed.get("intent", "unknown")
-            confidence = float(parsed.get("confidence", 0.0))
-            enriched_text = None
-
-            # 🔹 Context-based refinement (STRICT)
-            last_intent, last_question = "", ""
-            awaiting_hotline_location = False
-
-            if self.memory_manager:
-                last_intent = self.memory_manager.get_last_intent(session_id)
-                last_question = self.memory_manager.get_last_question(session_id)
-
-                # Nhận diện xem bot có đang hỏi người dùng "hotline ở khu vực nào?" không
-                last_bot = self._get_last_assistant_message(session_id)
-                last_bot_lc = _strip_accents((last_bot or "").lower())
-                if "hotline o khu vuc nao" in last_bot_lc or "ban muon hoi so hotline" in last_bot_lc:
-                    awaiting_hotline_location = True
-
-            # Chuẩn hoá text để so khớp
-            t_lc = question.strip().lower()
-            t_ascii = _strip_accents(t_lc)
-            words = t_ascii.split()
-            is_short = len(words) <= 4
-
-            has_question_word = _contains_any(t_lc, QUESTION_TRIGGERS) or _contains_any(t_ascii, QUESTION_TRIGGERS)
-            has_hotline_kw = _contains_any(t_lc, HOTLINE_KEYWORDS) or _contains_any(t_ascii, HOTLINE_KEYWORDS)
-            has_location = any(tok in t_lc or tok in t_ascii for tok in LOCATION_TOKENS)
-
-            # 🎯 QUY TẮC MỚI (fix bug bạn gặp):
-            # Chỉ ép về ask_hotline khi:
-            #  - ĐANG CHỜ địa danh cho hotline (bot vừa hỏi khu vực) HOẶC last_intent là ask_hotline
-            #  - Câu rất ngắn & CHỈ là địa danh (không có từ nghi vấn/miêu tả)
-            #  - Không chứa từ khoá hotline (vì khi đó intent đã là ask_hotline tự nhiên)
-            if (
-                has_location
-                and is_short
-                and not has_question_word
-                and not has_hotline_kw
-                and (awaiting_hotline_location or last_intent == "ask_hotline")
-            ):
-                logger.debug("⚡ Follow-up hotline hợp lệ: ép intent = ask_hotline")
-                intent = "ask_hotline"
-                enriched_text = f"{last_question} {question}" if last_question else f"hotline {question}"
-            else:
-                # Nếu câu hỏi có từ nghi vấn như 'ở đâu', 'là gì'... thì KHÔNG ép hotline
-                logger.debug("ℹ️ Không ép intent về hotline (giữ theo LLM hoặc suy luận thường).")
-
-            # Trường hợp câu cực ngắn (<=2 từ) → enrich text để RAG hiểu hơn
-            if not enriched_text and last_question and len(words) <= 2:
-                enriched_text = f"{last_question} {question}"
-                logger.debug(f"🧩 Enriched text (câu cực ngắn): {enriched_text}")
-
-            return {
-                "intent": intent,
-                "confidence": confidence,
-                "last_intent": last_intent,
-                "last_question": last_question,
-                "awaiting_hotline_location": awaiting_hotline_location,
-                "enriched_text": enriched_text
-            }
+            context = self._get_session_context(session_id)
+            parsed = self._try_fast_path(question, context) or self._try_local_classifier(question)
+            if parsed is None:
+                try:
+                    with deadline_scope(fraction=NLU_DEADLINE_SHARE):
+                        parsed = self.intent_chain.run({"question": question, "language": language})
+                    self._record("llm")
+                except Exception as e:
+                    parsed = self._degraded(question, context, e)
+            return self._refine_intent(parsed, question, session_id, context)
+        except Exception as e:
+            logger.error(f"❌ Intent detection lỗi: {e}")
+            return self._unknown_intent()
 
+    async def adetect_intent(self, question: str, language: str = "vi", session_id: str = "default") -> Dict[str, Any]:
+        try:
+            context = self._get_session_context(session_id)
+            parsed = self._try_fast_path(question, context) or await self._atry_local_classifier(question)
+            if parsed is None:
+                try:
+                    with deadline_scope(fraction=NLU_DEADLINE_SHARE):
+                        parsed = await self.intent_chain.arun({"question": question, "language": language})
+                    self._record("llm")
+                except Exception as e:
+                    parsed = self._degraded(question, context, e)
+            return self._refine_intent(parsed, question, session_id, context)
         except Exception as e:
             logger.error(f"❌ Intent detection lỗi: {e}")
-            return {
-                "intent": "unknown",
-                "confidence": 0.0,
-                "last_intent": "",
-                "last_question": "",
-                "awaiting_hotline_location": False,
-                "enriched_text": None
-            }
+            return self._unknown_intent()
+
     # ----------------------------
     # API: Extract Entities
     # ----------------------------
     def extract_entities(self, question: str, language: str = "vi") -> Dict[str, Any]:
         try:
-            result = self.entity_chain.invoke({"question": question, "language": language})
-            output_text = result["answer"] if isinstance(result, dict) and "answer" in result else result
-            if isinstance(output_text, dict):
-                output_text = json.dumps(output_text, ensure_ascii=False)
-            parsed = self.entity_chain.output_parser.parse(output_text)
-            return {
-                "entities": parsed.get(
-                    "entities", {"location": [], "uxo_type": [], "action": []}
-                )
-            }
+            parsed = self.entity_chain.run({"question": question, "language": language})
+            return {"entities": parsed.get("entities", self._empty_entities()["entities"])}
+        except Exception as e:
+            logger.error(f"❌ Entity extraction lỗi: {e}")
+            return self._empty_entities()
+
+    async def aextract_entities(self, question: str, language: str = "vi") -> Dict[str, Any]:
+        try:
+            parsed = await self.entity_chain.arun({"question": question, "language": language})
+            return {"entities": parsed.get("entities", self._empty_entities()["entities"])}
         except Exception as e:
             logger.error(f"❌ Entity extraction lỗi: {e}")
-            return {"entities": {"location": [], "uxo_type": [], "action": []}}
+            return self._empty_entities()
+
     # ----------------------------
     # API: Full NLU Pipeline
     # ----------------------------
-    def process_nlu(self, question: str, language: str = "vi", session_id: str = "default") -> Dict[str, Any]:
-        intent_result = self.detect_intent(question, language, session_id)
-        entity_result = self.extract_entities(question, language)
-
-        merged = {
+    @staticmethod
+    def _normalize_entity_values(value: Any) -> List[str]:
+        """"Quảng Trị" → ["Quảng Trị"] (list("Quảng Trị") sẽ tách thành từng ký tự); bỏ phần tử không phải chuỗi"""
+        if isinstance(value, str):
+            value = [value]
+        elif not isinstance(value, (list, tuple)):
+            return []
+        return [item.strip() for item in value if isinstance(item, str) and item.strip()]
+
+    @classmethod
+    def _normalize_entities(cls, entities: Any) -> Dict[str, List[str]]:
+        entities = entities if isinstance(entities, dict) else {}
+        return {key: cls._normalize_entity_values(entities.get(key)) for key in ("location", "uxo_type", "action")}
+
+    @staticmethod
+    def _merge_results(intent_result: Dict[str, Any], entity_result: Dict[str, Any]) -> Dict[str, Any]:
+        return {
             "intent": intent_result["intent"],
             "confidence": intent_result["confidence"],
             "entities": entity_result["entities"],
@@ -322,5 +466,52 @@ class NLUProcessor:
             "awaiting_hotline_location": intent_result.get("awaiting_hotline_location", False),
             "enriched_text": intent_result.get("enriched_text")
         }
-        logger.debug(f"✅ Final NLU output: {merged}")
+
+    def _build_nlu_result(self, parsed: Dict[str, Any], question: str, session_id: str,
+                          context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        if not isinstance(parsed, dict):
+            raise ValueError(f"NLU output không phải JSON object: {type(parsed).__name__}")
+        intent_result = self._refine_intent(parsed, question, session_id, context)
+        entity_result = {"entities": self._normalize_entities(parsed.get("entities"))}
+        merged = self._merge_results(intent_result, entity_result)
+        source = parsed.get("source", "llm")
+        raw_intent = parsed.get("intent")
+        if source == "llm" and merged.get("intent") != (raw_intent.strip() if isinstance(raw_intent, str) else raw_intent):
+            # Heuristic ngữ cảnh đã đổi nhãn của LLM (vd: follow-up hotline) → không phải nhãn LLM thuần
+            source = "llm_refined"
+        merged["source"] = source
+        logger.debug("✅ Final NLU output: %s", merged)
         return merged
+
+    def _safe_build_nlu_result(self, parsed: Dict[str, Any], question: str, session_id: str,
+                               context: Dict[str, Any]) -> Dict[str, Any]:
+        """JSON LLM sai dạng → intent theo từ khoá (rule_engine.guess) thay vì lỗi 500"""
+        try:
+            return self._build_nlu_result(parsed, question, session_id, context)
+        except Exception as e:
+            return self._build_nlu_result(self._degraded(question, context, e), question, session_id, context)
+
+    def process_nlu(self, question: str, language: str = "vi", session_id: str = "default") -> Dict[str, Any]:
+        """Rule → kNN cục bộ → (nếu chưa chắc chắn) intent + entities trong MỘT lần gọi LLM"""
+        context = self._get_session_context(session_id)
+        parsed = self._try_fast_path(question, context) or self._try_local_classifier(question)
+        if parsed is None:
+            try:
+                with deadline_scope(fraction=NLU_DEADLINE_SHARE):
+                    parsed = self.nlu_chain.run({"question": question, "language": language})
+                self._record("llm")
+            except Exception as e:
+                parsed = self._degraded(question, context, e)
+        return self._safe_build_nlu_result(parsed, question, session_id, context)
+
+    async def aprocess_nlu(self, question: str, language: str = "vi", session_id: str = "default") -> Dict[str, Any]:
+        context = self._get_session_context(session_id)
+        parsed = self._try_fast_path(question, context) or await self._atry_local_classifier(question)
+        if parsed is None:
+            try:
+                with deadline_scope(fraction=NLU_DEADLINE_SHARE):
+                    parsed = await self.nlu_chain.arun({"question": question, "language": language})
+                self._record("llm")
+            except Exception as e:
+                parsed = self._degraded(question, context, e)
+        return self._safe_build_nlu_result(parsed, question, session_id, context)
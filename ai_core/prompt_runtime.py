@@ -0,0 +1,114 @@
+# ai_core/prompt_runtime.py
+"""
+Chain runtime gọn thay LLMChain / PromptTemplate của LangChain trên đường nóng (NLU, RAG prompt):
+  - PromptTemplate: template tách sẵn thành đoạn literal / tên biến 1 lần lúc khởi tạo,
+    format() chỉ còn ghép chuỗi (cú pháp giống str.format, {{ }} là ngoặc thật)
+  - PromptChain: format prompt → gọi thẳng llm.invoke / llm.ainvoke (GeminiLLM) → parse đúng 1 lần
+  - extract_json: lấy object JSON đầu tiên trong output LLM (bỏ qua ```json, lời dẫn) bằng raw_decode
+Không import LangChain → import nhanh, không có callback manager / validate pydantic mỗi lời gọi.
+"""
+import json
+import logging
+from string import Formatter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from utils.executors import run_in
+
+logger = logging.getLogger(__name__)
+
+_decoder = json.JSONDecoder()
+
+
+class PromptTemplate:
+    """Thay langchain.prompts.PromptTemplate (cùng tham số template / input_variables, cùng format(**kwargs))"""
+
+    def __init__(self, template: str, input_variables: Optional[Sequence[str]] = None):
+        self.template = template
+        parts: List[Tuple[str, Optional[str]]] = []
+        variables: List[str] = []
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if field is not None and (spec or conversion or not field.isidentifier()):
+                raise ValueError(f"❌ Template chỉ hỗ trợ biến dạng {{name}}, gặp: {{{field}}}")
+            parts.append((literal, field))
+            if field is not None and field not in variables:
+                variables.append(field)
+        self._parts = tuple(parts)
+        self.input_variables = list(input_variables) if input_variables is not None else variables
+        missing = set(variables) - set(self.input_variables)
+        if missing:
+            raise ValueError(f"❌ Template dùng biến không khai báo: {sorted(missing)}")
+
+    def format(self, **kwargs: Any) -> str:
+        try:
+            return "".join(
+                literal if field is None else f"{literal}{kwargs[field]}" for literal, field in self._parts
+            )
+        except KeyError as e:
+            raise KeyError(f"Thiếu biến prompt: {e.args[0]}") from None
+
+
+def extract_json(text: str) -> Optional[Any]:
+    """
+    Object JSON đầu tiên parse được trong text (None nếu không có).
+    raw_decode dừng ở cuối object → không bị dính '}' của phần chữ phía sau như regex \\{.*\\}.
+    """
+    if not text:
+        return None
+    start = text.find("{")
+    while start != -1:
+        try:
+            value, _ = _decoder.raw_decode(text, start)
+            return value
+        except ValueError:
+            start = text.find("{", start + 1)
+    return None
+
+
+class JSONOutputParser:
+    """Output LLM → dict; không có JSON hợp lệ → {}"""
+
+    def parse(self, text: str) -> Dict[str, Any]:
+        parsed = extract_json(text)
+        if isinstance(parsed, dict):
+            return parsed
+        logger.warning("⚠️ Không tìm thấy JSON trong output")
+        return {}
+
+    def get_format_instructions(self) -> str:
+        """Hướng dẫn format JSON cho LLM (có thể dùng trong prompt)."""
+        return "Trả lời dưới dạng JSON hợp lệ."
+
+
+class PromptChain:
+    """
+    Thay LLMChain: invoke / ainvoke trả {**inputs, output_key: kết quả} như LLMChain,
+    run / arun trả thẳng kết quả (đã qua output_parser nếu có).
+    llm: object có invoke(prompt: str) (GeminiLLM); có ainvoke thì bản async dùng ainvoke,
+    không thì chạy invoke trong pool "llm".
+    """
+
+    def __init__(self, llm, prompt: PromptTemplate, output_parser=None, output_key: str = "answer"):
+        self.llm = llm
+        self.prompt = prompt
+        self.output_parser = output_parser
+        self.output_key = output_key
+
+    def _parse(self, text: str) -> Any:
+        return self.output_parser.parse(text) if self.output_parser is not None else text
+
+    def run(self, inputs: Dict[str, Any]) -> Any:
+        return self._parse(self.llm.invoke(self.prompt.format(**inputs)))
+
+    async def arun(self, inputs: Dict[str, Any]) -> Any:
+        prompt = self.prompt.format(**inputs)
+        if hasattr(self.llm, "ainvoke"):
+            text = await self.llm.ainvoke(prompt)
+        else:
+            text = await run_in("llm", self.llm.invoke, prompt)
+        return self._parse(text)
+
+    def invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        return {**inputs, self.output_key: self.run(inputs)}
+
+    async def ainvoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        return {**inputs, self.output_key: await self.arun(inputs)}
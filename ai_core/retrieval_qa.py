@@ -1,18 +1,109 @@
-from langchain.prompts import PromptTemplate
-from typing import Dict, Any, List
+from ai_core.prompt_runtime import PromptTemplate
+from typing import AsyncIterator, Callable, Dict, Any, List, Optional, Sequence, Tuple
 from data_layer.hotline_manager import HotlineManager
 from ai_core.nlu_processor import NLUProcessor
 from ai_core.memory_manager import UXOMemoryManager
-import traceback
+from ai_core.semantic_cache import SemanticAnswerCache
+from ai_core.context_builder import ContextBuilder
+from ai_core.llm_gateway import LLMOverloadedError
+from utils.circuit_breaker import CircuitOpenError
+from utils.deadline import DeadlineExceeded, remaining, run_with_deadline, set_deadline
+from utils.executors import run_in
+from utils.timeline import RequestTimeline, current_timeline, timeline_span
+import asyncio
+import logging
+import numpy as np
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculativeRetrieval:
+    """
+    Retrieval khởi động ngay khi request tới, chạy song song với NLU.
+    Chỉ dùng khi nhánh RAG truy vấn đúng câu hỏi đã đoán; hotline / cache hit / câu được enrich → bỏ.
+    """
+
+    speculative = True
+
+    def __init__(self, query: str, task: "asyncio.Task"):
+        self.query = query
+        self.task = task
+        self.used = False
+
+    def matches(self, query: str) -> bool:
+        return query == self.query
+
+    async def docs(self) -> Optional[List[Any]]:
+        """Kết quả retrieval đoán trước; lỗi → None để caller retrieve lại bình thường"""
+        try:
+            docs = await self.task
+        except Exception as e:
+            logger.warning(f"⚠️ Speculative retrieval lỗi, retrieve lại: {e}")
+            return None
+        self.used = True
+        timeline = current_timeline()
+        if timeline is not None:
+            timeline.note("retrieval_overlap_saved_ms", round(timeline.overlap_ms("nlu", "retrieval"), 1))
+        return docs
+
+    def discard(self):
+        if not self.task.done():
+            self.task.cancel()
+        elif not self.task.cancelled():
+            self.task.exception()   # tránh cảnh báo "Task exception was never retrieved"
+
+
+class SharedRetrieval(SpeculativeRetrieval):
+    """Search dùng chung cho các câu hỏi trùng trong 1 batch (không tính vào prefetch_stats)"""
+
+    speculative = False
+
+    def __init__(self, query: str, task: "asyncio.Task"):
+        # shield: 1 câu hết deadline / bỏ qua retrieval không huỷ search của các câu khác
+        super().__init__(query, asyncio.shield(task))
+
 
 class UXORetrievalQA:
-    def __init__(self, llm, vector_store):
+    NO_DOCS_ANSWER = "❌ Tôi không tìm thấy thông tin liên quan trong dữ liệu. Bạn có muốn hỏi lại chi tiết hơn không?"
+    RAG_ERROR_ANSWER = "Xin lỗi, tôi gặp sự cố khi tìm thông tin. Vui lòng thử lại sau."
+    DEGRADED_NOTICE = "⚠️ Hệ thống AI đang quá tải, dưới đây là thông tin trích trực tiếp từ tài liệu:"
+    # Chunk cuối khi stream lỗi sau chunk đầu tiên: câu trả lời dở dang → không cache, không lưu memory
+    STREAM_TRUNCATED_NOTICE = "\n\n⚠️ Câu trả lời bị gián đoạn do sự cố kỹ thuật, vui lòng hỏi lại."
+    SAFETY_HINT = ("⚠️ Nếu phát hiện vật nghi là bom mìn: KHÔNG chạm vào, đánh dấu khu vực "
+                   "và gọi ngay hotline cơ quan quân sự địa phương.")
+    # LLM không dùng được (breaker mở, hết deadline, gateway đầy) → trả lời degraded thay vì lỗi
+    DEGRADE_ERRORS = (CircuitOpenError, DeadlineExceeded, LLMOverloadedError)
+    DEGRADED_SUMMARY_TOKENS = 150
+    # Còn ít hơn chừng này giây → không kịp sinh câu trả lời, degraded luôn
+    MIN_GENERATION_SECONDS = 0.5
+
+    # Batch: câu hỏi độc lập, không đọc / ghi lịch sử → dùng chung 1 session id rỗng
+    BATCH_SESSION_ID = "__batch__"
+
+    def __init__(self, llm, vector_store, nlu_processor: Optional[NLUProcessor] = None,
+                 answer_cache: Optional[SemanticAnswerCache] = None,
+                 context_builder: Optional[ContextBuilder] = None,
+                 embed_queries: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 router=None):
         self.llm = llm
+        # ModelRouter: câu trả lời theo intent dùng LLM của tier "answer.<intent>" (None → luôn dùng llm)
+        self.router = router
         self.vector_store = vector_store
+        self.answer_cache = answer_cache
+        # Không truyền → vẫn dedup + cắt theo ngân sách, chỉ không xếp hạng câu bằng embedding
+        self.context_builder = context_builder or ContextBuilder()
+        self.prefetch_stats = {"started": 0, "used": 0, "discarded": 0}
+        self.degraded_stats = {"answers": 0, "retrieval_timeouts": 0}
+        # Embedding nhiều câu hỏi trong 1 lần forward cho abatch_answer (None → retrieve từng câu)
+        self.embed_queries = embed_queries
+        self.batch_concurrency = int(os.getenv("ASK_BATCH_CONCURRENCY", 8))
+        self.batch_stats = {"batches": 0, "questions": 0, "searches": 0, "embedded_texts": 0}
         self.hotline_manager = HotlineManager()
         self.memory_manager = UXOMemoryManager()
-        # ✅ Nối memory_manager với NLU
-        self.nlu_processor = NLUProcessor(llm, memory_manager=self.memory_manager)
+        # ✅ Nối memory_manager với NLU (dùng chung 1 NLUProcessor với API nếu được truyền vào)
+        self.nlu_processor = nlu_processor or NLUProcessor(llm, memory_manager=self.memory_manager, router=router)
+        self.nlu_processor.memory_manager = self.memory_manager
         self.setup_qa_chains()
     
     def setup_qa_chains(self):
@@ -89,61 +180,283 @@ class UXORetrievalQA:
         self.retriever = self.vector_store.as_retriever()
 
     # ================= AI-PROMPT SELECTION =================
+    def _is_awaiting_hotline(self, session_id: str) -> bool:
+        """Bot vừa hỏi người dùng khu vực hotline?"""
+        # Lấy tin nhắn cuối của assistant
+        last_assistant_msg = self.memory_manager.get_last_assistant_message(session_id)
+
+        last_assistant_lc = (last_assistant_msg or "").lower()
+        return (
+            "bạn muốn hỏi số hotline" in last_assistant_lc
+            or "số hotline ở khu vực nào" in last_assistant_lc
+        )
+
+    def _route_request(self, question: str, intent: str, session_id: str,
+                       enriched_text: str = None) -> Tuple[str, str, str]:
+        """
+        Quyết định nhánh xử lý cho câu hỏi.
+        Trả về (route, query, saved_intent) với route ∈ {"hotline", "rag"}.
+        """
+        last_intent = self.memory_manager.get_last_intent(session_id)
+        last_question = self.memory_manager.get_last_question(session_id)
+        effective_query = enriched_text if enriched_text else question
+
+        logger.debug("🧠 CONTEXT AWARE: last_intent=%r, current_intent=%r, question=%r, effective_query=%r",
+                     last_intent, intent, question, effective_query)
+
+        # ✅ Case 1: user hỏi trực tiếp
+        if intent == "ask_hotline" or self._is_hotline_question(effective_query):
+            logger.debug("🔍 Hotline request (direct)")
+            return "hotline", effective_query, "ask_hotline"
+
+        # ✅ Case 2: user trả lời theo ngữ cảnh (bot vừa hỏi tỉnh)
+        if last_intent == "ask_hotline" or self._is_awaiting_hotline(session_id):
+            logger.debug("⚡ Hotline follow-up (context aware)")
+            return "hotline", f"{last_question} {question}", "ask_hotline"
+
+        # ✅ Các intent khác → dùng RAG
+        logger.debug("🔍 Processing with RAG for non-hotline intent")
+        return "rag", effective_query, intent or "general"
+
+    # ================= SEMANTIC ANSWER CACHE =================
+    def _is_cacheable(self, question: str, query: str, route: str, session_id: str) -> bool:
+        """Chỉ cache câu hỏi RAG độc lập: không được NLU enrich theo ngữ cảnh, session chưa có lịch sử
+        (prompt RAG kèm lịch sử chat → câu trả lời phụ thuộc cả lịch sử, không dùng chung được)"""
+        if self.answer_cache is None or route != "rag" or query != question:
+            return False
+        return not self.memory_manager.get_message_count(session_id)
+
+    @staticmethod
+    def _cache_locations(entities: Optional[Dict[str, Any]]) -> List[str]:
+        """Địa danh NLU trích được → 1 phần khoá bucket của semantic cache"""
+        return (entities or {}).get("location") or []
+
+    def _cache_answer(self, question: str, language: str, intent: str, response: str,
+                      locations: Optional[List[str]] = None):
+        # Không cache câu trả lời lỗi / degraded (kể cả stream bị lỗi giữa chừng)
+        if (response and response != self.NO_DOCS_ANSWER and self.RAG_ERROR_ANSWER not in response
+                and self.DEGRADED_NOTICE not in response):
+            self.answer_cache.store(question, language, intent, response, locations)
+
     def get_response(self, question: str, intent: str, session_id: str = "default",
-                 language: str = "vi", enriched_text: str = None) -> str:
+                 language: str = "vi", enriched_text: str = None,
+                 entities: Optional[Dict[str, Any]] = None) -> str:
         try:
-            chat_history = self.memory_manager.get_chat_history(session_id)
-            last_intent = self.memory_manager.get_last_intent(session_id)
-            last_question = self.memory_manager.get_last_question(session_id)
-            effective_query = enriched_text if enriched_text else question
+            chat_history = self.memory_manager.get_turns(session_id)
+            route, query, saved_intent = self._route_request(question, intent, session_id, enriched_text)
 
-            print(f"🧠 CONTEXT AWARE: last_intent='{last_intent}', current_intent='{intent}', "
-                f"question='{question}', effective_query='{effective_query}'")
-
-            # Lấy tin nhắn cuối của assistant
-            last_assistant_msg = ""
-            try:
-                msgs = self.memory_manager.get_messages(session_id)
-                for m in reversed(msgs):
-                    if getattr(m, "type", "") != "human":
-                        last_assistant_msg = getattr(m, "content", "")
-                        break
-            except Exception:
-                pass
-
-            last_assistant_lc = (last_assistant_msg or "").lower()
-            awaiting_hotline = (
-                "bạn muốn hỏi số hotline" in last_assistant_lc
-                or "số hotline ở khu vực nào" in last_assistant_lc
-            )
-
-            # ✅ Case 1: user hỏi trực tiếp
-            if intent == "ask_hotline" or self._is_hotline_question(effective_query):
-                print("🔍 Hotline request (direct)")
-                response = self.process_hotline_request(effective_query, language, session_id)
-                self.memory_manager.save_context(session_id, question, response, "ask_hotline")
-                return response
-
-            # ✅ Case 2: user trả lời theo ngữ cảnh (bot vừa hỏi tỉnh)
-            if last_intent == "ask_hotline" or awaiting_hotline:
-                print("⚡ Hotline follow-up (context aware)")
-                full_query = f"{last_question} {question}"
-                response = self.process_hotline_request(full_query, language, session_id)
-                self.memory_manager.save_context(session_id, question, response, "ask_hotline")
-                return response
-
-            # ✅ Các intent khác → dùng RAG
-            print("🔍 Processing with RAG for non-hotline intent")
-            response = self._process_rag_intent(effective_query, intent, session_id, language, chat_history)
-            effective_intent = intent or "general"
-            self.memory_manager.save_context(session_id, question, response, effective_intent)
+            if route == "hotline":
+                response = self.process_hotline_request(query, language, session_id, entities)
+            else:
+                cacheable = self._is_cacheable(question, query, route, session_id)
+                locations = self._cache_locations(entities)
+                response = self.answer_cache.lookup(question, language, saved_intent, locations) if cacheable else None
+                if response is None:
+                    response = self._process_rag_intent(query, intent, session_id, language, chat_history)
+                    if cacheable:
+                        self._cache_answer(question, language, saved_intent, response, locations)
+            self.memory_manager.save_context(session_id, question, response, saved_intent)
             return response
 
         except Exception as e:
-            print(f"❌ Lỗi khi xử lý QA: {str(e)}")
+            logger.exception(f"❌ Lỗi khi xử lý QA: {e}")
             self.memory_manager.save_context(session_id, question, "Lỗi hệ thống", "error")
             return "Xin lỗi, tôi gặp sự cố kỹ thuật. Vui lòng thử lại sau."
 
+    # ================= SPECULATIVE RETRIEVAL =================
+    def start_speculative_retrieval(self, question: str) -> SpeculativeRetrieval:
+        """Gọi trước NLU (trong event loop): retrieval cho câu hỏi gốc chạy song song với NLU"""
+        self.prefetch_stats["started"] += 1
+        return SpeculativeRetrieval(question, asyncio.create_task(self.aretrieve(question)))
+
+    def _finish_prefetch(self, prefetched: Optional[SpeculativeRetrieval]):
+        if prefetched is None:
+            return
+        prefetched.discard()
+        if prefetched.speculative:
+            self.prefetch_stats["used" if prefetched.used else "discarded"] += 1
+
+    def is_stateless(self, session_id: str) -> bool:
+        """Session chưa có lịch sử → câu trả lời chỉ phụ thuộc (câu hỏi, ngôn ngữ)"""
+        return not self.memory_manager.get_message_count(session_id)
+
+    async def aget_response(self, question: str, intent: str, session_id: str = "default",
+                            language: str = "vi", enriched_text: str = None,
+                            entities: Optional[Dict[str, Any]] = None,
+                            prefetched: Optional[SpeculativeRetrieval] = None) -> str:
+        """
+        Bản async của get_response: LLM và retriever được await, không chặn event loop.
+        prefetched: retrieval đã chạy song song với NLU (xem start_speculative_retrieval).
+        """
+        response, memory_answer, saved_intent = await self.aanswer(
+            question, intent, session_id, language, enriched_text, entities, prefetched
+        )
+        await run_in("db", self.memory_manager.save_context, session_id, question, memory_answer, saved_intent)
+        return response
+
+    async def aanswer(self, question: str, intent: str, session_id: str = "default",
+                      language: str = "vi", enriched_text: str = None,
+                      entities: Optional[Dict[str, Any]] = None,
+                      prefetched: Optional[SpeculativeRetrieval] = None) -> Tuple[str, str, str]:
+        """
+        Sinh câu trả lời nhưng KHÔNG ghi memory (để nhiều session dùng chung 1 kết quả).
+        Trả (câu trả lời, nội dung lưu memory, intent lưu memory).
+        """
+        try:
+            chat_history = self.memory_manager.get_turns(session_id)
+            route, query, saved_intent = self._route_request(question, intent, session_id, enriched_text)
+
+            if route == "hotline":
+                response = await self.aprocess_hotline_request(query, language, session_id, entities)
+            else:
+                cacheable = self._is_cacheable(question, query, route, session_id)
+                locations = self._cache_locations(entities)
+                response = None
+                if cacheable:
+                    # Encode câu hỏi là CPU-bound → không chạy trên event loop
+                    response = await run_in("cpu", self.answer_cache.lookup, question, language, saved_intent,
+                                            locations)
+                if response is None:
+                    usable = prefetched if prefetched is not None and prefetched.matches(query) else None
+                    response = await self._aprocess_rag_intent(query, intent, session_id, language, chat_history,
+                                                               prefetched=usable)
+                    if cacheable:
+                        await run_in("cpu", self._cache_answer, question, language, saved_intent, response,
+                                     locations)
+            return response, response, saved_intent
+
+        except Exception as e:
+            logger.exception(f"❌ Lỗi khi xử lý QA: {e}")
+            return "Xin lỗi, tôi gặp sự cố kỹ thuật. Vui lòng thử lại sau.", "Lỗi hệ thống", "error"
+        finally:
+            self._finish_prefetch(prefetched)
+
+    async def astream_response(self, question: str, intent: str, session_id: str = "default",
+                               language: str = "vi", enriched_text: str = None,
+                               entities: Optional[Dict[str, Any]] = None,
+                               prefetched: Optional[SpeculativeRetrieval] = None) -> AsyncIterator[str]:
+        """
+        Stream câu trả lời theo từng đoạn text.
+        Câu trả lời đầy đủ chỉ được lưu vào memory khi stream kết thúc
+        (client ngắt giữa chừng / LLM lỗi giữa chừng → không lưu, không cache).
+        """
+        chunks: List[str] = []
+        try:
+            chat_history = self.memory_manager.get_turns(session_id)
+            route, query, saved_intent = self._route_request(question, intent, session_id, enriched_text)
+
+            cacheable = self._is_cacheable(question, query, route, session_id)
+            locations = self._cache_locations(entities)
+            cached = None
+            if cacheable:
+                cached = await run_in("cpu", self.answer_cache.lookup, question, language, saved_intent, locations)
+
+            if route == "hotline":
+                response = await self.aprocess_hotline_request(query, language, session_id, entities)
+                chunks.append(response)
+                yield response
+            elif cached is not None:
+                chunks.append(cached)
+                yield cached
+            else:
+                usable = prefetched if prefetched is not None and prefetched.matches(query) else None
+                async for chunk in self._astream_rag_intent(query, intent, language, chat_history, prefetched=usable):
+                    chunks.append(chunk)
+                    yield chunk
+                if chunks and chunks[-1] == self.STREAM_TRUNCATED_NOTICE:
+                    return
+                if cacheable:
+                    await run_in("cpu", self._cache_answer, question, language, saved_intent,
+                                 "".join(chunks).strip(), locations)
+            await run_in("db", self.memory_manager.save_context,
+                         session_id, question, "".join(chunks).strip(), saved_intent)
+
+        except Exception as e:
+            logger.exception(f"❌ Lỗi khi stream QA: {e}")
+            await run_in("db", self.memory_manager.save_context, session_id, question, "Lỗi hệ thống", "error")
+            yield "Xin lỗi, tôi gặp sự cố kỹ thuật. Vui lòng thử lại sau."
+        finally:
+            self._finish_prefetch(prefetched)
+
+    # ================= BATCH (stateless) =================
+    async def _abatch_search(self, questions: List[str]) -> Dict[str, "asyncio.Task"]:
+        """1 task search cho mỗi câu hỏi khác nhau; embedding cả lô trong 1 lần forward"""
+        unique = list(dict.fromkeys(questions))
+        search_by_vector = getattr(self.vector_store, "similarity_search_by_vector", None)
+        self.batch_stats["searches"] += len(unique)
+        if self.embed_queries is None or search_by_vector is None:
+            return {q: asyncio.create_task(self.aretrieve(q)) for q in unique}
+
+        # Câu hỏi gốc (NLU kNN, semantic cache) + truy vấn RAG chung 1 lần forward
+        rag_queries = [self._build_rag_query(q) for q in unique]
+        texts = list(dict.fromkeys(unique + rag_queries))
+        vectors = await run_in("cpu", self.embed_queries, texts)
+        self.batch_stats["embedded_texts"] += len(texts)
+        row = {text: i for i, text in enumerate(texts)}
+        # MiniLM đã chuẩn hoá L2 sẵn → vector chuẩn hoá cho cùng kết quả search như retriever
+        k = getattr(self.retriever, "search_kwargs", {}).get("k", 4)
+        return {
+            q: asyncio.create_task(run_in("cpu", search_by_vector, vectors[row[rq]].tolist(), k=k))
+            for q, rq in zip(unique, rag_queries)
+        }
+
+    async def abatch_answer(self, items: List[Dict[str, Any]], concurrency: Optional[int] = None,
+                            deadline_seconds: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Trả lời nhiều câu hỏi độc lập (không đọc / ghi memory), yield kết quả theo thứ tự xong trước:
+          1. embedding mọi câu hỏi + truy vấn RAG trong 1 lần forward
+          2. câu hỏi trùng nhau chỉ search vector 1 lần (search bắt đầu ngay, song song với NLU)
+          3. NLU + sinh câu trả lời tối đa `concurrency` câu cùng lúc, mỗi câu có deadline riêng
+        items: [{"question", "language"?, "id"?}] → {"index", "id", "question", "answer", "nlu", "timings"}
+        """
+        self.batch_stats["batches"] += 1
+        self.batch_stats["questions"] += len(items)
+        # Session batch không có lịch sử: nạp 1 lần (qua pool db) để NLU / định tuyến không đọc store trên event loop
+        await self.memory_manager.aload_session(self.BATCH_SESSION_ID)
+        searches = await self._abatch_search([item["question"] for item in items])
+        semaphore = asyncio.Semaphore(max(1, concurrency or self.batch_concurrency))
+
+        async def answer_one(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+            question, language = item["question"], item.get("language") or "vi"
+            result = {"index": index, "id": item.get("id"), "question": question}
+            async with semaphore:
+                # Mỗi task có context riêng → timeline / deadline không lẫn giữa các câu
+                timeline = RequestTimeline()
+                timeline.activate()
+                if deadline_seconds:
+                    set_deadline(deadline_seconds)
+                try:
+                    with timeline_span("nlu"):
+                        nlu_result = await self.nlu_processor.aprocess_nlu(question, language, self.BATCH_SESSION_ID)
+                    answer, _, _ = await self.aanswer(
+                        question=question,
+                        intent=nlu_result["intent"],
+                        session_id=self.BATCH_SESSION_ID,
+                        language=language,
+                        enriched_text=nlu_result.get("enriched_text"),
+                        entities=nlu_result["entities"],
+                        prefetched=SharedRetrieval(question, searches[question])
+                    )
+                    result.update(answer=answer, nlu=nlu_result)
+                except Exception as e:
+                    logger.exception(f"❌ Lỗi batch câu {index}: {e}")
+                    result["error"] = str(e)
+                result["timings"] = timeline.as_dict()
+                return result
+
+        tasks = [asyncio.create_task(answer_one(i, item)) for i, item in enumerate(items)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            # Client ngắt giữa chừng → huỷ phần còn lại
+            for task in [*tasks, *searches.values()]:
+                if not task.done():
+                    task.cancel()
+            for search in searches.values():
+                if search.done() and not search.cancelled():
+                    search.exception()
+
     def _is_hotline_follow_up(self, question: str) -> bool:
         question_lower = question.lower().strip()
         hotline_keywords = ["hotline", "số điện thoại", "liên hệ", "số máy", "điện thoại", "phone", "gọi"]
@@ -166,43 +479,159 @@ class UXORetrievalQA:
         hotline_keywords = ["hotline", "số điện thoại", "liên hệ", "số máy", "điện thoại", "phone", "gọi", "đường dây nóng"]
         return any(keyword in question_lower for keyword in hotline_keywords)
 
-    def _process_rag_intent(self, question: str, intent: str, session_id: str, language: str, chat_history: str) -> str:
+    @staticmethod
+    def _build_rag_query(question: str) -> str:
+        # ✅ enrich cho câu hỏi "ở đâu"
+        return f"Địa điểm: {question}" if "ở đâu" in question.lower() else question
+
+    def _answer_llm(self, intent: str):
+        if self.router is None:
+            return self.llm
+        return self.router.llm_for(f"answer.{intent or 'general'}")
+
+    def _format_rag_prompt(self, docs, question: str, intent: str, language: str,
+                           chat_history: Sequence[Tuple[str, str]]) -> str:
+        # Bỏ overlap giữa các chunk, chọn câu liên quan nhất trong ngân sách token của intent
+        context, chat_history = self.context_builder.build(question, docs, intent, chat_history)
+
+        prompt_mapping = {
+            "definition": self.definition_prompt,
+            "safety_advice": self.safety_prompt,
+            "location_info": self.location_prompt,
+            "report_uxo": self.safety_prompt,
+            "general": self.definition_prompt
+        }
+        effective_intent = intent or "general"
+        prompt = prompt_mapping.get(effective_intent, self.definition_prompt)
+
+        return prompt.format(
+            context=context,
+            question=question,
+            language=language,
+            chat_history=chat_history
+        )
+
+    # ================= DEGRADED MODE =================
+    def _degraded_answer(self, question: str, docs: List[Any], reason: Exception) -> str:
+        """Không gọi LLM: câu liên quan nhất của chunk top-1 + hotline (nếu câu hỏi có địa danh)"""
+        logger.warning(f"⚠️ Degraded answer ({type(reason).__name__}: {reason})")
+        self.degraded_stats["answers"] += 1
+        parts = []
+        extract = self.context_builder.extract(question, docs[:1], self.DEGRADED_SUMMARY_TOKENS) if docs else ""
+        if extract:
+            parts.extend([self.DEGRADED_NOTICE, extract])
+        locations = self.extract_location_manual(question)
+        hotline = self._format_hotline_answer(question, locations) if locations else ""
+        parts.append(hotline if hotline.startswith("📞") else self.SAFETY_HINT)
+        return "\n\n".join(parts)
+
+    def _check_generation_time(self):
+        left = remaining()
+        if left is not None and left < self.MIN_GENERATION_SECONDS:
+            raise DeadlineExceeded(f"Còn {max(left, 0):.2f}s, không đủ để sinh câu trả lời")
+
+    def _process_rag_intent(self, question: str, intent: str, session_id: str, language: str,
+                            chat_history: Sequence[Tuple[str, str]]) -> str:
         try:
-            # ✅ enrich cho câu hỏi "ở đâu"
-            enriched_query = f"Địa điểm: {question}" if "ở đâu" in question.lower() else question
-            docs = self.retriever.get_relevant_documents(enriched_query)
+            docs = self.retriever.get_relevant_documents(self._build_rag_query(question))
             if not docs:
-                return "❌ Tôi không tìm thấy thông tin liên quan trong dữ liệu. Bạn có muốn hỏi lại chi tiết hơn không?"
-            context = "\n".join([doc.page_content for doc in docs])
-
-            prompt_mapping = {
-                "definition": self.definition_prompt,
-                "safety_advice": self.safety_prompt,
-                "location_info": self.location_prompt,
-                "report_uxo": self.safety_prompt,
-                "general": self.definition_prompt
-            }
-            effective_intent = intent or "general"
-            prompt = prompt_mapping.get(effective_intent, self.definition_prompt)
-
-            formatted_prompt = prompt.format(
-                context=context,
-                question=question,
-                language=language,
-                chat_history=chat_history
-            )
-
-            # ✅ Fix invoke → fallback predict
-            if hasattr(self.llm, "invoke"):
-                response = self.llm.invoke(formatted_prompt).strip()
-            else:
-                response = self.llm.predict(formatted_prompt).strip()
+                return self.NO_DOCS_ANSWER
+            formatted_prompt = self._format_rag_prompt(docs, question, intent, language, chat_history)
+
+            try:
+                self._check_generation_time()
+                # ✅ Fix invoke → fallback predict
+                llm = self._answer_llm(intent)
+                if hasattr(llm, "invoke"):
+                    response = llm.invoke(formatted_prompt).strip()
+                else:
+                    response = llm.predict(formatted_prompt).strip()
+            except self.DEGRADE_ERRORS as e:
+                return self._degraded_answer(question, docs, e)
             return response
 
         except Exception as e:
-            print(f"❌ Lỗi khi xử lý RAG: {str(e)}")
-            print(traceback.format_exc())
-            return "Xin lỗi, tôi gặp sự cố khi tìm thông tin. Vui lòng thử lại sau."
+            logger.exception(f"❌ Lỗi khi xử lý RAG: {e}")
+            return self.RAG_ERROR_ANSWER
+
+    async def aretrieve(self, query: str) -> List[Any]:
+        """Truy vấn retriever bất đồng bộ (Chroma không có API async → chạy trong pool cpu)"""
+        with timeline_span("retrieval"):
+            return await run_in("cpu", self.retriever.get_relevant_documents, self._build_rag_query(query))
+
+    async def _aget_docs(self, question: str, prefetched: Optional[SpeculativeRetrieval]) -> List[Any]:
+        """Retrieval trong deadline của request; quá hạn → [] (caller trả lời degraded)"""
+        try:
+            docs = await run_with_deadline(prefetched.docs(), "retrieval") if prefetched is not None else None
+            if docs is None:
+                docs = await run_with_deadline(self.aretrieve(question), "retrieval")
+        except DeadlineExceeded:
+            self.degraded_stats["retrieval_timeouts"] += 1
+            raise
+        return docs
+
+    async def _aprocess_rag_intent(self, question: str, intent: str, session_id: str, language: str,
+                                   chat_history: Sequence[Tuple[str, str]],
+                                   prefetched: Optional[SpeculativeRetrieval] = None) -> str:
+        docs: List[Any] = []
+        try:
+            docs = await self._aget_docs(question, prefetched)
+            if not docs:
+                return self.NO_DOCS_ANSWER
+            with timeline_span("context"):
+                formatted_prompt = await run_in(
+                    "cpu", self._format_rag_prompt, docs, question, intent, language, chat_history)
+
+            self._check_generation_time()
+            llm = self._answer_llm(intent)
+            with timeline_span("generation"):
+                if hasattr(llm, "ainvoke"):
+                    response = (await llm.ainvoke(formatted_prompt)).strip()
+                else:
+                    response = (await run_with_deadline(
+                        run_in("llm", llm.invoke, formatted_prompt), "generation")).strip()
+            return response
+
+        except self.DEGRADE_ERRORS as e:
+            return await run_in("cpu", self._degraded_answer, question, docs, e)
+
+        except Exception as e:
+            logger.exception(f"❌ Lỗi khi xử lý RAG: {e}")
+            return self.RAG_ERROR_ANSWER
+
+    async def _astream_rag_intent(self, question: str, intent: str, language: str,
+                                  chat_history: Sequence[Tuple[str, str]],
+                                  prefetched: Optional[SpeculativeRetrieval] = None) -> AsyncIterator[str]:
+        docs: List[Any] = []
+        started = False
+        try:
+            docs = await self._aget_docs(question, prefetched)
+            if not docs:
+                yield self.NO_DOCS_ANSWER
+                return
+            with timeline_span("context"):
+                formatted_prompt = await run_in(
+                    "cpu", self._format_rag_prompt, docs, question, intent, language, chat_history)
+
+            # Deadline chỉ giới hạn tới lúc mở stream; đã có chunk đầu tiên thì stream tiếp cho hết
+            self._check_generation_time()
+            llm = self._answer_llm(intent)
+            if hasattr(llm, "astream"):
+                async for chunk in llm.astream(formatted_prompt):
+                    started = True
+                    yield chunk
+            else:
+                yield (await llm.ainvoke(formatted_prompt)).strip()
+
+        except self.DEGRADE_ERRORS as e:
+            if started:
+                logger.warning(f"⚠️ Stream RAG bị gián đoạn giữa chừng: {e!r}")
+                yield self.STREAM_TRUNCATED_NOTICE
+            else:
+                yield await run_in("cpu", self._degraded_answer, question, docs, e)
+        except Exception as e:
+            logger.exception(f"❌ Lỗi khi stream RAG: {e}")
+            yield self.STREAM_TRUNCATED_NOTICE if started else self.RAG_ERROR_ANSWER
 
     def extract_location_manual(self, question: str) -> List[str]:
         question_lower = question.lower()
@@ -219,24 +648,39 @@ class UXORetrievalQA:
         }
         return [loc for key, loc in location_mapping.items() if key in question_lower]
 
-    def process_hotline_request(self, question: str, language: str, session_id: str = "default") -> str:
-        print(f"🔍 Processing hotline request: '{question}'")
+    def _format_hotline_answer(self, question: str, locations: List[str]) -> str:
+        if not locations:
+            locations = self.extract_location_manual(question)
+
+        for location in locations:
+            hotline = self.hotline_manager.get_hotline(location)
+            if hotline and "Xin lỗi" not in hotline and "không có" not in hotline.lower():
+                return f"📞 Số hotline xử lý bom mìn tại {location.replace('_', ' ').title()} là: {hotline}"
+
+        if not locations:
+            return ("❓ Bạn muốn hỏi số hotline ở khu vực nào? "
+                    "(Ví dụ: Quảng Bình, Quảng Trị, Huế, Đà Nẵng, Quảng Nam, Nghệ An)")
+        return f"❌ Xin lỗi, tôi không có thông tin hotline cho khu vực {locations[0]}."
+
+    def process_hotline_request(self, question: str, language: str, session_id: str = "default",
+                                entities: Optional[Dict[str, Any]] = None) -> str:
+        """entities: kết quả NLU đã có sẵn → không gọi LLM trích xuất lại"""
+        logger.debug("🔍 Processing hotline request: %r", question)
+        try:
+            if entities is None:
+                entities = self.nlu_processor.extract_entities(question, language)["entities"]
+            return self._format_hotline_answer(question, entities.get("location", []))
+        except Exception as e:
+            logger.exception(f"❌ Lỗi khi xử lý hotline: {e}")
+            return "Xin lỗi, tôi gặp sự cố khi tìm số hotline. Vui lòng thử lại sau."
+
+    async def aprocess_hotline_request(self, question: str, language: str, session_id: str = "default",
+                                       entities: Optional[Dict[str, Any]] = None) -> str:
+        logger.debug("🔍 Processing hotline request: %r", question)
         try:
-            nlu_result = self.nlu_processor.extract_entities(question, language)
-            locations = nlu_result["entities"].get("location", [])
-            if not locations:
-                locations = self.extract_location_manual(question)
-
-            for location in locations:
-                hotline = self.hotline_manager.get_hotline(location)
-                if hotline and "Xin lỗi" not in hotline and "không có" not in hotline.lower():
-                    return f"📞 Số hotline xử lý bom mìn tại {location.replace('_', ' ').title()} là: {hotline}"
-
-            if not locations:
-                return ("❓ Bạn muốn hỏi số hotline ở khu vực nào? "
-                        "(Ví dụ: Quảng Bình, Quảng Trị, Huế, Đà Nẵng, Quảng Nam, Nghệ An)")
-            return f"❌ Xin lỗi, tôi không có thông tin hotline cho khu vực {locations[0]}."
+            if entities is None:
+                entities = (await self.nlu_processor.aextract_entities(question, language))["entities"]
+            return self._format_hotline_answer(question, entities.get("location", []))
         except Exception as e:
-            print(f"❌ Lỗi khi xử lý hotline: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception(f"❌ Lỗi khi xử lý hotline: {e}")
             return "Xin lỗi, tôi gặp sự cố khi tìm số hotline. Vui lòng thử lại sau."
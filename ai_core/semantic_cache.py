@@ -0,0 +1,178 @@
+# ai_core/semantic_cache.py
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BucketKey = Tuple[str, str, Tuple[str, ...]]   # (language, intent, địa danh)
+
+
+class _CacheEntry:
+    __slots__ = ("key", "bucket", "question", "vector", "answer", "created_at")
+
+    def __init__(self, key: int, bucket: BucketKey, question: str,
+                 vector: np.ndarray, answer: str, created_at: float):
+        self.key = key
+        self.bucket = bucket
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+        self.created_at = created_at
+
+
+class SemanticAnswerCache:
+    """
+    Cache câu trả lời RAG theo (language, intent, địa danh NLU trích được, embedding câu hỏi).
+    Hit khi cosine với một câu đã trả lời ≥ similarity_threshold (cùng language + intent + địa danh:
+    "bom ở Quảng Trị" và "bom ở Quảng Bình" gần nhau về embedding nhưng câu trả lời khác).
+    TTL + LRU + giới hạn số entry; tự xoá toàn bộ khi index vector store thay đổi.
+    """
+
+    def __init__(self, embed_query: Callable[[str], np.ndarray],
+                 similarity_threshold: Optional[float] = None,
+                 ttl_seconds: Optional[float] = None,
+                 max_entries: Optional[int] = None,
+                 index_version: Optional[Callable[[], Hashable]] = None,
+                 version_check_interval: float = 5.0):
+        self.embed_query = embed_query
+        self.similarity_threshold = (
+            similarity_threshold if similarity_threshold is not None
+            else float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+        )
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("SEMANTIC_CACHE_TTL", 3600))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("SEMANTIC_CACHE_SIZE", 1000))
+        self.index_version = index_version
+        self.version_check_interval = version_check_interval
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()   # thứ tự LRU
+        self._buckets: Dict[BucketKey, Dict[int, _CacheEntry]] = {}
+        self._matrices: Dict[BucketKey, Tuple[List[int], np.ndarray]] = {}   # build lại khi bucket đổi
+        self._next_key = 0
+        self._version: Hashable = None
+        self._version_checked_at = 0.0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+
+    # ================= Invalidation =================
+    def invalidate(self, reason: str = "manual"):
+        with self._lock:
+            self._clear_locked()
+            self.stats["invalidations"] += 1
+        logger.info(f"🧹 Semantic cache cleared ({reason})")
+
+    def _clear_locked(self):
+        self._entries.clear()
+        self._buckets.clear()
+        self._matrices.clear()
+
+    def _check_index_version(self):
+        """Index vector store đổi (re-index, import, xoá...) → cache cũ không còn đúng"""
+        if self.index_version is None:
+            return
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+        try:
+            version = self.index_version()
+        except Exception as e:
+            logger.warning(f"⚠️ Không đọc được index version: {e}")
+            return
+        if self._version is not None and version != self._version:
+            self.invalidate(reason=f"index version {self._version} → {version}")
+        self._version = version
+
+    # ================= Internal helpers (gọi khi đã giữ lock) =================
+    def _remove_locked(self, entry: _CacheEntry):
+        self._entries.pop(entry.key, None)
+        bucket = self._buckets.get(entry.bucket)
+        if bucket is not None:
+            bucket.pop(entry.key, None)
+            if not bucket:
+                del self._buckets[entry.bucket]
+        self._matrices.pop(entry.bucket, None)
+
+    def _bucket_matrix_locked(self, bucket_key: BucketKey) -> Tuple[List[int], np.ndarray]:
+        cached = self._matrices.get(bucket_key)
+        if cached is None:
+            bucket = self._buckets[bucket_key]
+            keys = list(bucket.keys())
+            cached = (keys, np.stack([bucket[k].vector for k in keys]))
+            self._matrices[bucket_key] = cached
+        return cached
+
+    @staticmethod
+    def _bucket_key(language: str, intent: str, locations: Optional[Iterable[str]]) -> BucketKey:
+        places = sorted({loc.strip().lower() for loc in locations or () if isinstance(loc, str) and loc.strip()})
+        return language or "vi", intent or "general", tuple(places)
+
+    # ================= Public API =================
+    def lookup(self, question: str, language: str, intent: str,
+               locations: Optional[Iterable[str]] = None) -> Optional[str]:
+        self._check_index_version()
+        bucket_key = self._bucket_key(language, intent, locations)
+        with self._lock:
+            if bucket_key not in self._buckets:
+                # Bucket rỗng → không cần encode câu hỏi
+                self.stats["misses"] += 1
+                return None
+
+        vector = self.embed_query(question)
+        now = time.time()
+        with self._lock:
+            if bucket_key not in self._buckets:
+                self.stats["misses"] += 1
+                return None
+            keys, matrix = self._bucket_matrix_locked(bucket_key)
+            sims = matrix @ vector
+            best = int(np.argmax(sims))
+            entry = self._entries.get(keys[best])
+
+            if entry is not None and now - entry.created_at > self.ttl_seconds:
+                self._remove_locked(entry)
+                self.stats["expired"] += 1
+                entry = None
+
+            if entry is None or float(sims[best]) < self.similarity_threshold:
+                self.stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(entry.key)
+            self.stats["hits"] += 1
+            logger.debug(f"⚡ Semantic cache hit ({float(sims[best]):.3f}): '{question}' ≈ '{entry.question}'")
+            return entry.answer
+
+    def store(self, question: str, language: str, intent: str, answer: str,
+              locations: Optional[Iterable[str]] = None):
+        if not answer:
+            return
+        self._check_index_version()
+        vector = self.embed_query(question)
+        bucket_key = self._bucket_key(language, intent, locations)
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            entry = _CacheEntry(key, bucket_key, question, vector, answer, time.time())
+            self._entries[key] = entry
+            self._buckets.setdefault(bucket_key, {})[key] = entry
+            self._matrices.pop(bucket_key, None)
+            self.stats["stores"] += 1
+
+            while len(self._entries) > self.max_entries:
+                _, oldest = next(iter(self._entries.items()))
+                self._remove_locked(oldest)
+                self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
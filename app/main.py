@@ -1,27 +1,51 @@
-import uvicorn
 import logging
+import os
 import sys
 from pathlib import Path
 from typing import Optional
 import asyncio
-from datetime import datetime, timedelta
+import json
+from datetime import datetime
 
-from fastapi import FastAPI, HTTPException, Header, Cookie
+from fastapi import FastAPI, HTTPException, Header, Cookie, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-
-# ====== Logging ======
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+from fastapi.responses import JSONResponse, StreamingResponse
 
 # ====== Thêm thư mục gốc vào sys.path ======
 current_dir = Path(__file__).parent
 root_dir = current_dir.parent
 sys.path.append(str(root_dir))
 
+# ====== python -m app.main --profile-startup: đo import + khởi tạo ở process con rồi thoát ======
+if __name__ == "__main__" and "--profile-startup" in sys.argv:
+    from utils.startup_profile import profile_startup
+    _top = int(sys.argv[sys.argv.index("--top") + 1]) if "--top" in sys.argv else 25
+    sys.exit(profile_startup("app.main", top=_top))
+
+# ====== Logging ======
+# JSON + request id, ghi bằng thread nền (LOG_LEVEL / LOG_LEVELS / LOG_FORMAT / LOG_DEBUG_SAMPLE_RATE)
+from utils.logging_setup import RequestIdMiddleware, configure_logging, get_logging_stats, shutdown_logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
 # ====== Import AI modules ======
 from ai_core.nlu_processor import NLUProcessor
 from ai_core.retrieval_qa import UXORetrievalQA
 from ai_core.llm_chain import GeminiLLM
+from ai_core.model_router import get_default_router
+from ai_core.intent_classifier import EmbeddingIntentClassifier, DEFAULT_EXEMPLARS_PATH
+from ai_core.semantic_cache import SemanticAnswerCache
+from ai_core.context_builder import ContextBuilder
+
+from utils.timeline import RequestTimeline, timeline_span
+from utils.admission import AdmissionController, AdmissionMiddleware, current_queue_ms
+from utils.deadline import reset_deadline, set_deadline
+from utils.executors import ExecutorSaturatedError, get_executor_stats, run_in, shutdown_executors
+from utils.single_flight import SingleFlight, normalize_question
+from utils.session_registry import SessionRegistry
+from utils.session_store import create_session_store
+from utils.startup_profile import get_startup_phases, startup_phase
+from utils.warmup import WarmupRunner
 
 # ====== Import database & routes ======
 from database import connection, models, crud
@@ -32,9 +56,9 @@ from data_layer.vector_store import vector_store_manager
 
 # ====== Import schemas ======
 try:
-    from schemas import ChatRequest, ChatResponse, QAResponse, ErrorResponse
+    from schemas import ChatRequest, ChatResponse, QAResponse, ErrorResponse, BatchAskRequest
 except ImportError:
-    from app.schemas import ChatRequest, ChatResponse, QAResponse, ErrorResponse
+    from app.schemas import ChatRequest, ChatResponse, QAResponse, ErrorResponse, BatchAskRequest
 
 # ====== Khởi tạo FastAPI ======
 app = FastAPI(
@@ -43,6 +67,14 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# ====== Admission control ======
+# Token bucket theo session + giới hạn đồng thời toàn worker với hàng đợi ngắn → 429/503 nhanh kèm Retry-After
+# (thêm trước CORS để CORS bọc ngoài, phản hồi từ chối vẫn có header CORS; /admin/report-uxo không bị giới hạn)
+# Stream / batch chạy lâu hơn nhiều 1 câu /ask → không tính vào service time dùng để dự đoán thời gian chờ
+admission = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission, paths=("/ask", "/ws/chat"),
+                   untimed_paths=("/ask/stream", "/ask/batch"))
+
 # ====== CORS ======
 app.add_middleware(
     CORSMiddleware,
@@ -52,49 +84,193 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ====== Request id (ngoài cùng: log của admission / CORS cũng mang request id) ======
+app.add_middleware(RequestIdMiddleware)
+
+# ====== Pool quá tải → 503 (bulkhead: pool khác vẫn chạy bình thường) ======
+@app.exception_handler(ExecutorSaturatedError)
+async def executor_saturated_handler(request, exc: ExecutorSaturatedError):
+    return JSONResponse(status_code=503, headers={"Retry-After": "1"},
+                        content={"detail": f"Hệ thống đang quá tải ({exc.pool}), vui lòng thử lại sau"})
+
 # ====== Include router admin ======
 app.include_router(admin_router)
 
 # ====== Khởi tạo database ======
-connection.create_db_tables(models)
+with startup_phase("database"):
+    connection.create_db_tables(models)
 
 # ====== AI module initialization ======
 try:
-    llm = GeminiLLM()
-    nlu = NLUProcessor(llm=llm)
+    with startup_phase("llm"):
+        llm = GeminiLLM()
+        # NLU → tier "fast", câu trả lời theo intent → tier "standard" (tắt: LLM_ROUTING_ENABLED=0, mọi lời gọi dùng llm)
+        model_router = get_default_router() if os.getenv("LLM_ROUTING_ENABLED", "1") == "1" else None
+
+    # kNN intent cục bộ (embedding MiniLM dùng chung với vector store) → bỏ qua LLM khi đủ chắc chắn
+    # (lần embed đầu tiên tải model embedding → thời gian tải model nằm ở bước này)
+    intent_classifier = None
+    if os.getenv("INTENT_KNN_ENABLED", "1") == "1":
+        try:
+            with startup_phase("intent_classifier"):
+                intent_classifier = EmbeddingIntentClassifier(
+                    embed_query=vector_store_manager.embed_query,
+                    embed_texts=vector_store_manager.embed_texts,
+                ).load_or_seed(DEFAULT_EXEMPLARS_PATH)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not build intent classifier: {e}. NLU will use LLM only.")
+            intent_classifier = None
+
+    with startup_phase("nlu"):
+        nlu = NLUProcessor(llm=llm, intent_classifier=intent_classifier, router=model_router)
 
     # Load vector store trực tiếp từ data_layer
     try:
-        vector_store_instance = vector_store_manager.load_vector_store()
+        with startup_phase("vector_store"):
+            vector_store_instance = vector_store_manager.load_vector_store()
+            # Snapshot chỉ-đọc trong RAM (app.serve bật mặc định: worker fork ra dùng chung, không mở Chroma riêng)
+            if os.getenv("VECTOR_INDEX_FROZEN", "0") == "1":
+                vector_store_instance = vector_store_manager.freeze()
         logger.info("✅ Vector store loaded successfully")
     except Exception as e:
         logger.warning(f"⚠️ Could not load vector store: {e}. Using empty store.")
         vector_store_instance = vector_store_manager
 
-    qa = UXORetrievalQA(llm=llm, vector_store=vector_store_instance)
+    # Cache câu trả lời RAG theo ngữ nghĩa, tự xoá khi index vector store thay đổi
+    answer_cache = None
+    if os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1":
+        answer_cache = SemanticAnswerCache(
+            embed_query=vector_store_manager.embed_query,
+            index_version=vector_store_manager.index_fingerprint,
+        )
+
+    # Context RAG trong ngân sách token theo intent: bỏ overlap chunk, xếp hạng câu bằng embedding
+    context_builder = ContextBuilder(
+        embed_query=vector_store_manager.embed_query,
+        embed_texts=vector_store_manager.embed_texts,
+    )
+
+    # ✅ Dùng chung 1 NLUProcessor (qa gắn memory_manager vào nlu)
+    with startup_phase("qa"):
+        qa = UXORetrievalQA(llm=llm, vector_store=vector_store_instance, nlu_processor=nlu,
+                            answer_cache=answer_cache, context_builder=context_builder,
+                            embed_queries=vector_store_manager.embed_queries, router=model_router)
     logger.info("✅ AI modules initialized successfully")
 except Exception as e:
     logger.error(f"❌ Failed to initialize AI modules: {e}")
     raise
 
+# Retrieval chạy song song với NLU (kết quả bỏ đi nếu nhánh cuối là hotline / cache hit)
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL_ENABLED", "1") == "1"
+
+# Thời gian tối đa cho 1 request /ask (NLU + retrieval + generation); hết → trả lời degraded
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", 20))
+
+# /ask/batch: số câu hỏi tối đa mỗi lô (số câu sinh song song: ASK_BATCH_CONCURRENCY)
+ASK_BATCH_MAX_QUESTIONS = int(os.getenv("ASK_BATCH_MAX_QUESTIONS", 500))
+
+# WebSocket /ws/chat: số tin nhắn client gửi trước còn chờ xử lý tối đa mỗi kết nối
+WS_MAX_PENDING = int(os.getenv("WS_MAX_PENDING", 8))
+
+# Gộp các câu hỏi giống hệt nhau đang chạy đồng thời từ session chưa có lịch sử
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT_ENABLED", "1") == "1"
+ask_flight = SingleFlight()
+
 # ====== Session Management ======
-user_sessions = {}
+# Store dùng chung giữa worker/node (SESSION_STORE=memory|sqlite|redis): metadata + cửa sổ hội thoại.
+# Registry là tập session "nóng" của process: TTL + LRU + giới hạn entry/byte, bị xoá → dọn cache cục bộ
+with startup_phase("session_store"):
+    session_store = create_session_store()
+session_registry = SessionRegistry()
+qa.memory_manager.attach_store(session_store)
+qa.memory_manager.attach_registry(session_registry)
+
+# ====== Warm-up ======
+# Chạy nền sau khi worker nhận kết nối (lifespan startup → mỗi worker của app.serve tự warm):
+# forward embedding đầu tiên, 1 lượt retrieval thật (Chroma page-in index HNSW), client Gemini, cache.
+# /health/ready trả 503 tới khi xong (WARMUP_ENABLED=0 → ready ngay)
+WARMUP_PROBE = "Bom mìn chưa nổ nguy hiểm như thế nào?"
+warmup = WarmupRunner(enabled=os.getenv("WARMUP_ENABLED", "1") == "1")
+
+def _warm_embedding():
+    vector_store_manager.embed_texts([WARMUP_PROBE])
+    vector_store_manager.embed_query(WARMUP_PROBE)
+
+def _warm_vector_search():
+    qa.retriever.get_relevant_documents(WARMUP_PROBE)
+
+async def _warm_llm_clients():
+    llms = {id(llm): llm}
+    if model_router:
+        llms.update((id(tier_llm), tier_llm) for tier_llm in model_router.routed_llms())
+    for instance in llms.values():
+        await instance.warm_up()
+
+def _warm_caches():
+    if getattr(llm, "cache", None):
+        llm.cache.get_stats()
+    session_store.get("session:__warmup__")
+
+warmup.add("embedding", _warm_embedding, pool="cpu")
+warmup.add("vector_search", _warm_vector_search, pool="cpu")
+warmup.add("llm_clients", _warm_llm_clients)
+warmup.add("caches", _warm_caches, pool="db", required=False)
+
+def _rehydrate_from_chat_logs(session_id: str) -> int:
+    """Session id lạ (restart, worker khác, store hết hạn) → dựng lại hội thoại từ bảng chat_logs"""
+    db = connection.SessionLocal()
+    try:
+        logs = crud.get_chat_logs_by_session(db, session_id, limit=qa.memory_manager.k)
+        turns = [(log.message, log.response, log.intent) for log in reversed(logs)]
+    finally:
+        db.close()
+    qa.memory_manager.rehydrate(session_id, turns)
+    return len(turns)
 
 def get_or_create_session(session_id: Optional[str] = None) -> str:
-    import uuid
-    if not session_id or session_id not in user_sessions:
-        new_session_id = str(uuid.uuid4())
-        user_sessions[new_session_id] = {
-            "created_at": datetime.now(),
-            "last_activity": datetime.now(),
-            "message_count": 0
-        }
-        logger.info(f"🆕 Created new session: {new_session_id}")
-        return new_session_id
-    
-    user_sessions[session_id]["last_activity"] = datetime.now()
-    user_sessions[session_id]["message_count"] += 1
-    return session_id
+    """Blocking (store / DB) → gọi qua run_in("db", ...) trong endpoint async"""
+    known = session_id in session_registry
+    resolved_id = session_registry.touch(session_id)
+    key = f"session:{resolved_id}"
+    now = datetime.now().isoformat()
+    meta = session_store.get(key)
+    if meta is None:
+        meta = {"created_at": now, "last_activity": now, "message_count": 0}
+        if not known and resolved_id == session_id and not qa.memory_manager.has_session(resolved_id):
+            try:
+                restored = _rehydrate_from_chat_logs(resolved_id)
+                if restored:
+                    meta["message_count"] = restored
+                    meta["rehydrated"] = True
+            except Exception as e:
+                logger.error(f"❌ Rehydrate session {resolved_id} lỗi: {e}")
+    else:
+        meta = {**meta, "last_activity": now, "message_count": meta.get("message_count", 0) + 1}
+    session_store.put(key, meta)
+    return resolved_id
+
+_background_tasks = set()
+
+def _spawn_background(coro):
+    """Giữ tham chiếu tới task nền tới khi xong (event loop chỉ giữ weakref)"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+def log_chat(session_id: str, message: str, response: str, nlu_result: Optional[dict]):
+    """Ghi chat_logs (nguồn để rehydrate session); blocking → gọi qua run_in("db", ...)"""
+    nlu_result = nlu_result or {}
+    db = connection.SessionLocal()
+    try:
+        crud.create_chat_log(
+            db, session_id=session_id, message=message, response=response,
+            intent=nlu_result.get("intent"), entities=nlu_result.get("entities"),
+            confidence=nlu_result.get("confidence"), intent_source=nlu_result.get("source"),
+        )
+    except Exception as e:
+        logger.error(f"❌ Ghi chat log lỗi: {e}")
+    finally:
+        db.close()
 
 def get_session_id_from_multiple_sources(
     header_session_id: Optional[str] = None,
@@ -108,109 +284,438 @@ def get_session_id_from_multiple_sources(
 def health_check():
     return {"status": "healthy", "service": "UXO Chatbot API"}
 
-@app.get("/health")
-def health_detail():
+def _vector_store_health() -> tuple:
     vector_store_status = "not_initialized"
     if hasattr(vector_store_instance, 'health_check'):
         try:
             vector_store_status = vector_store_instance.health_check().get("status", "unknown")
         except:
             vector_store_status = "error"
-    
+    document_count = vector_store_instance.get_document_count() if hasattr(vector_store_instance, 'get_document_count') else 0
+    return vector_store_status, document_count
+
+@app.get("/health/live")
+def health_live():
+    """Liveness: process còn phục vụ được HTTP (không kiểm tra phụ thuộc → không restart vì Gemini chậm)"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def health_ready():
+    """Readiness: 503 tới khi warm-up xong, kèm trạng thái + thời gian từng thành phần"""
+    stats = warmup.get_stats()
+    return JSONResponse(status_code=200 if stats["ready"] else 503,
+                        content={"status": "ready" if stats["ready"] else "warming_up", **stats})
+
+@app.get("/health")
+async def health_detail():
+    # Chroma đọc SQLite → pool db; phần còn lại chỉ đọc counter trong RAM, chạy ngay trên event loop
+    vector_store_status, document_count = await run_in("db", _vector_store_health)
     return {
-        "status": "healthy",
+        "status": "healthy" if warmup.is_ready() else "warming_up",
+        "warmup": warmup.get_stats(),
         "llm_ready": hasattr(llm, 'invoke'),
         "vector_store_ready": vector_store_status,
         "nlu_ready": hasattr(nlu, 'process_nlu'),
-        "active_sessions": len(user_sessions),
-        "vector_store_document_count": vector_store_instance.get_document_count() if hasattr(vector_store_instance, 'get_document_count') else 0
+        "nlu_stats": nlu.get_stats() if hasattr(nlu, 'get_stats') else {},
+        "answer_cache": answer_cache.get_stats() if answer_cache else {"enabled": False},
+        "llm_cache": llm.cache.get_stats() if getattr(llm, "cache", None) else {"enabled": False},
+        "llm_gateway": llm.gateway.get_stats() if getattr(llm, "gateway", None) else {"enabled": False},
+        "llm_breaker": llm.breaker.get_stats() if getattr(llm, "breaker", None) else {"enabled": False},
+        "llm_tiers": model_router.get_stats() if model_router else {"enabled": False},
+        "startup_ms": get_startup_phases(),
+        "degraded_answers": qa.degraded_stats,
+        "speculative_retrieval": qa.prefetch_stats if SPECULATIVE_RETRIEVAL else {"enabled": False},
+        "single_flight": ask_flight.get_stats() if SINGLE_FLIGHT else {"enabled": False},
+        "active_sessions": len(session_registry),
+        "sessions": session_registry.get_stats(),
+        "session_store": session_store.get_stats(),
+        "context_builder": qa.context_builder.get_stats(),
+        "batch": qa.batch_stats,
+        "websocket": dict(ws_stats),
+        "executors": get_executor_stats(),
+        "admission": admission.get_stats(),
+        "logging": get_logging_stats(),
+        "vector_store_document_count": document_count
     }
 
+async def _run_ask_pipeline(message: str, language: str, session_id: str) -> dict:
+    """NLU + sinh câu trả lời, KHÔNG ghi memory (caller ghi cho từng session)"""
+    prefetched = qa.start_speculative_retrieval(message) if SPECULATIVE_RETRIEVAL else None
+    try:
+        with timeline_span("nlu"):
+            nlu_result = await nlu.aprocess_nlu(message, language, session_id)
+    except Exception:
+        if prefetched is not None:
+            prefetched.discard()
+        raise
+    logger.info(f"🧠 Intent detected: {nlu_result['intent']}")
+
+    answer, memory_answer, saved_intent = await qa.aanswer(
+        question=message,
+        intent=nlu_result["intent"],
+        session_id=session_id,
+        language=language,
+        enriched_text=nlu_result.get("enriched_text"),
+        entities=nlu_result["entities"],
+        prefetched=prefetched
+    )
+    return {"nlu": nlu_result, "answer": answer, "memory_answer": memory_answer, "saved_intent": saved_intent}
+
 @app.post("/ask", response_model=QAResponse, responses={500: {"model": ErrorResponse}})
-def ask_question(
+async def ask_question(
     req: ChatRequest,
     x_session_id: Optional[str] = Header(None, alias="X-Session-ID"),
     session_id_cookie: Optional[str] = Cookie(None, alias="session_id")
 ):
+    timeline = RequestTimeline()
+    timeline_token = timeline.activate()
+    timeline.note("queue_ms", current_queue_ms())
+    deadline_token = set_deadline(REQUEST_DEADLINE_SECONDS)
     try:
         session_id_from_sources = get_session_id_from_multiple_sources(
             header_session_id=x_session_id,
             cookie_session_id=session_id_cookie,
             body_session_id=req.session_id
         )
-        session_id = get_or_create_session(session_id_from_sources)
+        session_id = await run_in("db", get_or_create_session, session_id_from_sources)
+        await qa.memory_manager.aload_session(session_id)
         logger.info(f"📥 Question from session {session_id}: {req.message}")
 
-        nlu_result = nlu.process_nlu(req.message, req.language)
-        intent = nlu_result["intent"]
-        logger.info(f"🧠 Intent detected: {intent}")
+        if SINGLE_FLIGHT and qa.is_stateless(session_id):
+            # Session chưa có lịch sử → kết quả chỉ phụ thuộc (câu hỏi, ngôn ngữ), dùng chung được
+            flight_key = (normalize_question(req.message), req.language)
+            result, shared = await ask_flight.do(
+                flight_key, lambda: _run_ask_pipeline(req.message, req.language, session_id)
+            )
+            if shared:
+                timeline.note("coalesced", True)
+        else:
+            result = await _run_ask_pipeline(req.message, req.language, session_id)
 
-        answer = qa.get_response(
-            question=req.message,
-            intent=intent,
-            session_id=session_id,
-            language=req.language
-        )
+        await run_in("db", qa.memory_manager.save_context,
+                     session_id, req.message, result["memory_answer"], result["saved_intent"])
+        answer = result["answer"]
+        _spawn_background(run_in("db", log_chat, session_id, req.message, answer, result["nlu"]))
         logger.info(f"💬 Answer generated: {answer[:100]}...")
 
         return {
             "question": req.message,
             "answer": answer,
-            "nlu": nlu_result,
+            "nlu": result["nlu"],
             "session_id": session_id,
-            "memory_length": len(qa.memory_manager.get_messages(session_id)) if hasattr(qa, 'memory_manager') else 0
+            "memory_length": qa.memory_manager.get_message_count(session_id) if hasattr(qa, 'memory_manager') else 0,
+            "timings": timeline.as_dict()
         }
+    except ExecutorSaturatedError:
+        raise
     except Exception as e:
         logger.error(f"❌ Error processing question: {e}")
         raise HTTPException(status_code=500, detail=f"Lỗi xử lý câu hỏi: {str(e)}")
+    finally:
+        reset_deadline(deadline_token)
+        timeline.deactivate(timeline_token)
 
-@app.get("/session/{session_id}")
-def get_session_info(session_id: str):
-    if session_id not in user_sessions:
-        raise HTTPException(status_code=404, detail="Session không tồn tại")
-    session_info = user_sessions[session_id].copy()
+def _sse_event(event: str, data: dict) -> str:
+    """Đóng gói 1 sự kiện Server-Sent-Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.post("/ask/stream", responses={500: {"model": ErrorResponse}})
+async def ask_question_stream(
+    req: ChatRequest,
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID"),
+    session_id_cookie: Optional[str] = Cookie(None, alias="session_id")
+):
+    """
+    Giống /ask nhưng stream câu trả lời dạng SSE:
+      event: meta  → question, nlu, session_id (gửi trước tiên)
+      event: token → {"text": đoạn câu trả lời}
+      event: done  → {"memory_length": ..., "timings": ...}
+    """
+    # Không reset timeline / deadline: generator stream chạy sau khi endpoint return (context riêng của request)
+    timeline = RequestTimeline()
+    timeline.activate()
+    timeline.note("queue_ms", current_queue_ms())
+    set_deadline(REQUEST_DEADLINE_SECONDS)
+    prefetched = None
+    try:
+        session_id_from_sources = get_session_id_from_multiple_sources(
+            header_session_id=x_session_id,
+            cookie_session_id=session_id_cookie,
+            body_session_id=req.session_id
+        )
+        session_id = await run_in("db", get_or_create_session, session_id_from_sources)
+        await qa.memory_manager.aload_session(session_id)
+        logger.info(f"📥 [stream] Question from session {session_id}: {req.message}")
+
+        if SPECULATIVE_RETRIEVAL:
+            prefetched = qa.start_speculative_retrieval(req.message)
+        with timeline.span("nlu"):
+            nlu_result = await nlu.aprocess_nlu(req.message, req.language, session_id)
+        intent = nlu_result["intent"]
+        logger.info(f"🧠 Intent detected: {intent}")
+    except Exception as e:
+        if prefetched is not None:
+            prefetched.discard()
+        if isinstance(e, ExecutorSaturatedError):
+            raise
+        logger.error(f"❌ Error processing question: {e}")
+        raise HTTPException(status_code=500, detail=f"Lỗi xử lý câu hỏi: {str(e)}")
+
+    async def event_stream():
+        chunks = []
+        yield _sse_event("meta", {"question": req.message, "nlu": nlu_result, "session_id": session_id})
+        async for chunk in qa.astream_response(
+            question=req.message,
+            intent=intent,
+            session_id=session_id,
+            language=req.language,
+            enriched_text=nlu_result.get("enriched_text"),
+            entities=nlu_result["entities"],
+            prefetched=prefetched
+        ):
+            chunks.append(chunk)
+            yield _sse_event("token", {"text": chunk})
+        _spawn_background(run_in("db", log_chat, session_id, req.message, "".join(chunks), nlu_result))
+        memory_length = qa.memory_manager.get_message_count(session_id) if hasattr(qa, 'memory_manager') else 0
+        yield _sse_event("done", {"memory_length": memory_length, "timings": timeline.as_dict()})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/ask/batch", responses={400: {"model": ErrorResponse}})
+async def ask_batch(req: BatchAskRequest):
+    """
+    Nhiều câu hỏi độc lập (không session / memory) trong 1 request, trả NDJSON theo thứ tự xong trước:
+      {"index", "id", "question", "answer", "nlu", "timings"}   (lỗi riêng 1 câu → "error" thay cho "answer")
+    Embedding cả lô 1 lần, câu trùng chỉ search 1 lần, sinh song song có giới hạn; mỗi câu có deadline riêng.
+    """
+    if not req.questions:
+        raise HTTPException(status_code=400, detail="Danh sách câu hỏi rỗng")
+    if len(req.questions) > ASK_BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"Tối đa {ASK_BATCH_MAX_QUESTIONS} câu hỏi mỗi lô")
+    items = [{"question": q.message, "language": q.language or req.language, "id": q.id} for q in req.questions]
+    concurrency = min(req.concurrency or qa.batch_concurrency, qa.batch_concurrency)
+    logger.info(f"📥 Batch {len(items)} câu hỏi, concurrency={concurrency}")
+
+    async def ndjson_stream():
+        async for result in qa.abatch_answer(items, concurrency=concurrency,
+                                             deadline_seconds=REQUEST_DEADLINE_SECONDS):
+            yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ====== WebSocket chat ======
+ws_stats = {"active": 0, "connections": 0, "messages": 0, "rejected": 0, "errors": 0}
+
+def _add_session_messages(session_id: str, count: int):
+    """Cập nhật metadata session 1 lần khi đóng kết nối WS (không ghi store mỗi tin nhắn)"""
+    key = f"session:{session_id}"
+    meta = session_store.get(key) or {"created_at": datetime.now().isoformat(), "message_count": 0}
+    session_store.put(key, {**meta, "last_activity": datetime.now().isoformat(),
+                            "message_count": meta.get("message_count", 0) + count})
+
+async def _ws_answer(send, session_id: str, msg_id, message: str, language: str):
+    """1 tin nhắn trên WS: meta (NLU) → token… → done, cùng deadline / timeline như /ask/stream"""
+    timeline = RequestTimeline()
+    timeline_token = timeline.activate()
+    deadline_token = set_deadline(REQUEST_DEADLINE_SECONDS)
+    prefetched = None
+    try:
+        session_registry.touch(session_id)
+        # Worker khác có thể vừa ghi lượt mới cho session này → nạp lại mỗi tin nhắn (qua pool db)
+        await qa.memory_manager.aload_session(session_id)
+        try:
+            if SPECULATIVE_RETRIEVAL:
+                prefetched = qa.start_speculative_retrieval(message)
+            with timeline.span("nlu"):
+                nlu_result = await nlu.aprocess_nlu(message, language, session_id)
+            logger.info(f"🧠 [ws] Intent detected: {nlu_result['intent']}")
+            await send({"type": "meta", "id": msg_id, "question": message, "nlu": nlu_result})
+        except BaseException:
+            if prefetched is not None:
+                prefetched.discard()
+            raise
+
+        chunks = []
+        async for chunk in qa.astream_response(
+            question=message,
+            intent=nlu_result["intent"],
+            session_id=session_id,
+            language=language,
+            enriched_text=nlu_result.get("enriched_text"),
+            entities=nlu_result["entities"],
+            prefetched=prefetched
+        ):
+            chunks.append(chunk)
+            await send({"type": "token", "id": msg_id, "text": chunk})
+        _spawn_background(run_in("db", log_chat, session_id, message, "".join(chunks), nlu_result))
+        await send({"type": "done", "id": msg_id,
+                    "memory_length": qa.memory_manager.get_message_count(session_id),
+                    "timings": timeline.as_dict()})
+    finally:
+        reset_deadline(deadline_token)
+        timeline.deactivate(timeline_token)
+
+@app.websocket("/ws/chat")
+async def ws_chat(
+    websocket: WebSocket,
+    session_id: Optional[str] = Query(None),
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID"),
+    session_id_cookie: Optional[str] = Cookie(None, alias="session_id")
+):
+    """
+    Chat qua WebSocket: session resolve 1 lần cho cả kết nối, client gửi nối tiếp không cần chờ
+    (xử lý tuần tự theo thứ tự gửi, tối đa WS_MAX_PENDING tin đang chờ), chat log ghi phía server.
+      client → {"message": "...", "language": "vi", "id": <tuỳ chọn, gửi lại trong mọi sự kiện>}
+      server → {"type": "session", "session_id"}              (ngay sau khi kết nối)
+               {"type": "meta", "id", "question", "nlu"}
+               {"type": "token", "id", "text"}
+               {"type": "done", "id", "memory_length", "timings"}
+               {"type": "error", "id", "detail"}
+    Frame nhị phân → đóng kết nối với code 1003 (unsupported data).
+    Kết nối rảnh chỉ tốn 2 coroutine (nhận + xử lý) chờ trên event loop, không giữ thread.
+    """
+    await websocket.accept()
+    try:
+        session_id = await run_in("db", get_or_create_session, get_session_id_from_multiple_sources(
+            header_session_id=x_session_id,
+            cookie_session_id=session_id_cookie,
+            body_session_id=session_id
+        ))
+    except ExecutorSaturatedError:
+        await websocket.close(code=1013)   # Try Again Later
+        return
+    ws_stats["active"] += 1
+    ws_stats["connections"] += 1
+    send_lock = asyncio.Lock()
+    pending: asyncio.Queue = asyncio.Queue(maxsize=WS_MAX_PENDING)
+    handled = 0
+
+    async def send(data: dict):
+        async with send_lock:
+            await websocket.send_text(json.dumps(data, ensure_ascii=False, default=str))
+
+    async def worker():
+        nonlocal handled
+        while True:
+            msg_id, message, language = await pending.get()
+            logger.info(f"📥 [ws] Question from session {session_id}: {message}")
+            try:
+                await _ws_answer(send, session_id, msg_id, message, language)
+                handled += 1
+            except WebSocketDisconnect:
+                return
+            except Exception as e:
+                ws_stats["errors"] += 1
+                logger.error(f"❌ [ws] Error processing question: {e}")
+                try:
+                    await send({"type": "error", "id": msg_id, "detail": f"Lỗi xử lý câu hỏi: {str(e)}"})
+                except Exception:
+                    return   # client đã ngắt
+
+    worker_task = asyncio.create_task(worker())
+    try:
+        await send({"type": "session", "session_id": session_id})
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            raw = frame.get("text")
+            if raw is None:
+                # Frame nhị phân: giao thức chỉ nhận JSON dạng text → 1003 (unsupported data)
+                async with send_lock:
+                    await websocket.close(code=1003, reason="Chỉ nhận tin nhắn JSON dạng text")
+                break
+            try:
+                data = json.loads(raw)
+                msg_id = data.get("id")
+                message = str(data["message"]).strip()
+            except (ValueError, KeyError, TypeError, AttributeError):
+                await send({"type": "error", "id": None, "detail": "Tin nhắn phải là JSON có trường 'message'"})
+                continue
+            if not message:
+                await send({"type": "error", "id": msg_id, "detail": "Tin nhắn rỗng"})
+                continue
+            try:
+                pending.put_nowait((msg_id, message, data.get("language") or "vi"))
+                ws_stats["messages"] += 1
+            except asyncio.QueueFull:
+                ws_stats["rejected"] += 1
+                await send({"type": "error", "id": msg_id,
+                            "detail": f"Quá nhiều tin nhắn đang chờ (tối đa {WS_MAX_PENDING})"})
+    except (WebSocketDisconnect, RuntimeError):
+        pass   # client đóng kết nối (RuntimeError: gửi sau khi socket đã đóng)
+    finally:
+        worker_task.cancel()
+        ws_stats["active"] -= 1
+        if handled:
+            _spawn_background(run_in("db", _add_session_messages, session_id, handled))
+
+def _session_info(session_id: str) -> Optional[dict]:
+    meta = session_store.get(f"session:{session_id}")
+    info = session_registry.get(session_id)
+    if meta is None and info is None:
+        return None
+    session_info = dict(meta) if meta is not None else info.to_dict()
+    if info is not None:
+        session_info["size_bytes"] = info.size_bytes
     if hasattr(qa, 'memory_manager'):
         try:
-            memory_messages = qa.memory_manager.get_messages(session_id)
-            session_info["memory_message_count"] = len(memory_messages)
+            session_info["memory_message_count"] = qa.memory_manager.get_message_count(session_id)
         except:
             session_info["memory_message_count"] = 0
     return session_info
 
+@app.get("/session/{session_id}")
+async def get_session_info(session_id: str):
+    session_info = await run_in("db", _session_info, session_id)
+    if session_info is None:
+        raise HTTPException(status_code=404, detail="Session không tồn tại")
+    return session_info
+
 @app.delete("/memory/{session_id}")
-def clear_session_memory(session_id: str):
+async def clear_session_memory(session_id: str):
     try:
         if hasattr(qa, 'memory_manager'):
-            qa.memory_manager.clear_memory(session_id)
+            await run_in("db", qa.memory_manager.clear_memory, session_id)
             return {"message": f"Memory của session {session_id} đã được xóa."}
         else:
             return {"message": "Memory manager không khả dụng"}
+    except ExecutorSaturatedError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi xóa memory: {str(e)}")
 
+def _delete_session(session_id: str):
+    # Registry gọi memory_manager.clear_memory qua listener; gọi thêm cho session không còn trong registry
+    session_registry.remove(session_id)
+    session_store.delete(f"session:{session_id}")
+    if hasattr(qa, 'memory_manager'):
+        qa.memory_manager.clear_memory(session_id)
+
 @app.delete("/session/{session_id}")
-def delete_session(session_id: str):
+async def delete_session(session_id: str):
     try:
-        if hasattr(qa, 'memory_manager'):
-            qa.memory_manager.clear_memory(session_id)
-        if session_id in user_sessions:
-            del user_sessions[session_id]
+        await run_in("db", _delete_session, session_id)
         return {"message": f"Session {session_id} đã được xóa hoàn toàn."}
+    except ExecutorSaturatedError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi xóa session: {str(e)}")
 
 # ====== Cleanup task ======
 async def cleanup_old_sessions():
+    """Session hết hạn cũng bị xoá dần ở mỗi touch; task này dọn nốt khi không có traffic"""
     while True:
         try:
-            now = datetime.now()
-            to_delete = [sid for sid, data in user_sessions.items() if now - data["last_activity"] > timedelta(hours=24)]
-            for sid in to_delete:
-                if hasattr(qa, 'memory_manager'):
-                    qa.memory_manager.clear_memory(sid)
-                del user_sessions[sid]
-                logger.info(f"🧹 Cleaned up old session: {sid}")
-            await asyncio.sleep(3600)
+            expired = session_registry.sweep()
+            if expired:
+                logger.info(f"🧹 Cleaned up {expired} expired sessions")
+            await asyncio.sleep(60)
         except Exception as e:
             logger.error(f"❌ Error in cleanup task: {e}")
             await asyncio.sleep(300)
@@ -219,7 +724,16 @@ async def cleanup_old_sessions():
 async def startup_event():
     asyncio.create_task(cleanup_old_sessions())
     logger.info("✅ Cleanup task started")
+    _spawn_background(warmup.run())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Ghi nốt các thay đổi session đang chờ trong buffer write-behind
+    session_store.close()
+    shutdown_executors()
+    shutdown_logging()
 
 # ====== Chạy server ======
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -19,6 +19,17 @@ class QAResponse(BaseModel):
     nlu: Dict[str, Any]
     session_id: str
     memory_length: int
+    timings: Optional[Dict[str, Any]] = None  # thời gian từng giai đoạn (nlu, retrieval, generation...)
+
+class BatchQuestion(BaseModel):
+    message: str
+    id: Optional[str] = None          # client tự đặt, trả lại trong kết quả (kết quả về theo thứ tự xong trước)
+    language: Optional[str] = None    # None → dùng language của batch
+
+class BatchAskRequest(BaseModel):
+    questions: List[BatchQuestion]
+    language: str = "vi"
+    concurrency: Optional[int] = None  # số câu sinh song song, không vượt ASK_BATCH_CONCURRENCY
 
 class ImageDetectionRequest(BaseModel):
     session_id: Optional[str] = None  # ✅ Cho phép None
@@ -0,0 +1,159 @@
+# app/serve.py
+"""
+Chạy API nhiều worker kiểu preload (như gunicorn --preload), thay cho `uvicorn app.main:app --workers N`
+(mỗi worker tự nạp 1 bản model embedding MiniLM, 1 Chroma client, 1 bộ GeminiLLM / NLUProcessor):
+  master: import app.main MỘT lần → model embedding, index vector (snapshot chỉ-đọc, VECTOR_INDEX_FROZEN=1),
+          prompt template, exemplar intent... → gc.freeze() → mở socket → fork N worker
+  worker: dùng chung các trang nhớ đó (copy-on-write); state thay đổi được của từng worker
+          (thread pool, kết nối SQLite / Redis / SQLAlchemy) dựng lại sau fork qua utils.prefork,
+          lifespan startup (task dọn session...) chạy trong từng worker.
+Worker chết → master fork lại từ bản đã nạp sẵn (không phải nạp lại model).
+Chỉ chạy trên hệ điều hành có fork (Linux / macOS).
+
+Chạy:
+    python -m app.serve --workers 4 --host 0.0.0.0 --port 8000
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from utils.logging_setup import LOG_WRITER_THREAD, configure_logging, shutdown_logging
+
+logger = logging.getLogger("app.serve")
+
+
+def _set_torch_threads(n: int):
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(n)
+
+
+def _prepare_master():
+    os.environ.setdefault("VECTOR_INDEX_FROZEN", "1")
+    # Thread pool của tokenizer (Rust) và telemetry của Chroma không sang được process con
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    # Master chạy forward 1 luồng: không tạo thread pool OpenMP trước khi fork (worker dùng pool OpenMP
+    # kế thừa từ cha có thể treo); worker tự đặt số luồng torch (--torch-threads)
+    _set_torch_threads(1)
+
+
+def preload():
+    """Nạp toàn bộ app ở master, đóng băng heap để GC của worker không ghi vào trang nhớ dùng chung"""
+    start = time.perf_counter()
+    from app import main as app_module
+    gc.collect()
+    gc.freeze()
+    # Thread ghi log được utils.logging_setup dựng lại sau fork
+    threads = [t.name for t in threading.enumerate()
+               if t is not threading.main_thread() and t.name != LOG_WRITER_THREAD]
+    if threads:
+        logger.warning(f"⚠️ Master có thread trước khi fork (không sang worker, phải được dựng lại): {threads}")
+    logger.info(f"✅ Preload app.main xong trong {time.perf_counter() - start:.1f}s "
+                f"({gc.get_freeze_count()} object đã freeze)")
+    return app_module.app
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, worker_id: int, args):
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    os.environ["SERVE_WORKER_ID"] = str(worker_id)
+    _set_torch_threads(args.torch_threads)
+    import uvicorn
+    # log_config=None: log của uvicorn đi qua root logger (JSON + request id, utils.logging_setup)
+    config = uvicorn.Config(app, lifespan="on", log_config=None, log_level=args.log_level,
+                            access_log=args.access_log)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(app, sock: socket.socket, worker_id: int, args) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(app, sock, worker_id, args)
+        except BaseException:
+            logger.exception(f"❌ Worker {worker_id} lỗi")
+            code = 1
+        finally:
+            shutdown_logging()   # os._exit bỏ qua atexit → ghi nốt hàng đợi log
+            os._exit(code)
+    logger.info(f"🚀 Worker {worker_id} (pid {pid})")
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy UXO API nhiều worker, nạp model một lần trước khi fork")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--torch-threads", type=int, default=int(os.getenv("SERVE_TORCH_THREADS", 1)),
+                        help="Số luồng torch mỗi worker (embedding)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--access-log", action="store_true")
+    args = parser.parse_args()
+
+    configure_logging()
+    _prepare_master()
+    app = preload()
+    sock = bind_socket(args.host, args.port, args.backlog)
+    logger.info(f"✅ Lắng nghe {args.host}:{args.port}, {args.workers} worker")
+
+    workers: Dict[int, int] = {}
+    for worker_id in range(args.workers):
+        workers[spawn(app, sock, worker_id, args)] = worker_id
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        worker_id = workers.pop(pid, None)
+        if worker_id is None or stopping:
+            continue
+        logger.warning(f"⚠️ Worker {worker_id} (pid {pid}) thoát (status {status}), fork lại")
+        time.sleep(1)   # worker chết ngay khi khởi động → không fork liên tục
+        workers[spawn(app, sock, worker_id, args)] = worker_id
+
+    sock.close()
+    logger.info("👋 Đã dừng tất cả worker")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,22 @@ from fastapi.middleware.cors import CORSMiddleware
 from yolov8_detector import UXODetector
 import tempfile
 import os
+import sys
 from datetime import datetime
+from pathlib import Path
 import uuid
 
+# Thêm thư mục gốc vào sys.path (dùng utils chung với app chính)
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.admission import AdmissionController, AdmissionMiddleware
+from utils.executors import run_in
+
 app = FastAPI(title="UXO Detection API", version="1.0.0")
 
+# Admission control: YOLO tốn CPU → giới hạn nhịp mỗi client + số ảnh xử lý đồng thời, quá tải → 429/503 + Retry-After
+admission = AdmissionController(max_concurrency=int(os.getenv("CV_ADMISSION_MAX_CONCURRENCY", 4)))
+app.add_middleware(AdmissionMiddleware, controller=admission, paths=("/detect-uxo",))
+
 # Thêm CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -48,7 +59,7 @@ async def detect_uxo(
         background_tasks.add_task(cleanup_temp_file, tmp_path)
         
         # Phát hiện vật thể
-        detections = detector.detect(tmp_path, confidence_threshold)
+        detections = await run_in("cpu", detector.detect, tmp_path, confidence_threshold)
         
         # Phân loại mức độ nguy hiểm
         danger_level = "low"
@@ -91,7 +102,7 @@ async def detect_uxo_with_image(
         output_path = os.path.join(tempfile.gettempdir(), output_filename)
         
         # Xử lý ảnh
-        detections = detector.draw_detections(tmp_path, output_path, confidence_threshold)
+        detections = await run_in("cpu", detector.draw_detections, tmp_path, output_path, confidence_threshold)
         
         # Đảm bảo xóa file tạm
         background_tasks.add_task(cleanup_temp_file, tmp_path)
@@ -128,4 +139,4 @@ async def download_result(filename: str):
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
\ No newline at end of file
+    return {"status": "healthy", "timestamp": datetime.now().isoformat(), "admission": admission.get_stats()}
\ No newline at end of file
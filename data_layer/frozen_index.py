@@ -0,0 +1,85 @@
+# data_layer/frozen_index.py
+"""
+Snapshot chỉ-đọc của collection Chroma: ma trận embedding (float32, chuẩn hoá L2) + Document dựng sẵn.
+Tìm kiếm = 1 phép nhân ma trận (chính xác, không phải HNSW xấp xỉ). MiniLM trả vector đã chuẩn hoá
+→ thứ hạng trùng với khoảng cách L2 mặc định của Chroma.
+Dùng cho app.serve: master dựng snapshot một lần trước khi fork, các worker đọc chung trang nhớ
+(copy-on-write, mảng numpy không bị ghi). Index thay đổi (import tài liệu) → cần khởi động lại server.
+Giao diện giống phần Chroma mà UXORetrievalQA / VectorStoreManager dùng.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class FrozenRetriever:
+    def __init__(self, index: "FrozenVectorIndex", k: int):
+        self.index = index
+        self.k = k
+
+    def get_relevant_documents(self, query: str) -> List[Any]:
+        return self.index.similarity_search(query, k=self.k)
+
+    def invoke(self, query: str, config=None, **kwargs) -> List[Any]:
+        return self.get_relevant_documents(query)
+
+
+class FrozenVectorIndex:
+    def __init__(self, embeddings: np.ndarray, documents: List[Any], ids: List[str],
+                 embed_query: Callable[[str], np.ndarray]):
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(documents), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.embeddings = matrix / np.maximum(norms, 1e-12)
+        self.embeddings.setflags(write=False)
+        self.documents = documents
+        self.ids = ids
+        self.embed_query = embed_query
+
+    @classmethod
+    def from_chroma(cls, chroma, embed_query: Callable[[str], np.ndarray]) -> "FrozenVectorIndex":
+        from langchain.schema import Document
+        data = chroma.get(include=["embeddings", "documents", "metadatas"])
+        documents = [
+            Document(page_content=text or "", metadata=metadata or {})
+            for text, metadata in zip(data["documents"], data["metadatas"])
+        ]
+        embeddings = data["embeddings"] if data["embeddings"] is not None else np.zeros((0, 0))
+        return cls(np.asarray(embeddings), documents, list(data["ids"]), embed_query)
+
+    # ================= Search =================
+    def _top_k(self, embedding, k: int) -> List[Tuple[int, float]]:
+        if not self.documents:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.embeddings @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs) -> List[Any]:
+        return [self.documents[i] for i, _ in self._top_k(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Any]:
+        return self.similarity_search_by_vector(self.embed_query(query), k=k)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> List[Tuple[Any, float]]:
+        """Điểm = khoảng cách L2 giữa 2 vector chuẩn hoá (càng nhỏ càng gần, như Chroma)"""
+        return [(self.documents[i], float(np.sqrt(max(0.0, 2.0 - 2.0 * score))))
+                for i, score in self._top_k(self.embed_query(query), k)]
+
+    def as_retriever(self, search_type: str = "similarity", search_kwargs: Optional[Dict[str, Any]] = None,
+                     **kwargs) -> FrozenRetriever:
+        return FrozenRetriever(self, (search_kwargs or {}).get("k", 4))
+
+    # ================= Info =================
+    def get(self, **kwargs) -> Dict[str, Any]:
+        return {"ids": list(self.ids), "documents": [d.page_content for d in self.documents],
+                "metadatas": [d.metadata for d in self.documents]}
+
+    def get_document_count(self) -> int:
+        return len(self.documents)
+
+    def health_check(self) -> Dict[str, Any]:
+        return {"initialized": True, "document_count": len(self.documents), "status": "healthy", "frozen": True}
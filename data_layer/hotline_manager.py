@@ -1,3 +1,8 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
 class HotlineManager:
     def __init__(self):
         self.hotlines = {
@@ -25,7 +30,7 @@ class HotlineManager:
     def get_hotline(self, location: str) -> str:
         # Normalize key - xử lý nhiều trường hợp hơn
         key = location.lower().replace(" ", "_").replace("-", "_").replace(".", "")
-        print(f"🔍 Looking up hotline for key: '{key}'")
+        logger.debug("🔍 Looking up hotline for key: %r", key)
         
         # Kiểm tra trực tiếp
         if key in self.hotlines:
@@ -1,28 +1,33 @@
 import re
 import json
 import os
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
-from sentence_transformers import SentenceTransformer
 import numpy as np
 
-# ✅ Bổ sung import
-from PyPDF2 import PdfReader
-try:
-    from pdf2image import convert_from_path
-    import pytesseract
-    OCR_AVAILABLE = True
-except ImportError:
-    OCR_AVAILABLE = False
-from docx import Document as DocxDocument
-from pdf2image import convert_from_path
-import pytesseract
+# Thư viện nặng chỉ dùng khi ingest (PyPDF2, docx, pdf2image, pytesseract, sentence_transformers,
+# text splitter của LangChain) → import trong hàm dùng tới, process API không phải tải.
+
+
+def _ocr_available() -> bool:
+    try:
+        import pdf2image  # noqa: F401
+        import pytesseract  # noqa: F401
+        return True
+    except ImportError:
+        return False
 
 
 class UXOPreprocessor:
     def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2"):
         self.model_name = model_name
-        self.model = SentenceTransformer(model_name)
+        self._model = None
+
+    @property
+    def model(self):
+        """SentenceTransformer tải ở lần embed đầu tiên (đọc / chunk file không cần model)"""
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
 
     def clean_text(self, text: str) -> str:
         text = re.sub(r'<.*?>', '', text)
@@ -45,6 +50,7 @@ class UXOPreprocessor:
         return text
 
     def process_documents(self, documents):
+        from langchain.schema import Document
         processed_docs = []
         for doc in documents:
             content = self.clean_text(doc.page_content)
@@ -64,6 +70,7 @@ class UXOPreprocessor:
         return processed_docs
 
     def split_documents(self, documents, chunk_size=1000, chunk_overlap=200):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
         splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
@@ -98,6 +105,7 @@ class UXOPreprocessor:
     # ✅ Nâng cấp read_pdf: text + OCR nếu page rỗng
     def read_pdf(self, file_path: str) -> str:
         """Đọc PDF, ưu tiên text, fallback OCR nếu cần và có poppler"""
+        from PyPDF2 import PdfReader
         text = ""
         try:
             reader = PdfReader(file_path)
@@ -110,11 +118,13 @@ class UXOPreprocessor:
 
         # Nếu không đọc được text nào, thử OCR
         if not text.strip():
-            if not OCR_AVAILABLE:
+            if not _ocr_available():
                 print(f"⚠️ Không thể đọc text và OCR không khả dụng: {file_path}")
                 return ""
             try:
                 # OCR bằng pdf2image + pytesseract
+                from pdf2image import convert_from_path
+                import pytesseract
                 poppler_path = r"E:\Poppler\poppler-24.07.0\Library\bin"  # Cập nhật đường dẫn poppler nếu cần
                 images = convert_from_path(file_path, poppler_path=poppler_path)
                 for i, img in enumerate(images):
@@ -133,5 +143,6 @@ class UXOPreprocessor:
 
     # ✅ Bổ sung: đọc DOCX
     def read_docx(self, file_path: str) -> str:
+        from docx import Document as DocxDocument
         doc = DocxDocument(file_path)
         return "\n".join([para.text for para in doc.paragraphs if para.text.strip() != ""])
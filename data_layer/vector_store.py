@@ -1,37 +1,144 @@
-from langchain.vectorstores import Chroma
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.schema import BaseRetriever
-from typing import List, Dict, Any
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Dict, Any, Tuple
 import json
 import numpy as np
 import os
-from data_layer.preprocessor import UXOPreprocessor
+import threading
+from data_layer.frozen_index import FrozenVectorIndex
+
+if TYPE_CHECKING:
+    from langchain.schema import BaseRetriever
+
+
+def _chroma():
+    # Import khi load / tạo index lần đầu, không phải lúc import module
+    from langchain.vectorstores import Chroma
+    return Chroma
+
 
 class VectorStoreManager:
     def __init__(self, embedding_model="sentence-transformers/all-MiniLM-L6-v2"):
-        self.embedding_model = HuggingFaceEmbeddings(
-            model_name=embedding_model,
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': False}
-        )
+        # Model embedding (sentence_transformers) tải ở lần dùng đầu tiên: load_vector_store / embed_query
+        self.embedding_model_name = embedding_model
+        self._embedding_model = None
+        self._embedding_model_lock = threading.Lock()
         self.vector_store = None
         self.persist_directory = None
+        # LRU cache embedding câu hỏi (NLU kNN, cache... dùng chung, tránh encode lại)
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_cache_size = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 2048))
+        self._query_cache_lock = threading.Lock()
+        # Tăng mỗi khi index thay đổi trong process (cache câu trả lời dựa vào đây để tự xoá)
+        self.index_version = 0
+
+    @property
+    def embedding_model(self):
+        if self._embedding_model is None:
+            with self._embedding_model_lock:
+                if self._embedding_model is None:
+                    from langchain.embeddings import HuggingFaceEmbeddings
+                    self._embedding_model = HuggingFaceEmbeddings(
+                        model_name=self.embedding_model_name,
+                        model_kwargs={'device': 'cpu'},
+                        encode_kwargs={'normalize_embeddings': False}
+                    )
+        return self._embedding_model
+
+    def _bump_index_version(self):
+        self.index_version += 1
+
+    def index_fingerprint(self) -> Tuple[int, int]:
+        """
+        Dấu vết index: (version trong process, số document).
+        Số document để nhận ra re-index từ process khác (scripts.import_data, data_layer.run).
+        """
+        return self.index_version, self.get_document_count()
 
     # ✅ Mới: check vector store đã init chưa
     def is_initialized(self) -> bool:
         return self.vector_store is not None
 
+    def is_frozen(self) -> bool:
+        return isinstance(self.vector_store, FrozenVectorIndex)
+
+    def freeze(self):
+        """
+        Thay Chroma bằng snapshot chỉ-đọc trong RAM (data_layer.frozen_index) — app.serve dựng ở master
+        trước khi fork để các worker dùng chung. Sau đó không thêm / xoá tài liệu được (khởi động lại để nạp index mới).
+        """
+        if self.vector_store is None:
+            raise ValueError("Vector store chưa được khởi tạo")
+        self.vector_store = FrozenVectorIndex.from_chroma(self.vector_store, self.embed_query)
+        self._bump_index_version()
+        return self.vector_store
+
+    def _check_writable(self):
+        if self.is_frozen():
+            raise ValueError("Index đang ở chế độ chỉ-đọc (VECTOR_INDEX_FROZEN=1), không thể thay đổi tài liệu")
+
+    # ================== EMBEDDING CÂU HỎI ==================
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        arr = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(arr, axis=-1, keepdims=True)
+        return arr / np.maximum(norms, 1e-12)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """Embedding đã chuẩn hoá L2 (float32) của 1 câu, có LRU cache"""
+        with self._query_cache_lock:
+            cached = self._query_cache.get(text)
+            if cached is not None:
+                self._query_cache.move_to_end(text)
+                return cached
+        vector = self._normalize(self.embedding_model.embed_query(text))
+        with self._query_cache_lock:
+            self._query_cache[text] = vector
+            if len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Embedding chuẩn hoá cho nhiều câu trong 1 lần forward (ma trận n x d)"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self._normalize(self.embedding_model.embed_documents(list(texts)))
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """
+        Embedding chuẩn hoá cho nhiều câu hỏi trong 1 lần forward, đồng thời điền LRU cache của embed_query
+        (NLU kNN, semantic cache gọi embed_query sau đó sẽ hit cache). Hàng i ứng với texts[i].
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        vectors: Dict[str, np.ndarray] = {}
+        with self._query_cache_lock:
+            for text in texts:
+                cached = self._query_cache.get(text)
+                if cached is not None:
+                    vectors[text] = cached
+        missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+        if missing:
+            encoded = self._normalize(self.embedding_model.embed_documents(missing))
+            with self._query_cache_lock:
+                for text, vector in zip(missing, encoded):
+                    vectors[text] = vector
+                    self._query_cache[text] = vector
+                while len(self._query_cache) > self._query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return np.stack([vectors[text] for text in texts])
+
     # ================== CÁC HÀM CŨ ==================
     def create_vector_store(self, documents, persist_directory="./chroma_db",
                             json_path="data/uxo_full_documents.json",
                             npz_path="data/uxo_embeddings.npz"):
-        self.vector_store = Chroma.from_documents(
+        self.vector_store = _chroma().from_documents(
             documents=documents,
             embedding=self.embedding_model,
             persist_directory=persist_directory
         )
         self.vector_store.persist()
         self.persist_directory = persist_directory
+        self._bump_index_version()
 
         # Lưu JSON
         data = [{"content": doc.page_content, "metadata": doc.metadata} for doc in documents]
@@ -47,11 +154,12 @@ class VectorStoreManager:
         return self.vector_store
 
     def load_vector_store(self, persist_directory="./chroma_db"):
-        self.vector_store = Chroma(
+        self.vector_store = _chroma()(
             persist_directory=persist_directory,
             embedding_function=self.embedding_model
         )
         self.persist_directory = persist_directory
+        self._bump_index_version()
         return self.vector_store
 
     def load_or_create_vector_store(self, persist_directory="./chroma_db", force_create=False):
@@ -62,7 +170,7 @@ class VectorStoreManager:
         self.persist_directory = persist_directory
         if os.path.exists(persist_directory) and not force_create:
             try:
-                self.vector_store = Chroma(
+                self.vector_store = _chroma()(
                     persist_directory=persist_directory,
                     embedding_function=self.embedding_model
                 )
@@ -71,11 +179,12 @@ class VectorStoreManager:
                 print(f"⚠️ Không thể load vector store, sẽ tạo mới. Lỗi: {e}")
                 self.vector_store = None
         if self.vector_store is None:
-            self.vector_store = Chroma(
+            self.vector_store = _chroma()(
                 persist_directory=persist_directory,
                 embedding_function=self.embedding_model
             )
             print(f"✅ Tạo vector store mới tại {persist_directory}")
+        self._bump_index_version()
         return self.vector_store
 
     def search_similar_documents(self, query, k=5):
@@ -83,7 +192,7 @@ class VectorStoreManager:
             raise ValueError("Vector store chưa được khởi tạo")
         return self.vector_store.similarity_search(query, k=k)
 
-    def as_retriever(self, search_type: str = "similarity", k: int = 5, **kwargs) -> BaseRetriever:
+    def as_retriever(self, search_type: str = "similarity", k: int = 5, **kwargs) -> "BaseRetriever":
         if self.vector_store is None:
             raise ValueError("Vector store chưa được khởi tạo. Hãy load hoặc create vector store trước.")
         return self.vector_store.as_retriever(
@@ -91,9 +200,14 @@ class VectorStoreManager:
             search_kwargs={"k": k, **kwargs}
         )
 
-    def get_retriever(self, **kwargs) -> BaseRetriever:
+    def get_retriever(self, **kwargs) -> "BaseRetriever":
         return self.as_retriever(**kwargs)
 
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4) -> List[Any]:
+        if self.vector_store is None:
+            raise ValueError("Vector store chưa được khởi tạo")
+        return self.vector_store.similarity_search_by_vector(embedding, k=k)
+
     def similarity_search_with_score(self, query: str, k: int = 5) -> List[tuple]:
         if self.vector_store is None:
             raise ValueError("Vector store chưa được khởi tạo")
@@ -114,25 +228,29 @@ class VectorStoreManager:
         info = {
             "document_count": self.get_document_count(),
             "persist_directory": self.persist_directory,
-            "embedding_model": self.embedding_model.model_name
+            "embedding_model": self.embedding_model_name
         }
         return info
 
     def add_documents(self, documents: List[Any], persist: bool = True) -> List[str]:
+        self._check_writable()
         if not self.is_initialized():
             print("⚠️ Vector store chưa khởi tạo, sẽ tạo mới.")
             self.load_or_create_vector_store()
         ids = self.vector_store.add_documents(documents)
         if persist:
             self.vector_store.persist()
+        self._bump_index_version()
         return ids
 
     def delete_documents(self, ids: List[str], persist: bool = True) -> None:
         if self.vector_store is None:
             raise ValueError("Vector store chưa được khởi tạo")
+        self._check_writable()
         self.vector_store.delete(ids)
         if persist:
             self.vector_store.persist()
+        self._bump_index_version()
 
     def clear_vector_store(self) -> None:
         if self.vector_store is None:
@@ -142,6 +260,7 @@ class VectorStoreManager:
             if collection:
                 collection.delete(where={})
                 self.vector_store.persist()
+                self._bump_index_version()
         except Exception as e:
             print(f"Warning: Could not clear vector store: {e}")
 
@@ -194,6 +313,8 @@ class VectorStoreManager:
         """
         Import trực tiếp file PDF/TXT/DOCX vào vector store mà không ghi đè dữ liệu cũ
         """
+        self._check_writable()
+        from data_layer.preprocessor import UXOPreprocessor
         preprocessor = UXOPreprocessor()
         from langchain.schema import Document
         text = ""
@@ -219,6 +340,7 @@ class VectorStoreManager:
 
         ids = self.vector_store.add_documents(chunks)
         self.vector_store.persist()
+        self._bump_index_version()
         print(f"✅ Đã import {len(chunks)} chunks từ {file_path}")
         return ids
 
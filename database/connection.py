@@ -1,8 +1,10 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 
+from utils.prefork import register_after_fork
+
 # SQLite file
 DATABASE_FILE = "sql_app.db"
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -12,6 +14,9 @@ engine = create_engine(
     DATABASE_URL, connect_args={"check_same_thread": False}
 )
 
+# Worker sau fork không dùng lại kết nối trong pool của master (close=False: không đóng hộ master)
+register_after_fork(lambda: engine.dispose(close=False))
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -22,6 +27,16 @@ def get_db():
     finally:
         db.close()
 
+# Cột thêm sau khi bảng đã có dữ liệu (create_all không ALTER bảng cũ): (bảng, cột, kiểu SQL)
+ADDED_COLUMNS = [
+    ("chat_logs", "intent_source", "VARCHAR"),
+]
+
 def create_db_tables(models_module):
-    """Khởi tạo tất cả bảng từ models"""
+    """Khởi tạo tất cả bảng từ models, thêm cột mới vào bảng đã tồn tại"""
     models_module.Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, column, sql_type in ADDED_COLUMNS:
+            if column not in {c["name"] for c in inspector.get_columns(table)}:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {sql_type}"))
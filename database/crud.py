@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
 from . import models
 from .models import UXOReport
@@ -46,8 +46,9 @@ def get_all_admins(db: Session) -> List[models.Admin]:
 # =======================
 def create_chat_log(db: Session, session_id: str, message: str, response: str,
                     intent: Optional[str] = None, entities: Optional[Dict[str, Any]] = None,
-                    confidence: Optional[float] = None, user_id: Optional[int] = None):
-    """Tạo log chat mới"""
+                    confidence: Optional[float] = None, user_id: Optional[int] = None,
+                    intent_source: Optional[str] = None):
+    """Tạo log chat mới (intent_source: nguồn của intent — llm / llm_refined / rules / knn / degraded)"""
     chat_log = models.ChatLog(
         user_id=user_id,
         session_id=session_id,
@@ -56,6 +57,7 @@ def create_chat_log(db: Session, session_id: str, message: str, response: str,
         intent=intent,
         entities=entities,
         confidence=confidence,
+        intent_source=intent_source,
         created_at=datetime.utcnow()
     )
     db.add(chat_log)
@@ -98,6 +100,42 @@ def get_qa_logs(db: Session, session_id: str, limit: int = 50) -> List[models.QA
              .order_by(models.QALog.created_at.desc())\
              .limit(limit).all()
 
+# =======================
+# Labeled questions (cho intent classifier)
+# =======================
+def get_labeled_questions(db: Session, limit: int = 5000) -> List[Tuple[str, str]]:
+    """
+    Lấy cặp (câu hỏi, intent do LLM gán) từ chat_logs và qa_logs,
+    bỏ các nhãn lỗi/unknown và câu trùng lặp.
+    Chỉ lấy nhãn có nguồn "llm": nhãn của rule / kNN / degraded là output của chính classifier
+    (train lại trên đó → classifier tự củng cố lỗi của mình); "llm_refined" là nhãn LLM đã bị heuristic
+    ngữ cảnh sửa (vd: follow-up hotline) — phụ thuộc lượt trước, không đúng với riêng câu hỏi;
+    log cũ chưa ghi nguồn cũng bị bỏ.
+    """
+    skip_labels = {"", "unknown", "error"}
+    pairs: Dict[str, str] = {}
+
+    chat_rows = db.query(models.ChatLog.message, models.ChatLog.intent)\
+                  .filter(models.ChatLog.intent.isnot(None))\
+                  .filter(models.ChatLog.intent_source == "llm")\
+                  .order_by(models.ChatLog.created_at.desc())\
+                  .limit(limit).all()
+    for message, intent in chat_rows:
+        if message and intent not in skip_labels:
+            pairs.setdefault(message.strip(), intent)
+
+    qa_rows = db.query(models.QALog.question, models.QALog.nlu)\
+                .order_by(models.QALog.created_at.desc())\
+                .limit(limit).all()
+    for question, nlu in qa_rows:
+        if not isinstance(nlu, dict) or nlu.get("source") != "llm":
+            continue
+        intent = nlu.get("intent")
+        if question and intent and intent not in skip_labels:
+            pairs.setdefault(question.strip(), intent)
+
+    return list(pairs.items())
+
 # =======================
 # ImageDetectionLog CRUD
 # =======================
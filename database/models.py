@@ -40,6 +40,9 @@ class ChatLog(Base):
     intent = Column(String, nullable=True)
     entities = Column(JSON, nullable=True, default=dict)
     confidence = Column(Float, nullable=True)
+    # Nguồn của intent: llm | llm_refined (LLM + heuristic ngữ cảnh) | rules | knn | degraded
+    # — chỉ nhãn "llm" được dùng để train intent classifier
+    intent_source = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     def __repr__(self):
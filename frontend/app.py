@@ -164,21 +164,17 @@ def send_chat_message(prompt: str) -> str:
     try:
         response = requests.post(
             f"{API_URL}/ask",
-            json={"message": prompt, "session_id": st.session_state.session_id, "language": st.session_state.language}
+            json={"message": prompt, "session_id": st.session_state.session_id, "language": st.session_state.language},
+            # Header session → admission control giới hạn nhịp theo từng người dùng, không theo IP của Streamlit
+            # (IP của Streamlit phải nằm trong ADMISSION_TRUSTED_PEERS của API)
+            headers={"X-Session-ID": st.session_state.session_id}
         )
         if response.status_code == 200:
             result = response.json()
             bot_response = result["answer"]
             st.session_state.chat_history.append({"role": "assistant", "content": bot_response})
             save_session()
-            try:
-                requests.post(
-                    f"{API_URL}/admin/log-chat",
-                    json={"session_id": st.session_state.session_id, "message": prompt, "response": bot_response},
-                    headers=get_auth_headers()
-                )
-            except:
-                pass
+            # Server tự ghi chat log sau mỗi câu trả lời → không gọi /admin/log-chat nữa
             return bot_response
         elif response.status_code == 401:
             st.session_state.admin_token = None
@@ -188,6 +184,35 @@ def send_chat_message(prompt: str) -> str:
     except Exception as e:
         return f"❌ Lỗi API: {e}"
 
+def stream_chat_message(prompt: str):
+    """Gọi /ask/stream và yield từng đoạn câu trả lời (SSE) để hiển thị dần"""
+    try:
+        with requests.post(
+            f"{API_URL}/ask/stream",
+            json={"message": prompt, "session_id": st.session_state.session_id, "language": st.session_state.language},
+            headers={"X-Session-ID": st.session_state.session_id},
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                yield "❌ Lỗi kết nối đến chatbot."
+                return
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    event = None
+                    continue
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:") and event == "token":
+                    yield json.loads(line[len("data:"):].strip()).get("text", "")
+    except Exception as e:
+        yield f"❌ Lỗi API: {e}"
+
+def finish_chat_message(prompt: str, bot_response: str):
+    """Lưu câu trả lời đã stream xong vào lịch sử local (chat log do server ghi)"""
+    st.session_state.chat_history.append({"role": "assistant", "content": bot_response})
+    save_session()
+
 def switch_session(new_session_id: str):
     st.session_state.session_id = new_session_id
     st.session_state.chat_history = all_sessions.get(new_session_id, {}).get("chat_history", [])
@@ -331,9 +356,8 @@ if prompt:
     with st.chat_message("user"):
         st.markdown(prompt)
     with st.chat_message("assistant"):
-        with st.spinner("Đang xử lý..."):
-            bot_response = send_chat_message(prompt)
-            st.markdown(bot_response)
+        bot_response = st.write_stream(stream_chat_message(prompt))
+        finish_chat_message(prompt, bot_response)
 
 # ==============================
 # Chat logs admin (main page) với highlight
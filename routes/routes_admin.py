@@ -6,19 +6,29 @@ from datetime import datetime
 
 from database import models, crud, connection
 from utils.auth import create_access_token, get_current_admin
+from utils.executors import run_in
 from app.schemas import AdminLoginRequest, AdminLoginResponse, UXOReportCreate, UXOReportResponse
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
+# Truy vấn SQLite chạy trong pool "db" (báo cáo UXO: pool "report" riêng),
+# không dùng chung threadpool mặc định với các request chat đang chờ Gemini
+def _with_db(fn, *args, **kwargs):
+    db = connection.SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
 # ================================
 # Login Admin
 # ================================
 @router.post("/login", response_model=AdminLoginResponse)
-def login_admin(req: AdminLoginRequest, db: Session = Depends(connection.get_db)):
+async def login_admin(req: AdminLoginRequest):
     """
     Đăng nhập Admin, trả về access token
     """
-    admin = crud.authenticate_admin(db, email=req.email, password=req.password)
+    admin = await run_in("db", _with_db, crud.authenticate_admin, email=req.email, password=req.password)
     if not admin:
         raise HTTPException(status_code=401, detail="❌ Email hoặc mật khẩu không đúng")
 
@@ -29,23 +39,31 @@ def login_admin(req: AdminLoginRequest, db: Session = Depends(connection.get_db)
 # View chatlogs (Admin only)
 # ================================
 @router.get("/chatlogs")
-def view_all_chatlogs(skip: int = 0, limit: int = 100,
-                      db: Session = Depends(connection.get_db),
-                      current_admin=Depends(get_current_admin)):
+async def view_all_chatlogs(skip: int = 0, limit: int = 100,
+                            current_admin=Depends(get_current_admin)):
     """
     Lấy danh sách chat logs cho admin
     """
-    logs = crud.get_all_chatlogs(db, skip=skip, limit=limit)
+    logs = await run_in("db", _with_db, crud.get_all_chatlogs, skip=skip, limit=limit)
     return logs
 
 # ================================
 # Log chat message từ frontend
 # ================================
+def _insert_chat_log(db: Session, session_id: str, message: str, response_text: str) -> int:
+    db_chat = models.ChatLog(
+        session_id=session_id,
+        message=message,
+        response=response_text,
+        created_at=datetime.utcnow()
+    )
+    db.add(db_chat)
+    db.commit()
+    db.refresh(db_chat)
+    return db_chat.id
+
 @router.post("/log-chat")
-async def log_chat_message(
-    request: Request,
-    db: Session = Depends(connection.get_db)
-):
+async def log_chat_message(request: Request):
     """
     Frontend gửi log chat để lưu vào database
     body JSON: { "session_id": str, "message": str, "response": str }
@@ -63,26 +81,14 @@ async def log_chat_message(
         raise HTTPException(status_code=400, detail="❌ Thiếu trường dữ liệu cần thiết")
 
     # Lưu vào DB
-    db_chat = models.ChatLog(
-        session_id=session_id,
-        message=message,
-        response=response_text,
-        created_at=datetime.utcnow()
-    )
-    db.add(db_chat)
-    db.commit()
-    db.refresh(db_chat)
+    chat_id = await run_in("db", _with_db, _insert_chat_log, session_id, message, response_text)
 
-    return {"message": "✅ Chat log đã được lưu", "id": db_chat.id}
+    return {"message": "✅ Chat log đã được lưu", "id": chat_id}
 
 # ========================
 # USER: Gửi báo cáo UXO
 # ========================
-@router.post("/report-uxo", response_model=UXOReportResponse)
-def create_report(
-    req: UXOReportCreate,
-    db: Session = Depends(connection.get_db)
-):
+def _insert_report(db: Session, req: UXOReportCreate) -> models.UXOReport:
     db_report = models.UXOReport(
         latitude=req.latitude,
         longitude=req.longitude,
@@ -94,12 +100,16 @@ def create_report(
     db.refresh(db_report)
     return db_report
 
+@router.post("/report-uxo", response_model=UXOReportResponse)
+async def create_report(req: UXOReportCreate):
+    # Báo cáo khẩn cấp: pool "report" riêng → vẫn nhanh khi pool db đầy việc ghi log chat
+    return await run_in("report", _with_db, _insert_report, req)
+
 # ========================
 # ADMIN: Xem toàn bộ báo cáo UXO
 # ========================
 @router.get("/uxo-reports", response_model=List[UXOReportResponse])
-def get_all_reports(
-    db: Session = Depends(connection.get_db),
+async def get_all_reports(
     current_admin=Depends(get_current_admin)  # chỉ admin mới được xem
 ):
-    return db.query(models.UXOReport).all()
\ No newline at end of file
+    return await run_in("db", _with_db, lambda db: db.query(models.UXOReport).all())
\ No newline at end of file
@@ -0,0 +1,102 @@
+# scripts/bench_admission.py
+"""
+Quá tải gấp --overload lần năng lực xử lý: không có admission control (mọi request xếp hàng sau upstream,
+client timeout theo SLO) so với AdmissionMiddleware (429/503 nhanh, request được nhận xong trong SLO).
+Upstream giả lập: tối đa --capacity request cùng lúc, mỗi request --service giây (như hạn mức Gemini).
+
+Chạy:
+    python -m scripts.bench_admission --capacity 8 --service 0.2 --overload 3 --duration 10 --slo 2
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+import httpx
+from fastapi import FastAPI
+
+from utils.admission import AdmissionController, AdmissionMiddleware
+
+
+def build_app(capacity: int, service: float, controller: AdmissionController = None) -> FastAPI:
+    app = FastAPI()
+    upstream = asyncio.Semaphore(capacity)
+    if controller is not None:
+        app.add_middleware(AdmissionMiddleware, controller=controller, paths=("/ask",))
+
+    @app.post("/ask")
+    async def ask():
+        async with upstream:
+            await asyncio.sleep(service)
+        return {"answer": "ok"}
+
+    return app
+
+
+async def run_load(app: FastAPI, rate: float, duration: float, slo: float, sessions: int):
+    results = []
+
+    async def one(i: int):
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                client.post("/ask", headers={"X-Session-ID": f"bench-{i % sessions}"}), timeout=slo)
+            status = response.status_code
+        except asyncio.TimeoutError:
+            status = "timeout"
+        results.append((status, time.perf_counter() - start))
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        tasks, start, i = [], time.perf_counter(), 0
+        while time.perf_counter() - start < duration:
+            tasks.append(asyncio.ensure_future(one(i)))
+            i += 1
+            await asyncio.sleep(1 / rate)
+        await asyncio.gather(*tasks)
+    return results
+
+
+def report(name: str, results, slo: float):
+    statuses = Counter(status for status, _ in results)
+    ok = sorted(latency for status, latency in results if status == 200)
+    rejected = sorted(latency for status, latency in results if status in (429, 503))
+    within_slo = sum(1 for latency in ok if latency <= slo)
+    p95 = ok[max(0, int(len(ok) * 0.95) - 1)] * 1000 if ok else 0.0
+    print(f"{name:<10} {dict(statuses)}")
+    print(f"{'':<10} ok trong SLO={within_slo}/{len(results)}   ok p50="
+          f"{statistics.median(ok) * 1000 if ok else 0:>7.0f} ms   p95={p95:>7.0f} ms   "
+          f"từ chối p50={statistics.median(rejected) * 1000 if rejected else 0:>6.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark admission control khi quá tải")
+    parser.add_argument("--capacity", type=int, default=8, help="Số request upstream xử lý đồng thời")
+    parser.add_argument("--service", type=float, default=0.2, help="Giây xử lý mỗi request")
+    parser.add_argument("--overload", type=float, default=3.0, help="Tải gửi tới / năng lực xử lý")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--slo", type=float, default=2.0, help="Client timeout (giây)")
+    parser.add_argument("--sessions", type=int, default=1000)
+    args = parser.parse_args()
+
+    throughput = args.capacity / args.service
+    rate = throughput * args.overload
+    print(f"🔹 năng lực {throughput:.0f} req/s, gửi {rate:.0f} req/s trong {args.duration:.0f}s, SLO {args.slo}s")
+
+    results = asyncio.run(run_load(build_app(args.capacity, args.service), rate, args.duration, args.slo, args.sessions))
+    report("no-admit", results, args.slo)
+
+    # Concurrency = năng lực upstream, hàng đợi đủ cho ~nửa SLO
+    controller = AdmissionController(max_concurrency=args.capacity, max_queue=int(throughput * args.slo / 2),
+                                     queue_timeout=args.slo / 2, session_rate=100, session_burst=100)
+    results = asyncio.run(run_load(build_app(args.capacity, args.service, controller), rate, args.duration,
+                                   args.slo, args.sessions))
+    report("admission", results, args.slo)
+    stats = controller.get_stats()
+    print(f"📊 queue p95={stats['queue_ms_p95']} ms, service p95={stats['service_ms_p95']} ms, "
+          f"queue_full={stats['queue_full']}, predicted_timeout={stats['predicted_timeout']}, "
+          f"queue_timeout={stats['queue_timeout']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# scripts/bench_async_ask.py
+"""
+So sánh throughput pipeline /ask: đường threadpool (sync) vs đường async.
+
+Chạy:
+    python -m scripts.bench_async_ask --requests 500 --llm-latency 0.5
+
+Đường sync mô phỏng Starlette threadpool mặc định (40 thread): mỗi request giữ
+một thread suốt thời gian chờ Gemini. Đường async chạy tất cả request trên một event loop.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from ai_core.retrieval_qa import UXORetrievalQA
+from scripts.bench_fakes import FakeGeminiLLM, FakeVectorStore
+
+QUESTION = "Bom mìn chưa nổ nguy hiểm như thế nào?"
+
+
+def build_pipeline(llm_latency: float, retrieval_latency: float) -> UXORetrievalQA:
+    llm = FakeGeminiLLM(latency=llm_latency)
+    return UXORetrievalQA(llm=llm, vector_store=FakeVectorStore(latency=retrieval_latency))
+
+
+def report(name: str, latencies: List[float], elapsed: float):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<10} {len(latencies) / elapsed:>10.1f} req/s   "
+          f"p50={statistics.median(latencies) * 1000:>8.0f} ms   p95={p95 * 1000:>8.0f} ms")
+
+
+def run_threaded(qa: UXORetrievalQA, n: int, threads: int):
+    def one(i: int) -> float:
+        start = time.perf_counter()
+        session_id = f"bench-sync-{i}"
+        nlu_result = qa.nlu_processor.process_nlu(QUESTION, "vi", session_id)
+        qa.get_response(QUESTION, nlu_result["intent"], session_id, "vi", entities=nlu_result["entities"])
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(one, range(n)))
+    report("threaded", latencies, time.perf_counter() - start)
+
+
+async def run_async(qa: UXORetrievalQA, n: int):
+    async def one(i: int) -> float:
+        start = time.perf_counter()
+        session_id = f"bench-async-{i}"
+        nlu_result = await qa.nlu_processor.aprocess_nlu(QUESTION, "vi", session_id)
+        await qa.aget_response(QUESTION, nlu_result["intent"], session_id, "vi", entities=nlu_result["entities"])
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(n)))
+    report("async", list(latencies), time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /ask pipeline: threadpool vs async")
+    parser.add_argument("--requests", type=int, default=500, help="Số request đồng thời")
+    parser.add_argument("--threads", type=int, default=40, help="Kích thước threadpool (Starlette mặc định 40)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Độ trễ mỗi lần gọi LLM giả (giây)")
+    parser.add_argument("--retrieval-latency", type=float, default=0.02, help="Độ trễ retriever giả (giây)")
+    args = parser.parse_args()
+
+    print(f"🔹 {args.requests} requests, LLM latency {args.llm_latency}s, threadpool={args.threads}")
+    run_threaded(build_pipeline(args.llm_latency, args.retrieval_latency), args.requests, args.threads)
+    asyncio.run(run_async(build_pipeline(args.llm_latency, args.retrieval_latency), args.requests))
+
+
+if __name__ == "__main__":
+    main()
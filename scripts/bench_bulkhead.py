@@ -0,0 +1,82 @@
+# scripts/bench_bulkhead.py
+"""
+Độ trễ gửi báo cáo UXO khi chat đang quá tải: 1 threadpool chung (như threadpool mặc định 40 thread
+của Starlette) so với bulkhead (pool llm / db / report riêng, utils.executors).
+Chat giả lập: lời gọi LLM sync chậm (--llm-latency) + ghi chat log; báo cáo: 1 lần ghi SQLite (--db-latency).
+
+Chạy:
+    python -m scripts.bench_bulkhead --chat 1000 --reports 50 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from utils.executors import BoundedExecutor, ExecutorSaturatedError
+
+
+def report(name: str, latencies: List[float], rejected: int):
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{name:<10} report p50={statistics.median(latencies) * 1000:>8.1f} ms   "
+          f"p95={p95 * 1000:>8.1f} ms   max={latencies[-1] * 1000:>8.1f} ms   chat rejected={rejected}")
+
+
+async def scenario(pools: dict, chat: int, reports: int, llm_latency: float, db_latency: float):
+    rejected = 0
+    stop = asyncio.Event()
+
+    async def chat_client():
+        """1 client chat gửi liên tục → tải chat giữ ổn định suốt thời gian đo"""
+        nonlocal rejected
+        while not stop.is_set():
+            try:
+                await pools["llm"].run(time.sleep, llm_latency)
+                await pools["db"].run(time.sleep, db_latency)
+            except ExecutorSaturatedError:
+                rejected += 1
+                await asyncio.sleep(0.05)   # client nhận 503, thử lại sau
+
+    async def report_request() -> float:
+        start = time.perf_counter()
+        await pools["report"].run(time.sleep, db_latency)
+        return time.perf_counter() - start
+
+    clients = [asyncio.ensure_future(chat_client()) for _ in range(chat)]
+    await asyncio.sleep(0.2)   # chat đã chiếm hết thread trước khi báo cáo tới
+    latencies = []
+    for _ in range(reports):
+        latencies.append(await report_request())
+        await asyncio.sleep(0.05)
+    stop.set()
+    await asyncio.gather(*clients, return_exceptions=True)
+    return latencies, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulkhead executors (báo cáo UXO khi chat quá tải)")
+    parser.add_argument("--chat", type=int, default=1000, help="Số client chat gửi liên tục")
+    parser.add_argument("--reports", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--db-latency", type=float, default=0.005)
+    parser.add_argument("--shared-threads", type=int, default=40)
+    args = parser.parse_args()
+    print(f"🔹 {args.chat} client chat (LLM {args.llm_latency}s) liên tục, {args.reports} báo cáo UXO")
+
+    shared = BoundedExecutor("shared", args.shared_threads, max_queue=args.chat * 2 + args.reports)
+    latencies, rejected = asyncio.run(scenario(
+        {"llm": shared, "db": shared, "report": shared}, args.chat, args.reports, args.llm_latency, args.db_latency))
+    report("shared", latencies, rejected)
+    shared.shutdown()
+
+    bulkhead = {"llm": BoundedExecutor("llm", 32, 256), "db": BoundedExecutor("db", 8, 1024),
+                "report": BoundedExecutor("report", 2, 256)}
+    latencies, rejected = asyncio.run(scenario(bulkhead, args.chat, args.reports, args.llm_latency, args.db_latency))
+    report("bulkhead", latencies, rejected)
+    for pool in bulkhead.values():
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
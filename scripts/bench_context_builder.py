@@ -0,0 +1,107 @@
+# scripts/bench_context_builder.py
+"""
+Đo số token prompt tiết kiệm được khi ghép context bằng ContextBuilder so với nối nguyên văn chunk.
+Chunk được cắt như split_documents (chunk_size=1000, chunk_overlap=200); retrieval top-k mô phỏng
+bằng độ trùng từ khoá (hoặc embedding MiniLM với --embed, cần sentence-transformers).
+
+Chạy:
+    python -m scripts.bench_context_builder --file "docs/hotline_song_ngu.pdf" --k 4
+    python -m scripts.bench_context_builder --file README.md --embed
+"""
+import argparse
+import re
+import statistics
+import time
+from typing import List
+
+from ai_core.context_builder import ContextBuilder, estimate_tokens
+from ai_core.memory_manager import render_turn
+
+QUERIES = [
+    ("Bom mìn chưa nổ nguy hiểm như thế nào?", "definition"),
+    ("Tôi thấy vật lạ nghi là bom thì phải làm gì?", "safety_advice"),
+    ("Số hotline báo bom mìn ở Quảng Trị là gì?", "location_info"),
+    ("Cách báo cáo phát hiện vật nổ cho cơ quan chức năng?", "report_uxo"),
+    ("UXO là gì?", "general"),
+]
+
+HISTORY = [(
+    "Ở Quảng Bình có còn nhiều bom mìn không?",
+    "Quảng Bình vẫn còn nhiều khu vực bị ô nhiễm bom mìn, đặc biệt ở các huyện biên giới. "
+    "Bạn nên liên hệ cơ quan chức năng địa phương để biết thêm.",
+)] * 3
+
+
+def read_text(path: str) -> str:
+    if path.lower().endswith(".pdf"):
+        from PyPDF2 import PdfReader
+        return "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def split_chunks(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """Cắt cửa sổ chồng lấn tại ranh giới khoảng trắng (giống RecursiveCharacterTextSplitter về overlap)"""
+    text = re.sub(r"[ \t]+", " ", text).strip()
+    chunks, start = [], 0
+    while start < len(text):
+        end = min(len(text), start + chunk_size)
+        if end < len(text):
+            space = text.rfind(" ", start + chunk_size // 2, end)
+            end = space if space != -1 else end
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        next_start = end - chunk_overlap
+        space = text.find(" ", next_start)
+        start = space + 1 if space != -1 and space < end else next_start
+    return [c for c in chunks if c]
+
+
+def keyword_top_k(query: str, chunks: List[str], k: int) -> List[str]:
+    words = set(re.findall(r"\w+", query.lower()))
+    scored = sorted(range(len(chunks)),
+                    key=lambda i: -len(words & set(re.findall(r"\w+", chunks[i].lower()))))
+    return [chunks[i] for i in scored[:k]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ContextBuilder (token tiết kiệm)")
+    parser.add_argument("--file", default="docs/hotline_song_ngu.pdf", help="Tài liệu nguồn (.pdf/.txt/.md)")
+    parser.add_argument("--k", type=int, default=4, help="Số chunk retrieval")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--embed", action="store_true", help="Xếp hạng câu + retrieval bằng embedding MiniLM")
+    args = parser.parse_args()
+
+    chunks = split_chunks(read_text(args.file), args.chunk_size, args.chunk_overlap)
+    print(f"🔹 {len(chunks)} chunks từ {args.file} (size={args.chunk_size}, overlap={args.chunk_overlap}), k={args.k}")
+
+    builder = ContextBuilder()
+    retrieve = lambda q: keyword_top_k(q, chunks, args.k)
+    if args.embed:
+        from data_layer.vector_store import vector_store_manager
+        builder = ContextBuilder(embed_query=vector_store_manager.embed_query,
+                                 embed_texts=vector_store_manager.embed_texts)
+        chunk_matrix = vector_store_manager.embed_texts(chunks)
+        retrieve = lambda q: [chunks[i] for i in (-(chunk_matrix @ vector_store_manager.embed_query(q))).argsort()[:args.k]]
+
+    latencies = []
+    for query, intent in QUERIES:
+        docs = retrieve(query)
+        before = estimate_tokens("\n".join(docs)) + sum(estimate_tokens(render_turn(*turn)) for turn in HISTORY)
+        start = time.perf_counter()
+        context, history = builder.build(query, docs, intent, HISTORY)
+        latencies.append((time.perf_counter() - start) * 1000)
+        after = estimate_tokens(context) + estimate_tokens(history)
+        print(f"{intent:<14} budget={builder.budget_for(intent):>4}  tokens {before:>5} → {after:>5}  "
+              f"(-{(before - after) / max(before, 1):.0%})  {latencies[-1]:6.2f} ms")
+
+    stats = builder.get_stats()
+    print(f"📊 tokens_saved={stats['tokens_saved']} ({stats['saved_ratio']:.0%}), "
+          f"overlap_chars={stats['overlap_chars']}, duplicate_chunks={stats['duplicate_chunks']}, "
+          f"build median={statistics.median(latencies):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# scripts/bench_fakes.py
+"""
+LLM / vector store giả lập độ trễ mạng để benchmark pipeline mà không tốn quota Gemini.
+Dùng chung cho các script bench_*.py
+"""
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from ai_core.llm_chain import GeminiLLM
+
+FAKE_NLU_OUTPUT = {
+    "intent": "definition",
+    "confidence": 0.9,
+    "entities": {"location": [], "uxo_type": ["bom"], "action": []},
+}
+
+FAKE_ANSWER = (
+    "Bom mìn chưa nổ (UXO) là vật nổ còn sót lại sau chiến tranh. "
+    "Không chạm vào vật nghi ngờ và gọi ngay hotline địa phương."
+)
+
+
+# ================= Fake LLM =================
+class FakeGeminiLLM(GeminiLLM):
+    """GeminiLLM giả: ngủ `latency` giây rồi trả kết quả cố định (JSON cho prompt NLU)."""
+
+    def __init__(self, latency: float = 0.5):
+        self.model = "fake-gemini"
+        self.temperature = 0.0
+        self.latency = latency
+        self.calls = 0
+
+    def _fake_output(self, prompt: str) -> str:
+        self.calls += 1
+        if "JSON" in prompt:
+            return json.dumps(FAKE_NLU_OUTPUT, ensure_ascii=False)
+        return FAKE_ANSWER
+
+    def invoke(self, inputs, config=None, **kwargs) -> str:
+        time.sleep(self.latency)
+        return self._fake_output(self._build_prompt(inputs))
+
+    async def ainvoke(self, inputs, config=None, **kwargs) -> str:
+        await asyncio.sleep(self.latency)
+        return self._fake_output(self._build_prompt(inputs))
+
+
+# ================= Fake vector store =================
+@dataclass
+class FakeDocument:
+    page_content: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+class FakeRetriever:
+    def __init__(self, docs: List[FakeDocument], latency: float):
+        self.docs = docs
+        self.latency = latency
+
+    def get_relevant_documents(self, query: str) -> List[FakeDocument]:
+        time.sleep(self.latency)
+        return list(self.docs)
+
+    async def aget_relevant_documents(self, query: str) -> List[FakeDocument]:
+        await asyncio.sleep(self.latency)
+        return list(self.docs)
+
+
+class FakeVectorStore:
+    def __init__(self, latency: float = 0.02, n_docs: int = 4):
+        self.latency = latency
+        self.docs = [
+            FakeDocument(page_content=f"Tài liệu UXO số {i}. {FAKE_ANSWER}", metadata={"source": f"fake_{i}"})
+            for i in range(n_docs)
+        ]
+
+    def as_retriever(self, **kwargs) -> FakeRetriever:
+        return FakeRetriever(self.docs, self.latency)
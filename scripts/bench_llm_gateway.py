@@ -0,0 +1,151 @@
+# scripts/bench_llm_gateway.py
+"""
+So sánh gọi LLM trực tiếp (không kiểm soát) vs qua GeminiGateway trên server Gemini giả lập.
+Script tự bật scripts.fake_llm_server (tắt bằng --no-spawn nếu server đã chạy sẵn).
+
+Chạy:
+    python -m scripts.bench_llm_gateway --requests 400 --server-rpm 600 --client-rpm 570
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ai_core.llm_gateway import GeminiGateway
+
+PATH = "/v1beta/models/gemini-1.5-flash:generateContent"
+
+
+class FakeServerError(Exception):
+    """Lỗi HTTP từ server giả — có status_code / retry_after giống client thật để gateway phân loại"""
+
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+async def post_json(host: str, port: int, path: str, payload: Dict[str, Any]) -> Tuple[int, Dict[str, str], bytes]:
+    """HTTP/1.1 POST tối giản trên asyncio streams (không cần thêm thư viện client)"""
+    body = json.dumps(payload).encode("utf-8")
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+        raw = await reader.read()
+    finally:
+        writer.close()
+    head, _, content = raw.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = {k.strip().lower(): v.strip() for k, _, v in (line.partition(":") for line in lines[1:])}
+    return status, headers, content
+
+
+async def generate(host: str, port: int, prompt: str) -> str:
+    status, headers, _ = await post_json(host, port, PATH, {"contents": [{"parts": [{"text": prompt}]}]})
+    if status != 200:
+        retry_after = float(headers["retry-after"]) if "retry-after" in headers else None
+        raise FakeServerError(status, retry_after)
+    return "ok"
+
+
+def report(name: str, latencies: List[float], failures: int, elapsed: float):
+    ok = sorted(latencies)
+    if ok:
+        p50 = statistics.median(ok) * 1000
+        p99 = ok[min(len(ok) - 1, int(len(ok) * 0.99))] * 1000
+    else:
+        p50 = p99 = 0.0
+    print(f"{name:<8} ok={len(ok):>5} failed={failures:>5}   {len(ok) / elapsed:>7.1f} ok/s   "
+          f"p50={p50:>7.0f} ms   p99={p99:>7.0f} ms")
+
+
+async def run(name: str, n: int, call) -> None:
+    latencies: List[float] = []
+    failures = 0
+
+    async def one(i: int):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            await call(f"câu hỏi {i}")
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    report(name, latencies, failures, time.perf_counter() - start)
+
+
+async def wait_for_port(host: str, port: int, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Fake server {host}:{port} không khởi động được")
+
+
+async def main_async(args):
+    host, port = args.host, args.port
+    await wait_for_port(host, port)
+
+    await run("direct", args.requests, lambda prompt: generate(host, port, prompt))
+
+    # Chờ quota server hồi lại trước khi chạy lượt 2
+    await asyncio.sleep(args.cooldown)
+    gateway = GeminiGateway(
+        requests_per_minute=args.client_rpm, burst=args.client_burst,
+        max_limit=args.max_concurrency, max_retries=args.max_retries, timeout=10,
+    )
+    await run("gateway", args.requests, lambda prompt: gateway.acall(lambda: generate(host, port, prompt)))
+    print(f"📊 Gateway stats: {gateway.get_stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GeminiGateway trên server Gemini giả lập")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--requests", type=int, default=400, help="Số request bắn cùng lúc")
+    parser.add_argument("--server-rpm", type=float, default=600, help="Quota của server giả")
+    parser.add_argument("--server-burst", type=float, default=20)
+    parser.add_argument("--server-concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--client-rpm", type=float, default=570, help="GEMINI_RPM phía client (≈95% quota)")
+    parser.add_argument("--client-burst", type=float, default=10)
+    parser.add_argument("--max-concurrency", type=float, default=32)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--cooldown", type=float, default=3.0, help="Nghỉ giữa 2 lượt (giây)")
+    parser.add_argument("--no-spawn", action="store_true", help="Không tự bật fake server")
+    args = parser.parse_args()
+
+    server = None
+    if not args.no_spawn:
+        server = subprocess.Popen([
+            sys.executable, "-m", "scripts.fake_llm_server", "--host", args.host, "--port", str(args.port),
+            "--rpm", str(args.server_rpm), "--burst", str(args.server_burst),
+            "--max-concurrency", str(args.server_concurrency), "--latency", str(args.latency),
+        ])
+    try:
+        print(f"🔹 {args.requests} requests, server quota {args.server_rpm} rpm, client rate {args.client_rpm} rpm")
+        asyncio.run(main_async(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
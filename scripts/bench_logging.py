@@ -0,0 +1,130 @@
+# scripts/bench_logging.py
+"""
+Throughput của event loop khi log trên đường /ask: mỗi request mô phỏng các sự kiện log của pipeline
+(câu hỏi, raw output LLM của NLU, NLU cuối, định tuyến, lưu memory...) xen giữa các lần chờ LLM giả.
+Sink mô phỏng stdout chậm (pipe đầy / log driver của container): mỗi lần ghi chặn --sink-latency µs.
+  print : print() đồng bộ mọi sự kiện (trước đây: print trên hot path + logger NLU ép DEBUG)
+  sync  : logging StreamHandler đồng bộ, JSON, DEBUG không sampling
+  queue : utils.logging_setup — QueueHandler + thread ghi nền, JSON, DEBUG sampling (--sample-rate)
+  off   : không ghi log (trần throughput)
+
+Chạy:
+    python -m scripts.bench_logging --requests 5000 --concurrency 200 --sink-latency 100
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+from typing import List
+
+from utils.logging_setup import (JSONFormatter, configure_logging, get_logging_stats, reset_request_id,
+                                 set_request_id, shutdown_logging)
+
+RAW_LLM_OUTPUT = json.dumps({"intent": "ask_hotline", "confidence": 0.93,
+                             "entities": {"location": ["Quảng Trị"], "object": ["bom bi"]},
+                             "reasoning": "Người dùng hỏi số điện thoại báo cáo vật nổ " * 8}, ensure_ascii=False)
+
+
+class SlowSink:
+    """File-like: mỗi write chặn latency giây (như stdout bị đầy)"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.writes = 0
+
+    def write(self, text: str):
+        self.writes += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def flush(self):
+        pass
+
+
+def emit(mode: str, sink: SlowSink, level: int, logger: logging.Logger, msg: str, *args):
+    if mode == "print":
+        print(msg % args if args else msg, file=sink)
+    elif mode != "off":
+        logger.log(level, msg, *args)
+
+
+async def handle(i: int, mode: str, sink: SlowSink, llm_latency: float) -> float:
+    app_log, nlu_log, qa_log = (logging.getLogger(f"bench.{name}") for name in ("app", "nlu", "qa"))
+    question = f"Số hotline báo bom mìn ở Quảng Trị? ({i})"
+    tokens = set_request_id()
+    start = time.perf_counter()
+    try:
+        emit(mode, sink, logging.INFO, app_log, "📥 Question from session bench-%d: %s", i, question)
+        await asyncio.sleep(llm_latency)                       # NLU
+        emit(mode, sink, logging.DEBUG, nlu_log, "🔹 Raw LLM output: %s", RAW_LLM_OUTPUT)
+        emit(mode, sink, logging.DEBUG, nlu_log, "✅ Parsed JSON: %s", RAW_LLM_OUTPUT)
+        emit(mode, sink, logging.DEBUG, nlu_log, "✅ Final NLU output: %s", RAW_LLM_OUTPUT)
+        emit(mode, sink, logging.DEBUG, qa_log, "🧠 CONTEXT AWARE: current_intent=%r, question=%r",
+             "ask_hotline", question)
+        emit(mode, sink, logging.DEBUG, qa_log, "🔍 Processing hotline request: %r", question)
+        await asyncio.sleep(llm_latency)                       # sinh câu trả lời
+        emit(mode, sink, logging.DEBUG, qa_log, "💾 Saved context: %.50s... | intent=%s", question, "ask_hotline")
+        emit(mode, sink, logging.INFO, app_log, "✅ Answered session bench-%d", i)
+    finally:
+        reset_request_id(tokens)
+    return time.perf_counter() - start
+
+
+async def run_mode(mode: str, args, sink: SlowSink) -> List[float]:
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int) -> float:
+        async with semaphore:
+            return await handle(i, mode, sink, args.llm_latency)
+
+    return await asyncio.gather(*(one(i) for i in range(args.requests)))
+
+
+def setup(mode: str, sink: SlowSink, sample_rate: float):
+    shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if mode == "queue":
+        configure_logging(level="INFO", fmt="json", module_levels="bench=DEBUG", sample_rate=sample_rate,
+                          stream=sink)
+    elif mode == "sync":
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(JSONFormatter())
+        root.addHandler(handler)
+        root.setLevel(logging.DEBUG)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark logging trên đường request: print / sync / queue")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=0.005, help="Mỗi lần chờ LLM giả (giây)")
+    parser.add_argument("--sink-latency", type=float, default=100, help="Độ trễ mỗi lần ghi stdout (µs)")
+    parser.add_argument("--sample-rate", type=float, default=0.01, help="Tỉ lệ request được ghi log DEBUG")
+    parser.add_argument("--modes", default="off,print,sync,queue")
+    args = parser.parse_args()
+
+    print(f"🔹 {args.requests} requests, concurrency {args.concurrency}, sink {args.sink_latency:.0f} µs/ghi, "
+          f"debug sample {args.sample_rate}")
+    print(f"{'mode':<7}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'dòng ghi':>10}{'drain ms':>10}")
+    for mode in args.modes.split(","):
+        sink = SlowSink(args.sink_latency / 1e6)
+        setup(mode, sink, args.sample_rate)
+        start = time.perf_counter()
+        latencies = sorted(asyncio.run(run_mode(mode, args, sink)))
+        elapsed = time.perf_counter() - start
+        stats = get_logging_stats() if mode == "queue" else {}
+        drain_start = time.perf_counter()
+        shutdown_logging()   # queue: đợi thread nền ghi hết (không tính vào thời gian request)
+        drain_ms = (time.perf_counter() - drain_start) * 1000
+        print(f"{mode:<7}{len(latencies) / elapsed:>10.1f}{statistics.median(latencies) * 1000:>9.1f}"
+              f"{latencies[int(len(latencies) * 0.99) - 1] * 1000:>9.1f}{sink.writes:>10}{drain_ms:>10.0f}"
+              + (f"   dropped={stats['dropped']}" if stats.get("dropped") else ""))
+    logging.getLogger().handlers.clear()
+
+
+if __name__ == "__main__":
+    main()
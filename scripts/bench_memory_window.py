@@ -0,0 +1,105 @@
+# scripts/bench_memory_window.py
+"""
+So sánh ConversationWindow (ring buffer + lịch sử render sẵn) với ConversationBufferWindowMemory
+của LangChain (cách cũ: load_memory_variables + ghép chuỗi mỗi request):
+  - bộ nhớ / session (tracemalloc, sau khi đã lưu --turns lượt)
+  - độ trễ render lịch sử và lấy tin nhắn assistant cuối
+LangChain không cài → chỉ đo ConversationWindow.
+
+Chạy:
+    python -m scripts.bench_memory_window --sessions 5000 --turns 10 --k 3
+"""
+import argparse
+import contextlib
+import gc
+import os
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+from ai_core.memory_manager import UXOMemoryManager
+
+QUESTION = "Tôi thấy vật lạ giống đầu đạn ở bờ ruộng số {i}, nên làm gì?"
+ANSWER = "Không chạm vào, đánh dấu khu vực, giữ khoảng cách an toàn và gọi ngay hotline địa phương. " * 3
+
+
+class LangChainMemoryBaseline:
+    """Bản sao hành vi cũ của UXOMemoryManager trên ConversationBufferWindowMemory"""
+
+    def __init__(self, k: int):
+        from langchain.memory import ConversationBufferWindowMemory
+        self._cls = ConversationBufferWindowMemory
+        self.k = k
+        self.memories: Dict[str, object] = {}
+
+    def save_context(self, session_id: str, user_input: str, assistant_output: str, intent: str = None):
+        memory = self.memories.get(session_id)
+        if memory is None:
+            memory = self.memories[session_id] = self._cls(
+                k=self.k, return_messages=True, memory_key="chat_history", output_key="output")
+        memory.save_context({"input": user_input}, {"output": assistant_output})
+
+    def get_chat_history(self, session_id: str) -> str:
+        chat_history = self.memories[session_id].load_memory_variables({}).get("chat_history", [])
+        history_text = ""
+        for msg in chat_history:
+            role = "User" if msg.type == "human" else "Assistant"
+            history_text += f"{role}: {msg.content}\n"
+        return history_text
+
+    def get_last_assistant_message(self, session_id: str) -> str:
+        for m in reversed(self.memories[session_id].chat_memory.messages):
+            if m.type != "human":
+                return m.content
+        return ""
+
+
+def measure(name: str, factory: Callable[[], object], sessions: int, turns: int, repeat: int):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    manager = factory()
+    # save_context in log mỗi lượt → bỏ output khi đo
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for s in range(sessions):
+            for i in range(turns):
+                manager.save_context(f"session-{s}", QUESTION.format(i=i), ANSWER, "safety_advice")
+    gc.collect()
+    per_session = (tracemalloc.get_traced_memory()[0] - before) / sessions
+    tracemalloc.stop()
+
+    session_ids = [f"session-{s % sessions}" for s in range(repeat)]
+    start = time.perf_counter()
+    for sid in session_ids:
+        manager.get_chat_history(sid)
+    render_us = (time.perf_counter() - start) / repeat * 1e6
+
+    start = time.perf_counter()
+    for sid in session_ids:
+        manager.get_last_assistant_message(sid)
+    last_us = (time.perf_counter() - start) / repeat * 1e6
+
+    print(f"{name:<22} {per_session / 1024:>9.1f} KB/session   render={render_us:>8.2f} µs   "
+          f"last_assistant={last_us:>7.2f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark memory hội thoại: ring buffer vs LangChain")
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--turns", type=int, default=10, help="Số lượt lưu cho mỗi session")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20000, help="Số lần đọc lịch sử khi đo latency")
+    args = parser.parse_args()
+
+    print(f"🔹 {args.sessions} sessions × {args.turns} turns, k={args.k}")
+    measure("ConversationWindow", lambda: UXOMemoryManager(k=args.k), args.sessions, args.turns, args.repeat)
+    try:
+        LangChainMemoryBaseline(args.k)
+    except ImportError:
+        print("⚠️ LangChain chưa cài → bỏ qua baseline ConversationBufferWindowMemory")
+        return
+    measure("LangChain buffer", lambda: LangChainMemoryBaseline(args.k), args.sessions, args.turns, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
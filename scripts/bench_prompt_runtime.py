@@ -0,0 +1,134 @@
+# scripts/bench_prompt_runtime.py
+"""
+Overhead của chain runtime (không tính thời gian LLM — LLM giả trả JSON ngay):
+  - prompt_runtime: PromptChain (template tách sẵn, gọi thẳng llm.invoke, parse 1 lần bằng raw_decode)
+  - legacy-parse:   cùng prompt nhưng parse kiểu cũ (regex → json.loads → json.dumps → regex → json.loads)
+  - langchain:      LLMChain + PromptTemplate + parser cũ (cách cũ của NLUProcessor, cần LangChain)
+và thời gian import (process mới, đo bằng perf_counter quanh lệnh import) của prompt_runtime so với LangChain.
+LangChain không cài → bỏ qua các dòng langchain.
+
+Chạy:
+    python -m scripts.bench_prompt_runtime --calls 20000 --import-runs 5
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable
+
+from ai_core.prompt_runtime import JSONOutputParser, PromptChain, PromptTemplate
+
+TEMPLATE = """
+Phân tích câu hỏi sau: xác định ý định (intent) của người dùng và trích xuất thực thể (entities).
+Câu hỏi: {question}
+Ngôn ngữ: {language}
+
+Trả lời dưới dạng JSON với cấu trúc:
+{{
+    "intent": "tên_intent",
+    "confidence": số_thập_phân_từ_0_đến_1,
+    "entities": {{"location": [], "uxo_type": [], "action": []}}
+}}
+"""
+INPUTS = {"question": "Tôi thấy vật lạ giống quả bom ở Quảng Trị, nên làm gì?", "language": "vi"}
+LLM_OUTPUT = "```json\n" + json.dumps({
+    "intent": "safety_advice", "confidence": 0.92,
+    "entities": {"location": ["Quảng Trị"], "uxo_type": ["bom"], "action": []},
+}, ensure_ascii=False) + "\n```"
+
+
+class InstantLLM:
+    def invoke(self, inputs, config=None, **kwargs) -> str:
+        return LLM_OUTPUT
+
+
+def legacy_parse(text: str) -> dict:
+    """NLUOutputParser cũ (regex \\{.*\\} + json.loads)"""
+    match = re.search(r'\{.*\}', text, re.DOTALL)
+    return json.loads(match.group()) if match else {}
+
+
+def legacy_double_parse(raw) -> dict:
+    """NLUProcessor._parse_chain_output cũ: dict đã parse → json.dumps → parse lại"""
+    output = raw["answer"] if isinstance(raw, dict) and "answer" in raw else raw
+    if isinstance(output, dict):
+        output = json.dumps(output, ensure_ascii=False)
+    return legacy_parse(output)
+
+
+def per_call_us(fn: Callable[[], object], calls: int) -> float:
+    for _ in range(min(calls, 200)):
+        fn()
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def import_ms(statement: str, runs: int) -> float:
+    code = f"import time; t = time.perf_counter(); {statement}; print((time.perf_counter() - t) * 1000)"
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if out.returncode != 0:
+            return None
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def build_langchain_chain():
+    try:
+        from langchain.chains import LLMChain
+        from langchain.prompts import PromptTemplate as LCPromptTemplate
+        from langchain_core.language_models.fake import FakeListLLM
+        from langchain_core.output_parsers import BaseOutputParser
+    except ImportError:
+        return None
+
+    class LegacyParser(BaseOutputParser):
+        def parse(self, text: str) -> dict:
+            return legacy_parse(text)
+
+    llm = FakeListLLM(responses=[LLM_OUTPUT])
+    prompt = LCPromptTemplate(template=TEMPLATE, input_variables=["question", "language"])
+    return LLMChain(llm=llm, prompt=prompt, output_parser=LegacyParser(), output_key="answer")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark overhead chain runtime (prompt_runtime vs LangChain)")
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--import-runs", type=int, default=5)
+    args = parser.parse_args()
+
+    chain = PromptChain(InstantLLM(), PromptTemplate(TEMPLATE, ["question", "language"]), JSONOutputParser())
+    legacy_llm = InstantLLM()
+    print(f"🔹 Overhead / lời gọi NLU ({args.calls} lần, LLM giả trả ngay):")
+    print(f"{'prompt_runtime':<16} {per_call_us(lambda: chain.run(INPUTS), args.calls):>9.1f} µs")
+
+    def legacy_call():
+        raw = {**INPUTS, "answer": legacy_parse(legacy_llm.invoke(TEMPLATE.format(**INPUTS)))}
+        return legacy_double_parse(raw)
+
+    print(f"{'legacy-parse':<16} {per_call_us(legacy_call, args.calls):>9.1f} µs")
+
+    lc_chain = build_langchain_chain()
+    if lc_chain is None:
+        print(f"{'langchain':<16}   (bỏ qua: chưa cài LangChain)")
+    else:
+        lc_calls = max(1, args.calls // 10)
+        print(f"{'langchain':<16} {per_call_us(lambda: legacy_double_parse(lc_chain.invoke(INPUTS)), lc_calls):>9.1f} µs")
+
+    print(f"🔹 Thời gian import (median {args.import_runs} process):")
+    for name, statement in (
+        ("prompt_runtime", "import ai_core.prompt_runtime"),
+        ("langchain", "import langchain.chains, langchain.prompts, langchain_core.output_parsers"),
+    ):
+        ms = import_ms(statement, args.import_runs)
+        print(f"{name:<16} " + (f"{ms:>9.1f} ms" if ms is not None else "  (bỏ qua: import lỗi / chưa cài)"))
+
+
+if __name__ == "__main__":
+    main()
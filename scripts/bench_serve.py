@@ -0,0 +1,207 @@
+# scripts/bench_serve.py
+"""
+So sánh bộ nhớ / throughput khi chạy nhiều worker:
+  uvicorn  : `uvicorn app.main:app --workers N` — mỗi worker tự import app.main (model embedding, index...)
+  preload  : `python -m app.serve --workers N` — nạp một lần ở master rồi fork (copy-on-write)
+Với mỗi N: đợi /health/ready (warm-up xong), bắn tải POST /ask (mỗi request 1 X-Session-ID riêng, câu hỏi khác nhau để không
+trúng cache) trong --duration giây, rồi đọc bộ nhớ từng worker từ /proc/<pid>/smaps_rollup:
+  RSS: trang nhớ đang dùng (tính cả phần dùng chung → cộng RSS các worker sẽ đếm trùng)
+  PSS: phần dùng chung chia đều cho các process dùng nó → tổng PSS = bộ nhớ thật của cả nhóm
+  USS: trang riêng của worker (bị ghi sau fork)
+Gemini trỏ vào scripts.fake_llm_server (không tốn quota). Chỉ chạy trên Linux (/proc).
+
+Chạy:
+    python -m scripts.bench_serve --workers 1,2,4,8 --duration 20 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+QUESTIONS = [
+    "Bom mìn chưa nổ nguy hiểm như thế nào?",
+    "Tôi phát hiện vật lạ nghi là bom ở vườn nhà, phải làm gì?",
+    "Số hotline báo cáo bom mìn ở Quảng Trị là bao nhiêu?",
+    "Trẻ em cần được dạy gì để an toàn với vật nổ?",
+    "Quy trình rà phá bom mìn diễn ra ra sao?",
+]
+
+
+def children(pid: int) -> List[int]:
+    result = []
+    for task in Path(f"/proc/{pid}/task").iterdir():
+        text = (task / "children").read_text().split()
+        result.extend(int(p) for p in text)
+    return result
+
+
+def worker_pids(master: int) -> List[int]:
+    pids = []
+    for pid in children(master):
+        try:
+            cmdline = Path(f"/proc/{pid}/cmdline").read_bytes()
+        except FileNotFoundError:
+            continue
+        if b"resource_tracker" not in cmdline:
+            pids.append(pid)
+    return pids
+
+
+def memory_kb(pid: int) -> Dict[str, int]:
+    values = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        key, value = line.split(":", 1)
+        values[key] = int(value.split()[0])
+    return {"rss": values["Rss"], "pss": values["Pss"],
+            "uss": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)}
+
+
+async def wait_ready(base_url: str, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=5) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/health/ready")).status_code == 200:
+                    return True
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    return False
+
+
+async def load(base_url: str, duration: float, concurrency: int, tag: str) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+    counter = 0
+    stop_at = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def user(client: httpx.AsyncClient):
+        nonlocal errors, counter
+        while time.monotonic() < stop_at:
+            counter += 1
+            i = counter
+            payload = {"message": f"{QUESTIONS[i % len(QUESTIONS)]} ({tag}-{i})", "language": "vi"}
+            start = time.perf_counter()
+            try:
+                response = await client.post("/ask", json=payload, headers={"X-Session-ID": f"bench-{tag}-{i}"})
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        await asyncio.gather(*(user(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p95": latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000 if latencies else 0.0,
+        "errors": errors,
+    }
+
+
+def server_command(mode: str, workers: int, port: int) -> List[str]:
+    if mode == "preload":
+        return [sys.executable, "-m", "app.serve", "--workers", str(workers), "--host", "127.0.0.1",
+                "--port", str(port)]
+    return [sys.executable, "-m", "uvicorn", "app.main:app", "--workers", str(workers), "--host", "127.0.0.1",
+            "--port", str(port), "--log-level", "warning"]
+
+
+def run_one(mode: str, workers: int, args, env: Dict[str, str]) -> Dict[str, float]:
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(server_command(mode, workers, args.port), env=env)
+    try:
+        if not asyncio.run(wait_ready(base_url, args.startup_timeout)):
+            raise RuntimeError(f"{mode} x{workers}: server không sẵn sàng sau {args.startup_timeout}s")
+        deadline = time.monotonic() + args.startup_timeout
+        while len(worker_pids(server.pid)) < workers and time.monotonic() < deadline:
+            time.sleep(0.5)
+        asyncio.run(load(base_url, args.warmup, args.concurrency, f"{mode}{workers}-warm"))
+        result = asyncio.run(load(base_url, args.duration, args.concurrency, f"{mode}{workers}"))
+
+        pids = worker_pids(server.pid)
+        memory = [memory_kb(pid) for pid in pids]
+        master = memory_kb(server.pid)
+        result.update({
+            "workers": len(pids),
+            "rss": statistics.mean(m["rss"] for m in memory) / 1024,
+            "pss": statistics.mean(m["pss"] for m in memory) / 1024,
+            "uss": statistics.mean(m["uss"] for m in memory) / 1024,
+            "total_pss": (master["pss"] + sum(m["pss"] for m in memory)) / 1024,
+        })
+        return result
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RSS / req/s: uvicorn --workers vs app.serve (preload)")
+    parser.add_argument("--workers", default="1,2,4,8", help="Danh sách số worker")
+    parser.add_argument("--modes", default="uvicorn,preload")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--duration", type=float, default=20, help="Thời gian bắn tải mỗi cấu hình (giây)")
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--llm-port", type=int, default=8090)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--no-spawn", action="store_true", help="Không tự bật fake LLM server")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.update({
+        "GEMINI_API_ENDPOINT": f"http://127.0.0.1:{args.llm_port}",
+        "GOOGLE_API_KEY": env.get("GOOGLE_API_KEY", "bench-fake-key"),
+        "SEMANTIC_CACHE_ENABLED": "0",
+        "LLM_CACHE_ENABLED": "0",
+        "SINGLE_FLIGHT_ENABLED": "0",
+        "SESSION_STORE": env.get("SESSION_STORE", "memory"),
+    })
+
+    llm_server = None
+    if not args.no_spawn:
+        llm_server = subprocess.Popen([
+            sys.executable, "-m", "scripts.fake_llm_server", "--port", str(args.llm_port),
+            "--rpm", "1000000", "--burst", "100000", "--max-concurrency", "100000",
+            "--latency", str(args.llm_latency),
+        ])
+    try:
+        rows = []
+        for mode in args.modes.split(","):
+            for workers in (int(n) for n in args.workers.split(",")):
+                print(f"🔹 {mode} x{workers} ...")
+                rows.append((mode, workers, run_one(mode, workers, args, env)))
+
+        print(f"\n{'mode':<9}{'N':>3}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'err':>6}"
+              f"{'RSS/w MB':>10}{'PSS/w MB':>10}{'USS/w MB':>10}{'tổng PSS MB':>13}")
+        for mode, workers, r in rows:
+            print(f"{mode:<9}{workers:>3}{r['rps']:>9.1f}{r['p50']:>9.0f}{r['p95']:>9.0f}{r['errors']:>6}"
+                  f"{r['rss']:>10.0f}{r['pss']:>10.0f}{r['uss']:>10.0f}{r['total_pss']:>13.0f}")
+    finally:
+        if llm_server is not None:
+            llm_server.terminate()
+            llm_server.wait()
+
+
+if __name__ == "__main__":
+    main()
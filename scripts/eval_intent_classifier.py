@@ -0,0 +1,94 @@
+# scripts/eval_intent_classifier.py
+"""
+Đánh giá offline bộ phân loại intent kNN cục bộ so với nhãn LLM trong chat_logs / qa_logs.
+
+Chạy:
+    python -m scripts.eval_intent_classifier --test-ratio 0.2 --margin 0.5
+    python -m scripts.eval_intent_classifier --save      # build lại data/intent_exemplars.npz từ toàn bộ log
+"""
+import argparse
+import time
+import zlib
+
+from ai_core.intent_classifier import EmbeddingIntentClassifier, DEFAULT_EXEMPLARS_PATH
+from ai_core.intent_rules import IntentRuleEngine
+from data_layer.vector_store import vector_store_manager
+from database import connection, crud
+
+
+def split_examples(pairs, test_ratio: float):
+    """Chia train/test ổn định theo hash câu hỏi (chạy lại cho cùng kết quả)"""
+    train, test = [], []
+    for text, label in pairs:
+        bucket = zlib.crc32(text.encode("utf-8")) % 100
+        (test if bucket < test_ratio * 100 else train).append((text, label))
+    return train, test
+
+
+def evaluate(classifier: EmbeddingIntentClassifier, test):
+    rules = IntentRuleEngine()
+    vectors = classifier.embed_texts([text for text, _ in test])
+
+    correct = accepted = accepted_correct = rule_hits = avoided = 0
+    knn_seconds = 0.0
+    for (text, label), vector in zip(test, vectors):
+        start = time.perf_counter()
+        result = classifier.classify_vector(vector)
+        knn_seconds += time.perf_counter() - start
+
+        correct += result["intent"] == label
+        rule_hit = rules.match(text) is not None
+        rule_hits += rule_hit
+        if classifier.is_confident(result):
+            accepted += 1
+            accepted_correct += result["intent"] == label
+        avoided += rule_hit or classifier.is_confident(result)
+
+    n = len(test)
+    print(f"📊 Test set: {n} câu (nhãn LLM), exemplar bank: {len(classifier)} câu")
+    print(f"   kNN accuracy (mọi câu):           {correct / n:.3f}")
+    print(f"   kNN accepted (margin ≥ {classifier.margin_threshold}): {accepted / n:.3f}")
+    print(f"   accuracy trên câu accepted:       {accepted_correct / accepted:.3f}" if accepted else
+          "   accuracy trên câu accepted:       n/a")
+    print(f"   rule fast path:                   {rule_hits / n:.3f}")
+    print(f"   tỉ lệ tránh được LLM (rule ∪ kNN): {avoided / n:.3f}")
+    print(f"   thời gian kNN trung bình:         {knn_seconds / n * 1e6:.1f} µs/câu (không tính embedding)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đánh giá intent classifier kNN so với nhãn LLM")
+    parser.add_argument("--test-ratio", type=float, default=0.2, help="Tỉ lệ log dùng để test")
+    parser.add_argument("--margin", type=float, default=None, help="Ngưỡng margin (mặc định INTENT_KNN_MARGIN)")
+    parser.add_argument("--limit", type=int, default=5000, help="Số log tối đa đọc từ mỗi bảng")
+    parser.add_argument("--save", action="store_true", help="Build exemplar bank từ seed + toàn bộ log và lưu lại")
+    parser.add_argument("--out", type=str, default=DEFAULT_EXEMPLARS_PATH, help="File .npz exemplar bank")
+    args = parser.parse_args()
+
+    db = connection.SessionLocal()
+    try:
+        pairs = crud.get_labeled_questions(db, limit=args.limit)
+    finally:
+        db.close()
+    print(f"🔹 Đọc được {len(pairs)} câu hỏi có nhãn intent từ log")
+
+    def new_classifier():
+        return EmbeddingIntentClassifier(
+            embed_query=vector_store_manager.embed_query,
+            embed_texts=vector_store_manager.embed_texts,
+            margin_threshold=args.margin,
+        )
+
+    train, test = split_examples(pairs, args.test_ratio)
+    if test:
+        evaluate(new_classifier().fit(EmbeddingIntentClassifier.seed_examples() + train), test)
+    else:
+        print("⚠️ Chưa có log đủ để tạo tập test — bỏ qua bước đánh giá")
+
+    if args.save:
+        classifier = new_classifier().fit(EmbeddingIntentClassifier.seed_examples() + pairs)
+        classifier.save(args.out)
+        print(f"✅ Đã lưu exemplar bank ({len(classifier)} câu) vào {args.out}")
+
+
+if __name__ == "__main__":
+    main()
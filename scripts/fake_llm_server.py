@@ -0,0 +1,93 @@
+# scripts/fake_llm_server.py
+"""
+Server giả lập Gemini REST API (generateContent) để test gateway mà không tốn quota.
+Mô phỏng: quota theo phút (429 + Retry-After), quá tải khi quá nhiều request đồng thời (503),
+lỗi 500 ngẫu nhiên và độ trễ tăng dần theo số request đang xử lý.
+
+Chạy:
+    python -m scripts.fake_llm_server --port 8090 --rpm 600 --max-concurrency 32 --latency 0.3
+"""
+import argparse
+import asyncio
+import random
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from utils.rate_limit import TokenBucket
+
+
+def _error(code: int, status: str, message: str, retry_after: float = None) -> JSONResponse:
+    headers = {"Retry-After": f"{retry_after:.2f}"} if retry_after is not None else None
+    return JSONResponse(
+        status_code=code,
+        content={"error": {"code": code, "message": message, "status": status}},
+        headers=headers,
+    )
+
+
+def build_app(rpm: float, burst: float, max_concurrency: int, latency: float, error_rate: float) -> FastAPI:
+    app = FastAPI(title="Fake Gemini")
+    bucket = TokenBucket(rpm / 60.0, burst or None)
+    state = {"inflight": 0, "served": 0, "rate_limited": 0, "overloaded": 0, "errors": 0}
+
+    @app.get("/stats")
+    def stats():
+        return state
+
+    @app.post("/v1beta/models/{model_action:path}")
+    async def generate_content(model_action: str, request: Request):
+        body = await request.json()
+        if not bucket.try_acquire():
+            state["rate_limited"] += 1
+            return _error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota).",
+                          retry_after=bucket.retry_after())
+        if state["inflight"] >= max_concurrency:
+            state["overloaded"] += 1
+            return _error(503, "UNAVAILABLE", "The model is overloaded. Please try again later.")
+        if random.random() < error_rate:
+            state["errors"] += 1
+            return _error(500, "INTERNAL", "An internal error has occurred.")
+
+        state["inflight"] += 1
+        try:
+            # Độ trễ tăng theo tải: càng gần max_concurrency càng chậm
+            load = state["inflight"] / max(1, max_concurrency)
+            await asyncio.sleep(latency * (1 + load) * random.uniform(0.8, 1.2))
+        finally:
+            state["inflight"] -= 1
+        state["served"] += 1
+
+        prompt = ""
+        try:
+            prompt = body["contents"][0]["parts"][0]["text"]
+        except (KeyError, IndexError, TypeError):
+            pass
+        return {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": f"[fake:{model_action}] {prompt[:60]}"}]},
+                "finishReason": "STOP",
+            }],
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gemini generateContent server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--rpm", type=float, default=600, help="Quota request/phút (vượt → 429)")
+    parser.add_argument("--burst", type=float, default=20, help="Số request burst cho phép")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="Vượt số request đồng thời → 503")
+    parser.add_argument("--latency", type=float, default=0.3, help="Độ trễ cơ bản (giây)")
+    parser.add_argument("--error-rate", type=float, default=0.01, help="Tỉ lệ lỗi 500 ngẫu nhiên")
+    args = parser.parse_args()
+
+    app = build_app(args.rpm, args.burst, args.max_concurrency, args.latency, args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# scripts/fake_redis_server.py
+"""
+Server giả lập giao thức Redis (RESP) để test RedisSessionStore mà không cần cài Redis.
+Hỗ trợ: PING, AUTH, SELECT, GET, SET [EX/PX], DEL, EXISTS, EXPIRE, TTL, DBSIZE, FLUSHALL, INFO,
+WATCH / UNWATCH / MULTI / EXEC / DISCARD (transaction lạc quan, dùng cho compare-and-set).
+Pipeline hoạt động tự nhiên vì lệnh được đọc/trả lời tuần tự trên mỗi kết nối.
+
+Chạy:
+    python -m scripts.fake_redis_server --port 6390
+    SESSION_STORE=redis REDIS_URL=redis://127.0.0.1:6390/0 uvicorn app.main:app --workers 4
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+WRITE_COMMANDS = {b"SET", b"DEL", b"EXPIRE", b"FLUSHALL"}
+NIL_ARRAY = object()    # reply của EXEC khi key WATCH đã bị ghi (*-1)
+
+
+class Transaction:
+    """State MULTI / WATCH của 1 kết nối"""
+
+    def __init__(self):
+        self.watched: Dict[bytes, int] = {}     # key → revision lúc WATCH
+        self.queued: Optional[List[List[bytes]]] = None
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.revisions: Dict[bytes, int] = {}   # tăng mỗi lần key bị ghi → EXEC biết key WATCH đã đổi
+        self.revision = 0
+        self.commands = 0
+
+    def _touch(self, args: List[bytes]):
+        self.revision += 1
+        cmd = args[0].upper()
+        if cmd == b"FLUSHALL":
+            keys = list(self.data)
+        elif cmd == b"DEL":
+            keys = args[1:]
+        else:
+            keys = args[1:2]
+        for key in keys:
+            self.revisions[key] = self.revision
+
+    def execute_in(self, tx: Transaction, args: List[bytes]):
+        """Lệnh của 1 kết nối: xử lý transaction, còn lại chuyển cho execute()"""
+        cmd = args[0].upper()
+        if cmd == b"MULTI":
+            if tx.queued is not None:
+                return "-ERR MULTI calls can not be nested"
+            tx.queued = []
+            return "+OK"
+        if cmd == b"EXEC":
+            if tx.queued is None:
+                return "-ERR EXEC without MULTI"
+            queued, tx.queued = tx.queued, None
+            conflict = any(self.revisions.get(key, 0) != rev for key, rev in tx.watched.items())
+            tx.watched = {}
+            if conflict:
+                return NIL_ARRAY
+            return [self.execute(command) for command in queued]
+        if cmd == b"DISCARD":
+            if tx.queued is None:
+                return "-ERR DISCARD without MULTI"
+            tx.queued, tx.watched = None, {}
+            return "+OK"
+        if tx.queued is not None:
+            if cmd == b"WATCH":
+                return "-ERR WATCH inside MULTI is not allowed"
+            tx.queued.append(args)
+            return "+QUEUED"
+        if cmd == b"WATCH":
+            for key in args[1:]:
+                tx.watched.setdefault(key, self.revisions.get(key, 0))
+            return "+OK"
+        if cmd == b"UNWATCH":
+            tx.watched = {}
+            return "+OK"
+        return self.execute(args)
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args: List[bytes]):
+        self.commands += 1
+        cmd = args[0].upper()
+        if cmd in WRITE_COMMANDS:
+            self._touch(args)
+        if cmd == b"PING":
+            return "+PONG"
+        if cmd in (b"AUTH", b"SELECT"):
+            return "+OK"
+        if cmd == b"GET":
+            return self._get(args[1])
+        if cmd == b"SET":
+            expires_at = None
+            options = [a.upper() for a in args[3:]]
+            for i, option in enumerate(options):
+                if option == b"EX":
+                    expires_at = time.monotonic() + float(args[3 + i + 1])
+                elif option == b"PX":
+                    expires_at = time.monotonic() + float(args[3 + i + 1]) / 1000
+            self.data[args[1]] = (args[2], expires_at)
+            return "+OK"
+        if cmd == b"DEL":
+            return sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+        if cmd == b"EXISTS":
+            return sum(1 for key in args[1:] if self._get(key) is not None)
+        if cmd == b"EXPIRE":
+            value = self._get(args[1])
+            if value is None:
+                return 0
+            self.data[args[1]] = (value, time.monotonic() + float(args[2]))
+            return 1
+        if cmd == b"TTL":
+            if self._get(args[1]) is None:
+                return -2
+            expires_at = self.data[args[1]][1]
+            return -1 if expires_at is None else int(expires_at - time.monotonic())
+        if cmd == b"DBSIZE":
+            return len(self.data)
+        if cmd == b"FLUSHALL":
+            self.data.clear()
+            return "+OK"
+        if cmd == b"INFO":
+            return f"# Fake\r\nkeys:{len(self.data)}\r\ncommands:{self.commands}\r\n".encode()
+        return f"-ERR unknown command '{cmd.decode(errors='replace')}'"
+
+
+def encode_reply(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if reply is NIL_ARRAY:
+        return b"*-1\r\n"
+    if isinstance(reply, list):
+        return f"*{len(reply)}\r\n".encode() + b"".join(encode_reply(item) for item in reply)
+    if isinstance(reply, str):  # "+OK" / "-ERR ..."
+        return reply.encode() + b"\r\n"
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    return f"${len(reply)}\r\n".encode() + reply + b"\r\n"
+
+
+async def read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):  # inline command (redis-cli / telnet)
+        return line.strip().split()
+    args = []
+    for _ in range(int(line[1:-2])):
+        header = await reader.readline()
+        length = int(header[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+def build_handler(db: FakeRedis, latency: float):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tx = Transaction()
+        try:
+            while True:
+                args = await read_command(reader)
+                if args is None:
+                    break
+                if not args:
+                    continue
+                if latency:
+                    await asyncio.sleep(latency)
+                writer.write(encode_reply(db.execute_in(tx, args)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(host: str, port: int, latency: float):
+    db = FakeRedis()
+    server = await asyncio.start_server(build_handler(db, latency), host, port)
+    print(f"🔹 Fake Redis listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Redis (RESP) server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    parser.add_argument("--latency", type=float, default=0.0, help="Độ trễ mỗi lệnh (giây)")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.latency))
+
+
+if __name__ == "__main__":
+    main()
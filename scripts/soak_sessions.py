@@ -0,0 +1,69 @@
+# scripts/soak_sessions.py
+"""
+Soak test session registry: tạo hàng triệu session giả (mỗi session 1 lượt hội thoại)
+và in RSS theo thời gian. Với registry có cap, RSS phải đi ngang sau khi đạt cap.
+
+Chạy:
+    python -m scripts.soak_sessions --sessions 1000000 --max-entries 50000
+    python -m scripts.soak_sessions --sessions 1000000 --registry-only   # không cần LangChain
+"""
+import argparse
+import gc
+import os
+import resource
+import time
+import uuid
+
+from utils.session_registry import SessionRegistry
+
+
+def rss_mb() -> float:
+    """RSS hiện tại (Linux: /proc/self/status), fallback peak RSS của getrusage"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test SessionRegistry + UXOMemoryManager")
+    parser.add_argument("--sessions", type=int, default=1_000_000, help="Tổng số session giả")
+    parser.add_argument("--max-entries", type=int, default=50_000)
+    parser.add_argument("--max-mb", type=float, default=64)
+    parser.add_argument("--ttl", type=float, default=3600)
+    parser.add_argument("--report-every", type=int, default=100_000)
+    parser.add_argument("--registry-only", action="store_true", help="Bỏ qua UXOMemoryManager (không cần LangChain)")
+    args = parser.parse_args()
+
+    registry = SessionRegistry(ttl_seconds=args.ttl, max_entries=args.max_entries,
+                               max_bytes=int(args.max_mb * 1024 * 1024))
+    memory_manager = None
+    if not args.registry_only:
+        from ai_core.memory_manager import UXOMemoryManager
+        memory_manager = UXOMemoryManager(k=3, session_registry=registry)
+
+    question = "Bom mìn chưa nổ nguy hiểm như thế nào?"
+    answer = "Không chạm vào vật nghi ngờ, đánh dấu khu vực và gọi ngay hotline địa phương. " * 3
+
+    print(f"🔹 start RSS={rss_mb():.1f} MB, cap={args.max_entries} sessions / {args.max_mb} MB")
+    start = time.perf_counter()
+    for i in range(1, args.sessions + 1):
+        session_id = registry.touch(str(uuid.uuid4()))
+        if memory_manager is not None:
+            memory_manager.save_context(session_id, question, answer, "safety_advice")
+        if i % args.report_every == 0:
+            gc.collect()
+            stats = registry.get_stats()
+            memories = len(memory_manager.memories) if memory_manager is not None else 0
+            print(f"{i:>10,} sessions  registry={stats['entries']:>7,}  memories={memories:>7,}  "
+                  f"bytes≈{stats['bytes'] / 1024 / 1024:6.1f} MB  RSS={rss_mb():7.1f} MB  "
+                  f"{i / (time.perf_counter() - start):,.0f} sessions/s")
+    print(f"📊 {registry.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
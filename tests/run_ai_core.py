@@ -19,7 +19,7 @@ def main():
 
     # ================= 2. Khởi tạo LLM (Gemini) =================
     print("🔹 Initializing GeminiLLM...")
-    llm = GeminiLLM()  # Sử dụng model mặc định "gemini-1.5-t"
+    llm = GeminiLLM()  # Sử dụng model mặc định "gemini-1.5-flash"
 
     # ================= 3. Khởi tạo NLU Processor =================
     print("🔹 Initializing NLUProcessor...")
@@ -0,0 +1,82 @@
+# tests/test_admission.py
+"""AdmissionMiddleware: bucket theo IP, WebSocket cũng qua admission, stream không làm lệch service time"""
+import pytest
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from utils.admission import AdmissionController, AdmissionMiddleware
+
+
+def make_client(**controller_kwargs):
+    controller = AdmissionController(max_concurrency=4, max_queue=4, queue_timeout=1.0, **controller_kwargs)
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, controller=controller, paths=("/ask", "/ws/chat"),
+                       untimed_paths=("/ask/stream",))
+
+    @app.post("/ask")
+    async def ask():
+        return {"answer": "ok"}
+
+    @app.post("/ask/stream")
+    async def ask_stream():
+        return {"answer": "ok"}
+
+    @app.websocket("/ws/chat")
+    async def ws_chat(websocket: WebSocket):
+        await websocket.accept()
+        await websocket.send_json({"type": "session"})
+        await websocket.close()
+
+    return TestClient(app), controller
+
+
+def test_rotating_session_id_does_not_bypass_ip_bucket():
+    client, _ = make_client(session_rate=100, session_burst=100, ip_rate=0.001, ip_burst=3)
+    codes = [client.post("/ask", headers={"X-Session-ID": f"s-{i}"}).status_code for i in range(5)]
+    assert codes == [200, 200, 200, 429, 429]
+
+
+def test_session_bucket_still_applies_under_ip_bucket():
+    client, _ = make_client(session_rate=0.001, session_burst=1, ip_rate=100, ip_burst=100)
+    assert client.post("/ask", headers={"X-Session-ID": "s"}).status_code == 200
+    assert client.post("/ask", headers={"X-Session-ID": "s"}).status_code == 429
+    assert client.post("/ask", headers={"X-Session-ID": "other"}).status_code == 200
+
+
+def test_session_rejection_does_not_consume_ip_token():
+    client, _ = make_client(session_rate=0.001, session_burst=1, ip_rate=0.001, ip_burst=3)
+    codes = [client.post("/ask", headers={"X-Session-ID": "s"}).status_code for _ in range(4)]
+    assert codes == [200, 429, 429, 429]
+    assert client.post("/ask", headers={"X-Session-ID": "other"}).status_code == 200
+    assert client.post("/ask", headers={"X-Session-ID": "third"}).status_code == 200
+
+
+def test_trusted_frontend_is_limited_per_session_not_per_ip():
+    client, _ = make_client(session_rate=0.001, session_burst=2, ip_rate=0.001, ip_burst=1,
+                            trusted_peers=["testclient"])
+    codes = [client.post("/ask", headers={"X-Session-ID": f"user-{i}"}).status_code for i in range(5)]
+    assert codes == [200] * 5
+    assert [client.post("/ask", headers={"X-Session-ID": "user-0"}).status_code for _ in range(2)] == [200, 429]
+    # Không có session → vẫn chung bucket IP
+    assert [client.post("/ask").status_code for _ in range(2)] == [200, 429]
+
+
+def test_websocket_connect_is_admitted_and_rejected_with_close_code():
+    client, controller = make_client(ip_rate=0.001, ip_burst=1)
+    with client.websocket_connect("/ws/chat") as ws:
+        assert ws.receive_json() == {"type": "session"}
+    assert controller.get_stats()["in_flight"] == 0
+
+    with client.websocket_connect("/ws/chat") as ws:
+        with pytest.raises(WebSocketDisconnect) as exc:
+            ws.receive_json()
+    assert exc.value.code == 1008
+
+
+def test_untimed_routes_do_not_feed_service_time_estimate():
+    client, controller = make_client(ip_rate=100, ip_burst=100)
+    assert client.post("/ask/stream").status_code == 200
+    assert controller.get_stats()["service_ms_ewma"] == 0.0
+    assert client.post("/ask").status_code == 200
+    assert controller._service_ewma is not None
@@ -0,0 +1,40 @@
+# tests/test_context_builder.py
+"""ContextBuilder.trim_history: cắt lịch sử theo nguyên lượt, không cắt đôi câu trả lời nhiều dòng"""
+from ai_core.context_builder import ContextBuilder, estimate_tokens
+from ai_core.memory_manager import ConversationWindow, render_turn
+
+MULTILINE_ANSWER = (
+    "Khi phát hiện vật nghi là bom mìn:\n"
+    "1. Không chạm vào, không di chuyển vật đó.\n"
+    "2. Đánh dấu khu vực và giữ khoảng cách an toàn.\n"
+    "3. Gọi đường dây nóng của tỉnh để được hỗ trợ."
+)
+
+
+def window_with(*turns):
+    window = ConversationWindow(k=5)
+    for user_input, assistant_output in turns:
+        window.append(user_input, assistant_output)
+    return window
+
+
+def test_multiline_answer_is_kept_whole_or_dropped():
+    older = ("Thấy vật lạ trong vườn thì làm gì?", MULTILINE_ANSWER)
+    newest = ("Còn ở Quảng Trị thì gọi số nào?", "Bạn gọi đường dây nóng của Quảng Trị.")
+    # Đủ cho lượt mới nhất + vài dòng đầu của lượt cũ (cắt theo dòng sẽ giữ nửa câu trả lời)
+    budget = estimate_tokens(render_turn(*newest)) + estimate_tokens(render_turn(*older)) // 2
+    builder = ContextBuilder(history_budget=budget)
+
+    history = builder.trim_history(window_with(older, newest).turns())
+    assert history == render_turn(*newest)
+
+
+def test_history_within_budget_is_unchanged():
+    window = window_with(("Bom bi là gì?", MULTILINE_ANSWER), ("Cảm ơn", "Không có gì."))
+    assert ContextBuilder(history_budget=1000).trim_history(window.turns()) == window.history
+
+
+def test_oversized_newest_turn_keeps_only_the_question():
+    builder = ContextBuilder(history_budget=10)
+    history = builder.trim_history(window_with(("Bom bi là gì?", MULTILINE_ANSWER)).turns())
+    assert history == "User: Bom bi là gì?\n"
@@ -0,0 +1,36 @@
+# tests/test_labeled_questions.py
+"""Dữ liệu train intent classifier chỉ gồm nhãn do LLM gán (không tự train trên output của rule / kNN)"""
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("jose")
+pytest.importorskip("passlib")
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from database import crud, models  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def test_only_llm_labels_are_used_for_training(db):
+    for message, intent, source in [
+        ("Số hotline Quảng Trị?", "ask_hotline", "llm"),
+        ("Quảng Bình", "ask_hotline", "llm_refined"),
+        ("Thấy quả bom thì làm gì?", "safety_advice", "knn"),
+        ("Xin chào", "greeting", "rules"),
+        ("Bom bi nguy hiểm không?", "general", "degraded"),
+        ("Log cũ chưa có nguồn", "general", None),
+    ]:
+        crud.create_chat_log(db, session_id="s", message=message, response="...",
+                             intent=intent, intent_source=source)
+
+    assert crud.get_labeled_questions(db) == [("Số hotline Quảng Trị?", "ask_hotline")]
@@ -0,0 +1,145 @@
+# tests/test_llm_breaker.py
+"""Circuit breaker của LLM chỉ mở vì lỗi upstream, không vì deadline của request hay client huỷ"""
+import asyncio
+import time
+
+import pytest
+
+from ai_core.llm_gateway import GeminiGateway, LLMOverloadedError, is_upstream_failure
+from utils.circuit_breaker import CircuitBreaker
+from utils.deadline import DeadlineExceeded, deadline_scope
+
+
+class StatusError(Exception):
+    def __init__(self, code: int):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (StatusError(503), True),
+    (StatusError(500), True),
+    (StatusError(429), True),
+    (StatusError(400), False),
+    (ConnectionResetError(), True),
+    (asyncio.TimeoutError(), True),
+    (DeadlineExceeded("Hết deadline (gemini)"), False),
+    (LLMOverloadedError("queue full"), False),
+    (ValueError("prompt bị chặn"), False),
+])
+def test_is_upstream_failure(exc, expected):
+    assert is_upstream_failure(exc) is expected
+
+
+class FailingModel:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+    def generate_content(self, *args, **kwargs):
+        raise self.exc
+
+    async def generate_content_async(self, *args, **kwargs):
+        raise self.exc
+
+
+def _llm(exc: BaseException, breaker: CircuitBreaker):
+    llm_chain = pytest.importorskip("ai_core.llm_chain")
+    llm = llm_chain.GeminiLLM(cache=None, gateway=None, breaker=breaker)
+    llm.cache, llm.gateway = None, None
+    llm.model_instance = FailingModel(exc)
+    return llm
+
+
+@pytest.mark.parametrize("exc", [DeadlineExceeded("Hết deadline"), asyncio.CancelledError()])
+def test_deadline_and_cancel_do_not_open_breaker(exc):
+    breaker = CircuitBreaker(min_calls=2, window=2, failure_rate=0.5)
+    llm = _llm(exc, breaker)
+    for _ in range(4):
+        with pytest.raises(type(exc)):
+            asyncio.run(llm._agenerate("prompt"))
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.get_stats()["failures"] == 0
+
+
+def test_upstream_errors_open_breaker():
+    breaker = CircuitBreaker(min_calls=2, window=2, failure_rate=0.5)
+    llm = _llm(StatusError(503), breaker)
+    for _ in range(2):
+        with pytest.raises(StatusError):
+            llm._generate("prompt")
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+class HangingModel:
+    """Upstream treo: không bao giờ trả lời"""
+    async def generate_content_async(self, *args, **kwargs):
+        await asyncio.sleep(60)
+
+
+def _hanging_llm(breaker: CircuitBreaker, gateway: GeminiGateway, timeout: float):
+    llm_chain = pytest.importorskip("ai_core.llm_chain")
+    llm = llm_chain.GeminiLLM(cache=None, gateway=gateway, breaker=breaker, timeout=timeout)
+    llm.cache = None
+    llm.model_instance = HangingModel()
+    return llm
+
+
+def test_tier_timeout_on_hanging_upstream_opens_breaker_and_lowers_limit():
+    breaker = CircuitBreaker(min_calls=2, window=2, failure_rate=0.5)
+    gateway = GeminiGateway(initial_limit=8, max_retries=0, requests_per_minute=0)
+    llm = _hanging_llm(breaker, gateway, timeout=0.05)
+    for _ in range(2):
+        with pytest.raises(asyncio.TimeoutError) as exc:
+            asyncio.run(llm._agenerate("prompt"))
+        assert not isinstance(exc.value, DeadlineExceeded)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert gateway.limit < 8
+    assert gateway.get_stats()["timeouts"] == 2
+
+
+def test_request_deadline_on_hanging_upstream_is_not_upstream_failure():
+    breaker = CircuitBreaker(min_calls=2, window=2, failure_rate=0.5)
+    gateway = GeminiGateway(initial_limit=8, max_retries=0, requests_per_minute=0)
+    llm = _hanging_llm(breaker, gateway, timeout=5)
+
+    async def ask():
+        with deadline_scope(seconds=0.05):
+            return await llm._agenerate("prompt")
+
+    for _ in range(2):
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(ask())
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert gateway.limit == 8
+    assert gateway.get_stats()["inflight"] == 0
+
+
+def test_sync_queue_wait_is_bounded_by_request_deadline():
+    gateway = GeminiGateway(initial_limit=1, min_limit=1, max_limit=1, requests_per_minute=0)
+    gateway._acquire_sync()   # slot duy nhất đang bận
+    with deadline_scope(seconds=0.05):
+        with pytest.raises(DeadlineExceeded):
+            gateway.call(lambda: "ok")
+    stats = gateway.get_stats()
+    assert stats["queue_depth"] == 0
+    assert stats["deadline_exceeded"] == 1
+
+
+def _slow_read_timeout():
+    """Transport REST: hết timeout → ReadTimeout (OSError), không phải TimeoutError"""
+    time.sleep(0.1)
+    raise OSError("read timed out")
+
+
+def test_sync_timeouts_are_classified_like_async():
+    gateway = GeminiGateway(initial_limit=8, max_retries=0, requests_per_minute=0, timeout=30)
+    with deadline_scope(seconds=0.05):
+        with pytest.raises(DeadlineExceeded):
+            gateway.call(_slow_read_timeout)
+    assert gateway.limit == 8
+
+    with pytest.raises(OSError) as exc:
+        gateway.call(_slow_read_timeout, budget=0.05)
+    assert not isinstance(exc.value, DeadlineExceeded)
+    assert gateway.limit < 8
+    assert gateway.get_stats()["timeouts"] == 1
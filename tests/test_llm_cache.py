@@ -0,0 +1,23 @@
+# tests/test_llm_cache.py
+"""LLM response cache: khoá phân biệt max_output_tokens, giới hạn dung lượng tính cho cả file"""
+from ai_core.llm_cache import LLMResponseCache
+
+
+def test_key_depends_on_max_output_tokens():
+    short = LLMResponseCache.make_key("gemini-1.5-flash", 0.2, "prompt", 64)
+    long = LLMResponseCache.make_key("gemini-1.5-flash", 0.2, "prompt", 1024)
+    assert short != long
+    assert LLMResponseCache.make_key("gemini-1.5-flash", 0.2, "prompt") != short
+
+
+def test_size_cap_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite3")
+    # 2 process dùng chung 1 file (như worker prefork)
+    worker_a = LLMResponseCache(path=path, max_bytes=1000)
+    worker_b = LLMResponseCache(path=path, max_bytes=1000)
+    for i in range(10):
+        worker_a.put(f"a{i}", "x" * 100)
+        worker_b.put(f"b{i}", "y" * 100)
+    assert worker_a.get_stats()["size_bytes"] <= 1000
+    assert worker_b.get_stats()["size_bytes"] == worker_a.get_stats()["size_bytes"]
+    assert worker_b.get("b9") == "y" * 100
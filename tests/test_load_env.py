@@ -0,0 +1,34 @@
+# tests/test_load_env.py
+"""SECRET_KEY thiếu → tạo 1 lần và lưu vào .env, mọi process dùng chung"""
+import multiprocessing
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+
+@pytest.fixture
+def load_env(monkeypatch):
+    monkeypatch.setenv("SECRET_KEY", "test-key")   # import module không đụng tới .env của repo
+    from utils import load_env
+    return load_env
+
+
+def _ensure(path, queue):
+    from utils import load_env
+    queue.put(load_env.ensure_secret_key(path))
+
+
+def test_concurrent_workers_share_one_persisted_key(load_env, tmp_path):
+    path = str(tmp_path / ".env")
+    queue = multiprocessing.get_context("fork").Queue()
+    workers = [multiprocessing.get_context("fork").Process(target=_ensure, args=(path, queue)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    keys = {queue.get() for _ in workers}
+    assert len(keys) == 1
+    assert load_env.ensure_secret_key(path) in keys
+    assert open(path).read().count("SECRET_KEY") == 1
@@ -0,0 +1,85 @@
+# tests/test_nlu_processor.py
+"""NLUProcessor: output JSON sai dạng của LLM không được làm hỏng /ask"""
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from ai_core.nlu_processor import NLUProcessor  # noqa: E402
+
+QUESTION = "Tôi thấy một vật lạ bằng kim loại trong vườn"
+
+
+class JSONLLM:
+    """LLM trả về đúng 1 chuỗi cố định"""
+
+    def __init__(self, payload):
+        self.output = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+
+    def invoke(self, prompt, **kwargs):
+        return self.output
+
+    async def ainvoke(self, prompt, **kwargs):
+        return self.output
+
+
+def test_string_location_is_not_split_into_characters():
+    entities = NLUProcessor._normalize_entities({"location": "Quảng Trị", "uxo_type": ["bom", None, 3]})
+    assert entities == {"location": ["Quảng Trị"], "uxo_type": ["bom"], "action": []}
+
+
+def test_string_location_from_llm_reaches_result_as_one_item():
+    nlu = NLUProcessor(llm=JSONLLM({"intent": "ask_hotline", "confidence": 0.8,
+                                    "entities": {"location": "Quảng Trị"}}))
+    result = nlu.process_nlu(QUESTION)
+    assert result["entities"]["location"] == ["Quảng Trị"]
+
+
+@pytest.mark.parametrize("confidence", [None, "cao", "0.7", [1]])
+def test_malformed_confidence_is_coerced(confidence):
+    nlu = NLUProcessor(llm=JSONLLM({"intent": "general", "confidence": confidence, "entities": {}}))
+    result = nlu.process_nlu(QUESTION)
+    assert result["intent"] == "general"
+    assert 0.0 <= result["confidence"] <= 1.0
+
+
+def test_parse_failure_falls_back_to_rule_guess(monkeypatch):
+    nlu = NLUProcessor(llm=JSONLLM({"intent": "general", "confidence": 0.5, "entities": {}}))
+    refine = nlu._refine_intent
+    calls = []
+
+    def broken_once(parsed, *args, **kwargs):
+        calls.append(parsed)
+        if len(calls) == 1:
+            raise ValueError("JSON sai dạng")
+        return refine(parsed, *args, **kwargs)
+
+    monkeypatch.setattr(nlu, "_refine_intent", broken_once)
+    result = asyncio.run(nlu.aprocess_nlu(QUESTION))
+    assert result["source"] == "degraded"
+    assert result["intent"] != "unknown"
+
+
+class NoRules:
+    """Bỏ fast path → kết quả đi qua LLM + heuristic ngữ cảnh"""
+
+    def match(self, question, **kwargs):
+        return None
+
+
+def test_context_refined_intent_is_not_tagged_as_llm_label():
+    from ai_core.memory_manager import UXOMemoryManager
+
+    memory = UXOMemoryManager(k=3)
+    memory.save_context("s", "Cho tôi số hotline báo bom mìn", "Bạn muốn hỏi số hotline ở khu vực nào?", "ask_hotline")
+    nlu = NLUProcessor(llm=JSONLLM({"intent": "location_info", "confidence": 0.8, "entities": {}}),
+                       memory_manager=memory, rule_engine=NoRules())
+
+    refined = nlu.process_nlu("Quảng Bình", session_id="s")
+    assert refined["intent"] == "ask_hotline"
+    assert refined["source"] == "llm_refined"
+
+    plain = nlu.process_nlu(QUESTION, session_id="other")
+    assert (plain["intent"], plain["source"]) == ("location_info", "llm")
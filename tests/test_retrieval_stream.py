@@ -0,0 +1,52 @@
+# tests/test_retrieval_stream.py
+"""Stream RAG lỗi giữa chừng: báo cho người dùng, không cache / không lưu câu trả lời dở dang"""
+import asyncio
+
+import numpy as np
+import pytest
+
+from ai_core.memory_manager import UXOMemoryManager
+from ai_core.semantic_cache import SemanticAnswerCache
+from utils.deadline import DeadlineExceeded
+
+retrieval_qa = pytest.importorskip("ai_core.retrieval_qa")
+
+
+class BrokenStreamLLM:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+    async def astream(self, prompt):
+        yield "Bom bi rất nguy hiểm, "
+        raise self.exc
+
+
+def make_qa(exc: BaseException):
+    qa = retrieval_qa.UXORetrievalQA.__new__(retrieval_qa.UXORetrievalQA)
+    qa.llm, qa.router = BrokenStreamLLM(exc), None
+    qa.answer_cache = SemanticAnswerCache(embed_query=lambda text: np.array([1.0, 0.0]))
+    qa.memory_manager = UXOMemoryManager(k=3)
+    qa.prefetch_stats = {"started": 0, "used": 0, "discarded": 0}
+    qa.degraded_stats = {"answers": 0, "retrieval_timeouts": 0}
+
+    async def get_docs(question, prefetched):
+        return ["Tài liệu về bom bi"]
+
+    qa._aget_docs = get_docs
+    qa._format_rag_prompt = lambda *args: "prompt"
+    return qa
+
+
+async def collect(qa, question: str):
+    return [chunk async for chunk in qa.astream_response(question, "safety_advice", session_id="s")]
+
+
+@pytest.mark.parametrize("exc", [DeadlineExceeded("Hết deadline"), ConnectionResetError()])
+def test_mid_stream_failure_is_reported_and_not_saved(exc):
+    qa = make_qa(exc)
+    question = "Bom bi có nguy hiểm không?"
+    chunks = asyncio.run(collect(qa, question))
+
+    assert chunks == ["Bom bi rất nguy hiểm, ", qa.STREAM_TRUNCATED_NOTICE]
+    assert qa.answer_cache.lookup(question, "vi", "safety_advice") is None
+    assert qa.memory_manager.get_message_count("s") == 0
@@ -0,0 +1,33 @@
+# tests/test_semantic_cache.py
+"""Semantic cache không trả câu trả lời của địa phương khác / của session đã có lịch sử"""
+import numpy as np
+import pytest
+
+from ai_core.memory_manager import UXOMemoryManager
+from ai_core.semantic_cache import SemanticAnswerCache
+
+
+def embed(text: str) -> np.ndarray:
+    """Mọi câu hỏi về bom trùng embedding → chỉ khoá bucket phân biệt được"""
+    return np.array([1.0, 0.0]) if "bom" in text.lower() else np.array([0.0, 1.0])
+
+
+def test_locations_are_part_of_bucket_key():
+    cache = SemanticAnswerCache(embed_query=embed, similarity_threshold=0.9)
+    cache.store("Báo bom ở Quảng Trị gọi số nào?", "vi", "general", "Gọi Quảng Trị", ["Quảng Trị"])
+
+    assert cache.lookup("Báo bom ở Quảng Bình gọi số nào?", "vi", "general", ["Quảng Bình"]) is None
+    assert cache.lookup("Báo bom gọi số nào?", "vi", "general") is None
+    assert cache.lookup("Bom ở quảng trị báo ai?", "vi", "general", [" quảng trị "]) == "Gọi Quảng Trị"
+
+
+def test_session_with_history_is_not_cacheable():
+    retrieval_qa = pytest.importorskip("ai_core.retrieval_qa")
+    qa = retrieval_qa.UXORetrievalQA.__new__(retrieval_qa.UXORetrievalQA)
+    qa.answer_cache = SemanticAnswerCache(embed_query=embed)
+    qa.memory_manager = UXOMemoryManager(k=3)
+    question = "Bom bi có nguy hiểm không?"
+
+    assert qa._is_cacheable(question, question, "rag", "s")
+    qa.memory_manager.save_context("s", "Tôi ở Quảng Trị", "Bạn cần hỗ trợ gì?", "general")
+    assert not qa._is_cacheable(question, question, "rag", "s")
@@ -0,0 +1,306 @@
+# utils/admission.py
+"""
+Admission control cho các endpoint nặng (/ask*, /detect-uxo*, /ws/chat), chạy trước khi request vào pipeline:
+  1. token bucket theo IP của peer (scope["client"]; sau reverse proxy: chạy uvicorn --proxy-headers)
+     + bucket phụ theo session (X-Session-ID / cookie session_id) → vượt nhịp: 429.
+     Session do client tự chọn → đổi session liên tục không thoát được bucket IP.
+     Peer tin cậy (ADMISSION_TRUSTED_PEERS, vd: IP của frontend Streamlit gọi thay cho mọi người dùng)
+     có session → chỉ áp bucket session, không dồn mọi người dùng vào 1 bucket IP.
+     Request chỉ lấy token khi mọi bucket đều còn (bucket sau từ chối → trả lại token bucket trước).
+  2. giới hạn số request xử lý đồng thời toàn worker + hàng đợi FIFO ngắn có hạn
+  3. hàng đợi đầy, hoặc dự đoán thời gian chờ (vị trí / concurrency × service time trung bình)
+     vượt queue timeout → 503 ngay; đã xếp hàng mà quá timeout → 503
+Mọi phản hồi từ chối có Retry-After. Request được nhận có header X-Queue-Time-Ms / Server-Timing,
+thời gian xếp hàng thống kê tách khỏi thời gian xử lý (get_stats, ContextVar cho RequestTimeline).
+WebSocket: admission ở lúc kết nối (slot trả lại ngay khi handshake xong), bị từ chối → accept rồi
+close với code 1008 (vượt nhịp) / 1013 (quá tải, thử lại sau).
+Service time trung bình chỉ đo trên route request/response; route stream / batch (untimed_paths)
+vẫn qua admission nhưng không làm lệch ước lượng thời gian chờ.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+from starlette.requests import cookie_parser
+from starlette.responses import JSONResponse
+
+from utils.rate_limit import TokenBucket
+
+_queue_ms: ContextVar[Optional[float]] = ContextVar("admission_queue_ms", default=None)
+
+
+def current_queue_ms() -> Optional[float]:
+    """Thời gian request hiện tại đã chờ trong hàng đợi admission (None nếu không qua admission)"""
+    return _queue_ms.get()
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _percentile(samples: Sequence[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency: Optional[int] = None, max_queue: Optional[int] = None,
+                 queue_timeout: Optional[float] = None, session_rate: Optional[float] = None,
+                 session_burst: Optional[float] = None, ip_rate: Optional[float] = None,
+                 ip_burst: Optional[float] = None, max_buckets: Optional[int] = None,
+                 trusted_peers: Optional[Sequence[str]] = None):
+        def env(value, key, default, cast=float):
+            return value if value is not None else cast(os.getenv(key, default))
+
+        self.max_concurrency = env(max_concurrency, "ADMISSION_MAX_CONCURRENCY", 64, int)
+        self.max_queue = env(max_queue, "ADMISSION_MAX_QUEUE", 128, int)
+        self.queue_timeout = env(queue_timeout, "ADMISSION_QUEUE_TIMEOUT", 2.0)
+        self.session_rate = env(session_rate, "ADMISSION_SESSION_RATE", 1.0)
+        self.session_burst = env(session_burst, "ADMISSION_SESSION_BURST", 5.0)
+        # Nhiều người dùng có thể chung 1 IP (NAT) → bucket IP rộng hơn bucket session
+        self.ip_rate = env(ip_rate, "ADMISSION_IP_RATE", 5.0)
+        self.ip_burst = env(ip_burst, "ADMISSION_IP_BURST", 20.0)
+        self.max_buckets = env(max_buckets, "ADMISSION_MAX_BUCKETS", 100000, int)
+        if trusted_peers is None:
+            trusted_peers = [p.strip() for p in os.getenv("ADMISSION_TRUSTED_PEERS", "").split(",") if p.strip()]
+        self.trusted_peers = frozenset(trusted_peers)
+
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._buckets_lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self._service_ewma: Optional[float] = None
+        self._queue_samples: "deque[float]" = deque(maxlen=1000)
+        self._service_samples: "deque[float]" = deque(maxlen=1000)
+        self.stats = {"admitted": 0, "queued": 0, "rate_limited": 0, "queue_full": 0,
+                      "predicted_timeout": 0, "queue_timeout": 0}
+
+    # ================= Per-client =================
+    def _bucket(self, key: str) -> TokenBucket:
+        """key "ip:..." → nhịp IP, còn lại ("session:...") → nhịp session"""
+        with self._buckets_lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                rate, burst = ((self.ip_rate, self.ip_burst) if key.startswith("ip:")
+                               else (self.session_rate, self.session_burst))
+                bucket = self._buckets[key] = TokenBucket(rate, burst)
+                if len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    # ================= Global =================
+    def _predicted_wait(self) -> float:
+        """Thời gian chờ dự kiến nếu xếp vào cuối hàng (chưa có số đo service time → 0)"""
+        if self._service_ewma is None:
+            return 0.0
+        return (len(self._waiters) + 1) / self.max_concurrency * self._service_ewma
+
+    def _reject(self, status_code: int, reason: str, retry_after: float):
+        self.stats[reason] += 1
+        raise AdmissionRejected(status_code, reason, retry_after)
+
+    async def admit(self, keys: Sequence[str]) -> float:
+        """Chờ tới lượt, trả số giây đã xếp hàng; bị từ chối → AdmissionRejected.
+        keys: các bucket phải cùng còn token (IP, session...); bị 1 bucket từ chối → không tốn token bucket nào"""
+        taken: List[TokenBucket] = []
+        for key in keys:
+            bucket = self._bucket(key)
+            if not bucket.try_acquire():
+                for other in taken:
+                    other.refund()
+                self._reject(429, "rate_limited", bucket.retry_after())
+            taken.append(bucket)
+
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            self._in_flight += 1
+            self.stats["admitted"] += 1
+            self._queue_samples.append(0.0)
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            self._reject(503, "queue_full", max(self._predicted_wait(), self.queue_timeout))
+        predicted = self._predicted_wait()
+        if predicted > self.queue_timeout:
+            self._reject(503, "predicted_timeout", predicted)
+
+        self.stats["queued"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait({future}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # Client ngắt khi đang chờ: slot đã được trao thì trả lại
+            if future.done() and not future.cancelled():
+                self.release(None)
+            else:
+                self._discard_waiter(future)
+            raise
+        if not future.done():
+            self._discard_waiter(future)
+            self._reject(503, "queue_timeout", max(self._predicted_wait(), 1.0))
+        waited = time.perf_counter() - start
+        self.stats["admitted"] += 1
+        self._queue_samples.append(waited)
+        return waited
+
+    def _discard_waiter(self, future: "asyncio.Future"):
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+        future.cancel()
+
+    def release(self, service_seconds: Optional[float]):
+        """Request xong: ghi service time, trao slot thẳng cho waiter đầu hàng"""
+        if service_seconds is not None:
+            self._service_samples.append(service_seconds)
+            self._service_ewma = (service_seconds if self._service_ewma is None
+                                  else 0.8 * self._service_ewma + 0.2 * service_seconds)
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self._in_flight -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        queue_samples = list(self._queue_samples)
+        service_samples = list(self._service_samples)
+        return {
+            **self.stats,
+            "in_flight": self._in_flight,
+            "waiting": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "tracked_clients": len(self._buckets),
+            "queue_ms_p50": round(_percentile(queue_samples, 0.5) * 1000, 1),
+            "queue_ms_p95": round(_percentile(queue_samples, 0.95) * 1000, 1),
+            "service_ms_p50": round(_percentile(service_samples, 0.5) * 1000, 1),
+            "service_ms_p95": round(_percentile(service_samples, 0.95) * 1000, 1),
+            "service_ms_ewma": round((self._service_ewma or 0.0) * 1000, 1),
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware (không bọc body như BaseHTTPMiddleware → SSE / NDJSON stream đi thẳng)"""
+
+    # Close code WebSocket khi từ chối: 1008 policy violation (vượt nhịp), 1013 try again later (quá tải)
+    WS_CLOSE_CODES = {429: 1008, 503: 1013}
+
+    def __init__(self, app, controller: AdmissionController, paths: Sequence[str],
+                 untimed_paths: Sequence[str] = ()):
+        self.app = app
+        self.controller = controller
+        self.paths = tuple(paths)
+        self.untimed_paths = tuple(untimed_paths)
+
+    def _client_keys(self, scope) -> List[str]:
+        """Bucket chính theo IP peer; session (client tự chọn) chỉ là bucket phụ,
+        trừ khi peer là frontend tin cậy → session là bucket duy nhất"""
+        client = scope.get("client")
+        peer = client[0] if client else "unknown"
+        headers = Headers(scope=scope)
+        session_id = headers.get("x-session-id")
+        if not session_id and "cookie" in headers:
+            session_id = cookie_parser(headers["cookie"]).get("session_id")
+        if not session_id and scope["type"] == "websocket":
+            # /ws/chat?session_id=...
+            session_id = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("session_id", [None])[0]
+        if session_id and peer in self.controller.trusted_peers:
+            return [f"session:{session_id}"]
+        keys = [f"ip:{peer}"]
+        if session_id:
+            keys.append(f"session:{session_id}")
+        return keys
+
+    @staticmethod
+    def _reject_detail(e: AdmissionRejected) -> str:
+        return ("Quá nhiều yêu cầu từ client này, vui lòng chậm lại" if e.status_code == 429
+                else "Hệ thống đang quá tải, vui lòng thử lại sau")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+        if scope["type"] == "websocket":
+            await self._websocket(scope, receive, send)
+            return
+
+        try:
+            waited = await self.controller.admit(self._client_keys(scope))
+        except AdmissionRejected as e:
+            retry_after = max(1, math.ceil(e.retry_after))
+            detail = self._reject_detail(e)
+            response = JSONResponse(status_code=e.status_code, content={"detail": detail, "reason": e.reason},
+                                    headers={"Retry-After": str(retry_after)})
+            await response(scope, receive, send)
+            return
+
+        queue_ms = round(waited * 1000, 1)
+        token = _queue_ms.set(queue_ms)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-queue-time-ms", str(queue_ms).encode()))
+                headers.append((b"server-timing", f"queue;dur={queue_ms}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        timed = not scope["path"].startswith(self.untimed_paths)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            self.controller.release(time.perf_counter() - start if timed else None)
+            _queue_ms.reset(token)
+
+    async def _websocket(self, scope, receive, send):
+        """Admission lúc kết nối: giữ slot tới khi handshake xong (không giữ cả đời kết nối)"""
+        try:
+            waited = await self.controller.admit(self._client_keys(scope))
+        except AdmissionRejected as e:
+            message = await receive()
+            if message["type"] == "websocket.connect":
+                # Accept rồi close → client nhận được close code (close trước accept chỉ thành HTTP 403)
+                await send({"type": "websocket.accept"})
+                await send({"type": "websocket.close", "code": self.WS_CLOSE_CODES.get(e.status_code, 1013),
+                            "reason": f"{e.reason}; retry after {max(1, math.ceil(e.retry_after))}s"})
+            return
+
+        token = _queue_ms.set(round(waited * 1000, 1))
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.controller.release(None)
+
+        async def send_releasing(message):
+            if message["type"] in ("websocket.accept", "websocket.close"):
+                release()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_releasing)
+        finally:
+            release()
+            _queue_ms.reset(token)
@@ -0,0 +1,116 @@
+# utils/circuit_breaker.py
+"""
+Circuit breaker theo cửa sổ trượt N lời gọi gần nhất:
+  closed    → bình thường; tỉ lệ lỗi hoặc tỉ lệ gọi chậm vượt ngưỡng → open
+  open      → từ chối ngay (CircuitOpenError) trong open_seconds, caller trả lời dạng degraded
+  half_open → cho vài lời gọi thử; tất cả ổn → closed, có lỗi / chậm → open lại
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+
+class CircuitOpenError(RuntimeError):
+    """Breaker đang mở — không gọi upstream"""
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str = "llm", failure_rate: Optional[float] = None,
+                 slow_call_seconds: Optional[float] = None, slow_rate: Optional[float] = None,
+                 window: Optional[int] = None, min_calls: Optional[int] = None,
+                 open_seconds: Optional[float] = None, half_open_calls: Optional[int] = None):
+        def env(value, key, default, cast=float):
+            return value if value is not None else cast(os.getenv(key, default))
+
+        self.name = name
+        self.failure_rate = env(failure_rate, "LLM_BREAKER_FAILURE_RATE", 0.5)
+        self.slow_call_seconds = env(slow_call_seconds, "LLM_BREAKER_SLOW_CALL_SECONDS", 10)
+        self.slow_rate = env(slow_rate, "LLM_BREAKER_SLOW_RATE", 0.8)
+        self.min_calls = env(min_calls, "LLM_BREAKER_MIN_CALLS", 10, int)
+        self.open_seconds = env(open_seconds, "LLM_BREAKER_OPEN_SECONDS", 30)
+        self.half_open_calls = env(half_open_calls, "LLM_BREAKER_HALF_OPEN_CALLS", 3, int)
+        window = env(window, "LLM_BREAKER_WINDOW", 20, int)
+
+        self._lock = threading.Lock()
+        self._outcomes: "deque[tuple]" = deque(maxlen=max(window, self.min_calls))   # (failed, slow)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0            # lời gọi thử đang chạy / đã cho qua ở half_open
+        self._probe_successes = 0
+        self.stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    # ================= Internal =================
+    def _open_locked(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.stats["opened"] += 1
+
+    def _refresh_locked(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probes = self._probe_successes = 0
+
+    # ================= Public API =================
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh_locked()
+            return self._state
+
+    def before_call(self):
+        """Gọi trước mỗi lời gọi upstream; breaker mở → CircuitOpenError"""
+        with self._lock:
+            self._refresh_locked()
+            if self._state == self.OPEN or (
+                self._state == self.HALF_OPEN and self._probes >= self.half_open_calls
+            ):
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(f"Circuit '{self.name}' đang mở")
+            if self._state == self.HALF_OPEN:
+                self._probes += 1
+            self.stats["calls"] += 1
+
+    def cancel(self):
+        """Lời gọi bị huỷ giữa chừng (client ngắt) → không tính kết quả, trả lại lượt thử half_open"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record(self, latency: float, failed: bool):
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            if failed:
+                self.stats["failures"] += 1
+            if slow:
+                self.stats["slow_calls"] += 1
+            if self._state == self.HALF_OPEN:
+                if failed or slow:
+                    self._open_locked()
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self._state = self.CLOSED
+                return
+            if self._state != self.CLOSED:
+                return
+            self._outcomes.append((failed, slow))
+            n = len(self._outcomes)
+            if n < self.min_calls:
+                return
+            failures = sum(1 for f, _ in self._outcomes if f)
+            slows = sum(1 for _, s in self._outcomes if s)
+            if failures / n >= self.failure_rate or slows / n >= self.slow_rate:
+                self._open_locked()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh_locked()
+            stats = dict(self.stats)
+            stats["state"] = self._state
+            stats["window_calls"] = len(self._outcomes)
+        return stats
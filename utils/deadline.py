@@ -0,0 +1,89 @@
+# utils/deadline.py
+"""
+Deadline end-to-end cho 1 request. Deadline (time.monotonic tuyệt đối) nằm trong ContextVar
+→ NLU, retrieval, generation, gateway LLM đều đọc được thời gian còn lại mà không cần truyền tham số.
+Các giai đoạn có thể tự đặt deadline chặt hơn (deadline_scope), không bao giờ nới rộng deadline cha.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+_current_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Hết thời gian của request (hoặc của giai đoạn hiện tại)"""
+
+
+def remaining() -> Optional[float]:
+    """Số giây còn lại, None nếu không có deadline"""
+    deadline = _current_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check(stage: str = ""):
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"Hết deadline{f' ({stage})' if stage else ''}")
+
+
+def bound_timeout(timeout: Optional[float], stage: str = "") -> Optional[float]:
+    """Timeout của 1 lời gọi, không vượt quá thời gian còn lại; đã hết deadline → DeadlineExceeded"""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded(f"Hết deadline{f' ({stage})' if stage else ''}")
+    return left if timeout is None else min(timeout, left)
+
+
+def set_deadline(seconds: float):
+    """Đặt deadline cho context hiện tại (không nới deadline đang có), trả token để reset"""
+    target = time.monotonic() + seconds
+    current = _current_deadline.get()
+    return _current_deadline.set(target if current is None else min(current, target))
+
+
+def reset_deadline(token):
+    _current_deadline.reset(token)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float] = None, fraction: Optional[float] = None) -> Iterator[None]:
+    """
+    Deadline chặt hơn cho 1 giai đoạn: seconds giây và/hoặc fraction × thời gian còn lại
+    (vd: NLU chỉ được dùng 40% budget, phần còn lại để dành cho generation).
+    """
+    budgets = []
+    if seconds is not None:
+        budgets.append(seconds)
+    left = remaining()
+    if fraction is not None and left is not None:
+        budgets.append(max(0.0, left) * fraction)
+    if not budgets:
+        yield
+        return
+    token = set_deadline(min(budgets))
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+async def run_with_deadline(awaitable: Awaitable[T], stage: str = "") -> T:
+    """await có giới hạn theo deadline hiện tại (không có deadline → await bình thường)"""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded(f"Hết deadline{f' ({stage})' if stage else ''}")
+    try:
+        return await asyncio.wait_for(awaitable, timeout=left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"Hết deadline{f' ({stage})' if stage else ''}") from None
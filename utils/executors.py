@@ -0,0 +1,165 @@
+# utils/executors.py
+"""
+Bulkhead cho việc blocking: mỗi loại việc chạy trong pool thread riêng, kích thước + hàng đợi riêng
+  llm    → lời gọi LLM sync (fallback khi LLM không có API async)
+  cpu    → embedding, xếp hạng câu, Chroma search, cache ngữ nghĩa
+  db     → SQLite: session / chat_logs / LLM cache / endpoint admin
+  report → báo cáo UXO khẩn cấp (không xếp hàng sau chat log khi chat quá tải)
+Pool này dồn ứ (vd: Gemini chậm) không làm đói pool khác; hàng đợi đầy → ExecutorSaturatedError ngay
+thay vì chờ vô hạn. Cấu hình: EXECUTOR_<NAME>_WORKERS, EXECUTOR_<NAME>_QUEUE.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple, TypeVar
+
+from utils.prefork import register_after_fork
+
+T = TypeVar("T")
+
+# (số thread, số việc chờ tối đa)
+POOL_DEFAULTS: Dict[str, Tuple[int, int]] = {
+    "llm": (32, 256),
+    "cpu": (os.cpu_count() or 4, 512),
+    "db": (8, 1024),
+    "report": (2, 256),
+}
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Hàng đợi của pool đã đầy — từ chối ngay, caller trả 503"""
+
+    def __init__(self, pool: str):
+        super().__init__(f"Pool '{pool}' đang quá tải")
+        self.pool = pool
+
+
+class BoundedExecutor:
+    """ThreadPoolExecutor có tên, giới hạn số việc chờ và đo độ bão hoà"""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "peak_queued": 0,
+                      "wait_ms_total": 0.0, "wait_ms_max": 0.0, "run_ms_total": 0.0}
+
+    def _dequeued(self, future: Future):
+        # Bị huỷ trước khi có thread chạy → không bao giờ vào _call
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def _call(self, enqueued_at: float, fn: Callable[..., T], *args, **kwargs) -> T:
+        started = time.perf_counter()
+        wait_ms = (started - enqueued_at) * 1000
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self.stats["wait_ms_total"] += wait_ms
+            self.stats["wait_ms_max"] = max(self.stats["wait_ms_max"], wait_ms)
+        failed = True
+        try:
+            result = fn(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            with self._lock:
+                self._active -= 1
+                self.stats["failed" if failed else "completed"] += 1
+                self.stats["run_ms_total"] += (time.perf_counter() - started) * 1000
+
+    def submit(self, fn: Callable[..., T], *args, **kwargs) -> "Future[T]":
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise ExecutorSaturatedError(self.name)
+            self._queued += 1
+            self.stats["submitted"] += 1
+            self.stats["peak_queued"] = max(self.stats["peak_queued"], self._queued)
+        future = self._executor.submit(self._call, time.perf_counter(), fn, *args, **kwargs)
+        future.add_done_callback(self._dequeued)
+        return future
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Như asyncio.to_thread (mang theo ContextVar: timeline, deadline) nhưng chạy trong pool này"""
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        return await asyncio.wrap_future(self.submit(call))
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            active, queued = self._active, self._queued
+        finished = stats["completed"] + stats["failed"]
+        started = finished + active
+        stats.update(
+            workers=self.max_workers, max_queue=self.max_queue, active=active, queued=queued,
+            utilization=round(active / self.max_workers, 4),
+            saturated=active >= self.max_workers and queued > 0,
+            wait_ms_avg=round(stats["wait_ms_total"] / started, 2) if started else 0.0,
+            run_ms_avg=round(stats["run_ms_total"] / finished, 2) if finished else 0.0,
+        )
+        stats["wait_ms_total"] = round(stats["wait_ms_total"], 1)
+        stats["wait_ms_max"] = round(stats["wait_ms_max"], 1)
+        stats["run_ms_total"] = round(stats["run_ms_total"], 1)
+        return stats
+
+
+_pools: Dict[str, BoundedExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # Thread của pool không sang process con → worker tạo pool mới khi dùng lần đầu
+    global _pools_lock
+    _pools.clear()
+    _pools_lock = threading.Lock()
+
+
+register_after_fork(_reset_after_fork)
+
+
+def get_executor(name: str) -> BoundedExecutor:
+    """Pool theo tên, tạo lần đầu dùng (kích thước đọc từ env, mặc định POOL_DEFAULTS)"""
+    pool = _pools.get(name)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        if name not in _pools:
+            workers, queue = POOL_DEFAULTS.get(name, (4, 256))
+            _pools[name] = BoundedExecutor(
+                name,
+                max_workers=int(os.getenv(f"EXECUTOR_{name.upper()}_WORKERS", workers)),
+                max_queue=int(os.getenv(f"EXECUTOR_{name.upper()}_QUEUE", queue)),
+            )
+        return _pools[name]
+
+
+async def run_in(name: str, fn: Callable[..., T], *args, **kwargs) -> T:
+    """await run_in("db", crud.create_chat_log, db, ...) — thay cho asyncio.to_thread"""
+    return await get_executor(name).run(fn, *args, **kwargs)
+
+
+def get_executor_stats() -> Dict[str, Dict[str, Any]]:
+    with _pools_lock:
+        pools = dict(_pools)
+    return {name: pool.get_stats() for name, pool in pools.items()}
+
+
+def shutdown_executors(wait: bool = False):
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=wait)
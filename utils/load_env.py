@@ -1,23 +1,60 @@
 import os
+import logging
+from contextlib import contextmanager
 from dotenv import load_dotenv, set_key, dotenv_values
 import secrets
 
+try:
+    import fcntl
+except ImportError:  # Windows: không có flock
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
 # ===== Load env hiện tại =====
 env_file = os.path.join(os.path.dirname(__file__), "..", ".env")
 load_dotenv(env_file)
 
-# ===== Check SECRET_KEY =====
-config = dotenv_values(env_file)
-if "SECRET_KEY" not in config or not config["SECRET_KEY"]:
-    # Generate key mới
-    new_key = secrets.token_urlsafe(32)
-    # Ghi vào .env
-    set_key(env_file, "SECRET_KEY", new_key)
-    print(f"✅ SECRET_KEY mới được tạo và lưu vào .env: {new_key}")
-
-# Load lại .env sau khi có SECRET_KEY
-load_dotenv(env_file)
 
-# Lấy giá trị SECRET_KEY
-SECRET_KEY = os.getenv("SECRET_KEY")
+@contextmanager
+def _env_file_lock(path: str):
+    """Khoá file cạnh .env: chỉ 1 process đọc-tạo-ghi SECRET_KEY tại một thời điểm"""
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def ensure_secret_key(path: str = env_file) -> str:
+    """
+    Đọc SECRET_KEY trong .env, chưa có thì tạo và ghi vào (hoặc chạy trước khi cài đặt: python -m utils.load_env).
+    Đọc lại .env trong lúc giữ khoá → nhiều worker khởi động cùng lúc (uvicorn --workers) dùng chung 1 key,
+    không ghi đè key của nhau.
+    """
+    with _env_file_lock(path):
+        config = dotenv_values(path) if os.path.exists(path) else {}
+        key = config.get("SECRET_KEY")
+        if not key:
+            key = secrets.token_urlsafe(32)
+            open(path, "a").close()
+            set_key(path, "SECRET_KEY", key)
+            logger.warning("🔑 Chưa có SECRET_KEY → đã tạo key mới và lưu vào .env")
+    os.environ["SECRET_KEY"] = key
+    return key
+
+
+# ===== Check SECRET_KEY =====
+# app.serve import module này ở master trước khi fork → key được tạo 1 lần, mọi worker dùng chung.
+# Nhiều replica trên nhiều máy không chung .env → đặt SECRET_KEY qua env.
+SECRET_KEY = os.getenv("SECRET_KEY") or ensure_secret_key()
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
+
+
+if __name__ == "__main__":
+    ensure_secret_key()
+    print("✅ SECRET_KEY đã có trong .env")
@@ -0,0 +1,250 @@
+# utils/logging_setup.py
+"""
+Logging cho process API: bản ghi JSON (1 dòng / record) gắn request id, ghi ra stdout bằng thread nền
+(QueueHandler → QueueListener): request / event loop chỉ đẩy record vào hàng đợi, không bao giờ chờ I/O;
+hàng đợi đầy → bỏ record và đếm (get_logging_stats → /health "logging").
+  request id : RequestIdMiddleware lấy header X-Request-ID (không có → tự sinh), trả lại trong response;
+               các pool run_in copy context → log trong thread pool cũng mang request id
+  sampling   : record DEBUG chỉ được ghi cho 1 phần request (LOG_DEBUG_SAMPLE_RATE, quyết định 1 lần mỗi
+               request → request được chọn có đủ chuỗi debug); ngoài request → chọn ngẫu nhiên từng record
+Cấu hình:
+  LOG_LEVEL=INFO                                   mức của root
+  LOG_LEVELS=ai_core.nlu_processor=DEBUG,httpx=WARNING   mức theo module
+  LOG_FORMAT=json | text                           text: dòng dễ đọc khi chạy local
+  LOG_DEBUG_SAMPLE_RATE=0.01
+  LOG_QUEUE_SIZE=10000
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from utils.prefork import register_after_fork
+
+LOG_WRITER_THREAD = "log-writer"
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_debug_sampled: ContextVar[Optional[bool]] = ContextVar("debug_sampled", default=None)
+
+# Thuộc tính chuẩn của LogRecord — phần còn lại (logger.info(..., extra={...})) đưa vào JSON
+_RECORD_ATTRS = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {"message", "request_id"}
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def set_request_id(request_id: Optional[str] = None, sample_rate: Optional[float] = None):
+    """Gắn request id (+ quyết định sampling debug) cho context hiện tại; trả token cho reset_request_id"""
+    rate = _state["sample_rate"] if sample_rate is None else sample_rate
+    sampled_token = _debug_sampled.set(random.random() < rate)
+    return _request_id.set(request_id or uuid.uuid4().hex[:16]), sampled_token
+
+
+def reset_request_id(tokens):
+    request_token, sampled_token = tokens
+    _request_id.reset(request_token)
+    _debug_sampled.reset(sampled_token)
+
+
+class RequestContextFilter(logging.Filter):
+    """Chạy ở thread gọi log (trước khi vào hàng đợi): gắn request id, lọc DEBUG theo sampling"""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        if record.levelno <= logging.DEBUG:
+            sampled = _debug_sampled.get()
+            if sampled is None:
+                sampled = random.random() < self.sample_rate
+            if not sampled:
+                self.sampled_out += 1
+                return False
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        worker = os.environ.get("SERVE_WORKER_ID")   # app.serve đặt sau fork
+        if worker is not None:
+            entry["worker"] = worker
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if getattr(record, "request_id", None) is None:
+            record.request_id = "-"
+        return super().format(record)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """put_nowait: hàng đợi đầy → bỏ record (đếm lại) thay vì chặn request hoặc in traceback"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Format đầy đủ ở thread nền; ở đây chỉ chốt message + traceback thành chuỗi (args có thể đổi sau đó)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_state: Dict[str, Any] = {"handler": None, "output": None, "listener": None, "filter": None, "format": None,
+                          "sample_rate": 0.01, "queue_size": 10000}
+_lock = threading.Lock()
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _start_listener(handler: _DroppingQueueHandler, output: logging.Handler):
+    listener = logging.handlers.QueueListener(handler.queue, output)
+    listener.start()
+    listener._thread.name = LOG_WRITER_THREAD
+    _state["listener"] = listener
+
+
+def _after_fork():
+    # Thread ghi log không sang process con: lock + hàng đợi mới (lock cũ có thể đang bị giữ lúc fork) + thread mới
+    global _lock
+    _lock = threading.Lock()
+    handler = _state["handler"]
+    if handler is None or _state["listener"] is None:
+        return
+    handler.queue = queue.Queue(maxsize=_state["queue_size"])
+    _start_listener(handler, _state["output"])
+
+
+register_after_fork(_after_fork)
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None,
+                      module_levels: Optional[str] = None, sample_rate: Optional[float] = None,
+                      stream=None):
+    """Thay handler của root bằng QueueHandler JSON (gọi lại được: dừng listener cũ trước)"""
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = fmt or os.getenv("LOG_FORMAT", "json")
+    sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 0.01) if sample_rate is None else sample_rate)
+    queue_size = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+    with _lock:
+        shutdown_logging()
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+
+        handler = _DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        context_filter = RequestContextFilter(sample_rate)
+        handler.addFilter(context_filter)
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+        for name, module_level in _parse_levels(module_levels or os.getenv("LOG_LEVELS", "")).items():
+            logging.getLogger(name).setLevel(module_level)
+
+        _state.update(handler=handler, output=output, filter=context_filter, format=fmt, sample_rate=sample_rate,
+                      queue_size=queue_size)
+        _start_listener(handler, output)
+
+
+def shutdown_logging():
+    """Dừng thread ghi log sau khi ghi hết hàng đợi (shutdown của app / atexit)"""
+    listener = _state.get("listener")
+    if listener is not None and listener._thread is not None:
+        listener.stop()
+    _state["listener"] = None
+
+
+atexit.register(shutdown_logging)
+
+
+def get_logging_stats() -> Dict[str, Any]:
+    handler, context_filter = _state["handler"], _state["filter"]
+    if handler is None:
+        return {"enabled": False}
+    return {
+        "format": _state["format"],
+        "level": logging.getLevelName(logging.getLogger().level),
+        "debug_sample_rate": _state["sample_rate"],
+        "queued": handler.queue.qsize(),
+        "dropped": handler.dropped,
+        "debug_sampled_out": context_filter.sampled_out,
+    }
+
+
+class RequestIdMiddleware:
+    """ASGI middleware (http + websocket): request id cho mọi log của request, trả lại ở header X-Request-ID"""
+
+    def __init__(self, app, header: str = "x-request-id"):
+        self.app = app
+        self.header = header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        tokens = set_request_id((Headers(scope=scope).get(self.header) or "")[:64] or None)
+        request_id = get_request_id()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(self.header, request_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            reset_request_id(tokens)
@@ -0,0 +1,24 @@
+# utils/prefork.py
+"""
+Hook chạy trong process con ngay sau fork, cho state không được dùng chung giữa cha và con:
+thread (không còn tồn tại ở con), lock có thể đang bị giữ lúc fork, socket / kết nối SQLite.
+Dùng cho app.serve (nạp model một lần ở master rồi fork worker) và mọi lần os.fork khác.
+"""
+import os
+import weakref
+from typing import Callable
+
+
+def register_after_fork(callback: Callable[[], None]):
+    """callback: hàm hoặc bound method; bound method giữ tham chiếu yếu (object đã bị thu hồi → bỏ qua)"""
+    if hasattr(callback, "__self__"):
+        ref = weakref.WeakMethod(callback)
+
+        def run():
+            method = ref()
+            if method is not None:
+                method()
+    else:
+        run = callback
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=run)
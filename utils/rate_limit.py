@@ -0,0 +1,54 @@
+# utils/rate_limit.py
+"""
+Token bucket dùng được cho cả code sync (thread) lẫn async.
+reserve() lấy trước 1 token (cho phép âm) và trả số giây phải chờ → caller tự sleep
+bằng time.sleep hoặc asyncio.sleep, bucket không phải biết đang chạy kiểu nào.
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        """rate: token/giây, capacity: số token tối đa tích luỹ (burst), mặc định = rate (≥ 1)"""
+        if rate <= 0:
+            raise ValueError("rate phải > 0")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_locked(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Đặt trước `tokens` token, trả số giây cần chờ trước khi được dùng (0 nếu có sẵn)"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill_locked(now)
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Lấy token nếu có ngay, không chờ"""
+        with self._lock:
+            self._refill_locked(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def refund(self, tokens: float = 1.0):
+        """Trả lại token đã lấy bằng try_acquire (vd: request bị bucket khác từ chối)"""
+        with self._lock:
+            self._refill_locked(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + tokens)
+
+    def retry_after(self, tokens: float = 1.0) -> float:
+        """Số giây đến khi đủ `tokens` token (dùng cho header Retry-After)"""
+        with self._lock:
+            self._refill_locked(time.monotonic())
+            missing = tokens - self._tokens
+            return 0.0 if missing <= 0 else missing / self.rate
@@ -0,0 +1,185 @@
+# utils/session_registry.py
+"""
+Registry session duy nhất của process: TTL + LRU + giới hạn số entry / số byte.
+
+Mọi session có cùng TTL nên thứ tự LRU (OrderedDict, touch = move_to_end) cũng chính là
+thứ tự hết hạn — đầu danh sách luôn là session hết hạn sớm nhất. Vì vậy touch và expiry
+đều O(1) (như timer wheel 1 ô), không cần quét toàn bộ như cleanup cũ.
+
+Khi 1 session bị xoá (hết hạn, vượt cap, xoá tay), các listener được gọi ngay trong lock
+để dọn toàn bộ state theo session (memory, last_intent, last_question...).
+"""
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Chỉ nhận session id do client gửi nếu đúng dạng này (UUID, token...)
+_SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_\-]{8,128}$")
+
+# Ước lượng overhead metadata của 1 entry (dict/OrderedDict node/object)
+_ENTRY_OVERHEAD_BYTES = 256
+
+
+class SessionInfo:
+    __slots__ = ("session_id", "created_at", "last_activity", "message_count", "size_bytes", "_touched_at")
+
+    def __init__(self, session_id: str):
+        now = datetime.now()
+        self.session_id = session_id
+        self.created_at = now
+        self.last_activity = now
+        self.message_count = 0
+        self.size_bytes = 0
+        self._touched_at = time.monotonic()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "created_at": self.created_at,
+            "last_activity": self.last_activity,
+            "message_count": self.message_count,
+            "size_bytes": self.size_bytes,
+        }
+
+
+class SessionRegistry:
+    def __init__(self, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("SESSION_TTL_SECONDS", 24 * 3600))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("SESSION_MAX_ENTRIES", 100_000))
+        self.max_bytes = (
+            max_bytes if max_bytes is not None
+            else int(float(os.getenv("SESSION_MAX_MB", 256)) * 1024 * 1024)
+        )
+        self._lock = threading.RLock()
+        self._sessions: "OrderedDict[str, SessionInfo]" = OrderedDict()
+        self._total_bytes = 0
+        self._listeners: List[Callable[[str], None]] = []
+        self.stats = {"created": 0, "adopted": 0, "expired": 0, "evicted_entries": 0, "evicted_bytes": 0, "removed": 0}
+
+    # ================= Listeners =================
+    def add_eviction_listener(self, listener: Callable[[str], None]):
+        """listener(session_id) được gọi khi session bị xoá vì bất kỳ lý do gì"""
+        self._listeners.append(listener)
+
+    # ================= Internal (gọi khi đã giữ lock) =================
+    def _drop_locked(self, session_id: str, reason: str):
+        info = self._sessions.pop(session_id, None)
+        if info is None:
+            return
+        self._total_bytes -= info.size_bytes
+        self.stats[reason] += 1
+        for listener in self._listeners:
+            try:
+                listener(session_id)
+            except Exception as e:
+                logger.error(f"❌ Session cleanup listener lỗi ({session_id}): {e}")
+
+    def _expire_locked(self, now: float):
+        # Đầu OrderedDict = session ít hoạt động nhất = hết hạn sớm nhất
+        while self._sessions:
+            session_id, info = next(iter(self._sessions.items()))
+            if now - info._touched_at < self.ttl_seconds:
+                break
+            self._drop_locked(session_id, "expired")
+
+    def _enforce_caps_locked(self, keep: Optional[str] = None):
+        while len(self._sessions) > self.max_entries:
+            self._drop_locked(next(iter(self._sessions)), "evicted_entries")
+        while self._total_bytes > self.max_bytes and len(self._sessions) > 1:
+            oldest = next(iter(self._sessions))
+            if oldest == keep:
+                break
+            self._drop_locked(oldest, "evicted_bytes")
+
+    def _get_or_add_locked(self, session_id: str, now: float) -> SessionInfo:
+        info = self._sessions.get(session_id)
+        if info is None:
+            info = SessionInfo(session_id)
+            info.size_bytes = _ENTRY_OVERHEAD_BYTES + len(session_id)
+            self._sessions[session_id] = info
+            self._total_bytes += info.size_bytes
+        else:
+            self._sessions.move_to_end(session_id)
+        info._touched_at = now
+        return info
+
+    # ================= Public API =================
+    @staticmethod
+    def is_valid_id(session_id: Optional[str]) -> bool:
+        return bool(session_id) and bool(_SESSION_ID_PATTERN.match(session_id))
+
+    def touch(self, session_id: Optional[str] = None) -> str:
+        """
+        Ghi nhận 1 request của session, trả session id dùng được:
+          - id đã biết → cập nhật last_activity
+          - id lạ nhưng hợp lệ (vd: server restart, session đã hết hạn) → nhận luôn id đó,
+            không sinh UUID mới mỗi lần (client giữ id cũ sẽ không làm phình registry)
+          - không có id / id sai định dạng → tạo UUID mới
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire_locked(now)
+            if session_id in self._sessions:
+                info = self._get_or_add_locked(session_id, now)
+                info.last_activity = datetime.now()
+                info.message_count += 1
+                return session_id
+
+            if self.is_valid_id(session_id):
+                self.stats["adopted"] += 1
+            else:
+                session_id = str(uuid.uuid4())
+                self.stats["created"] += 1
+                logger.info(f"🆕 Created new session: {session_id}")
+            self._get_or_add_locked(session_id, now)
+            self._enforce_caps_locked(keep=session_id)
+            return session_id
+
+    def update_size(self, session_id: str, state_bytes: int):
+        """Cập nhật dung lượng state của session (memory hội thoại...), vượt cap → evict LRU"""
+        now = time.monotonic()
+        with self._lock:
+            info = self._get_or_add_locked(session_id, now)
+            new_size = _ENTRY_OVERHEAD_BYTES + len(session_id) + state_bytes
+            self._total_bytes += new_size - info.size_bytes
+            info.size_bytes = new_size
+            self._enforce_caps_locked(keep=session_id)
+
+    def get(self, session_id: str) -> Optional[SessionInfo]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def remove(self, session_id: str) -> bool:
+        with self._lock:
+            existed = session_id in self._sessions
+            self._drop_locked(session_id, "removed")
+            return existed
+
+    def sweep(self) -> int:
+        """Xoá các session hết hạn, trả số session đã xoá (chỉ duyệt phần đã hết hạn)"""
+        with self._lock:
+            before = len(self._sessions)
+            self._expire_locked(time.monotonic())
+            return before - len(self._sessions)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._sessions)
+            stats["bytes"] = self._total_bytes
+        return stats
@@ -0,0 +1,544 @@
+# utils/session_store.py
+"""
+SessionStore: nơi lưu state theo session (metadata, cửa sổ hội thoại) dùng chung giữa các
+worker/node và giữ được qua restart.
+
+Backend:
+  - InMemorySessionStore : trong process (mặc định, giống hành vi cũ), LRU + TTL
+  - SQLiteSessionStore   : file SQLite (WAL) — nhiều worker trên cùng máy
+  - RedisSessionStore    : giao thức Redis (RESP) — nhiều node; test được với scripts.fake_redis_server
+
+SQLite / Redis đi qua BufferedSessionStore:
+  - ghi kiểu write-behind: put() chỉ ghi vào buffer, thread nền flush theo lô mỗi flush_interval
+  - đọc read-through: cache cục bộ có TTL ngắn (đọc lặp trong 1 request không chạm backend)
+Giá trị là dict JSON-serializable.
+
+compare_and_set(): ghi đồng bộ có điều kiện theo field "version" của value (so tại backend — nơi các
+worker cùng nhìn thấy) cho state bị nhiều worker sửa cùng lúc (memory hội thoại): worker ghi sau
+thấy version đã đổi → nhận False, nạp lại state mới rồi áp lại thay đổi của mình thay vì ghi đè.
+Backend lỗi → SessionStoreUnavailable (không lùi về ghi đè mù: không so được version thì không ghi).
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from utils.prefork import register_after_fork
+
+logger = logging.getLogger(__name__)
+
+
+def _version_of(value: Optional[Dict[str, Any]]) -> int:
+    """Version của state trong store (chưa có → 0)"""
+    return (value or {}).get("version", 0)
+
+
+class SessionStore:
+    """Interface chung"""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def put(self, key: str, value: Dict[str, Any]):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def compare_and_set(self, key: str, expected_version: int, value: Dict[str, Any]) -> bool:
+        """Ghi value chỉ khi version hiện tại trong store (chưa có → 0) bằng expected_version.
+        False: worker khác vừa ghi trước → caller nạp lại state rồi thử lại.
+        Backend lỗi → SessionStoreUnavailable"""
+        raise NotImplementedError
+
+    def flush(self):
+        """Ghi ngay mọi thay đổi đang chờ"""
+
+    def close(self):
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__}
+
+
+# ================= In-memory =================
+class InMemorySessionStore(SessionStore):
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("SESSION_MAX_ENTRIES", 100_000))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("SESSION_TTL_SECONDS", 24 * 3600))
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._get_locked(key)
+
+    def _get_locked(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if time.monotonic() - item[0] > self.ttl_seconds:
+            del self._data[key]
+            return None
+        return item[1]
+
+    def _put_locked(self, key: str, value: Dict[str, Any]):
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def put(self, key: str, value: Dict[str, Any]):
+        with self._lock:
+            self._put_locked(key, value)
+
+    def compare_and_set(self, key: str, expected_version: int, value: Dict[str, Any]) -> bool:
+        with self._lock:
+            if _version_of(self._get_locked(key)) != expected_version:
+                return False
+            self._put_locked(key, value)
+        return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "entries": len(self._data)}
+
+
+# ================= Write-behind + read-through =================
+_DELETED = object()
+
+
+class SessionStoreUnavailable(RuntimeError):
+    """Backend không trả lời được compare_and_set — không biết version hiện tại nên không ghi"""
+
+
+class BufferedSessionStore(SessionStore):
+    """Backend con chỉ cần cài _load / _save_many / _delete_many / _compare_and_set"""
+
+    def __init__(self, flush_interval: Optional[float] = None, cache_ttl: Optional[float] = None,
+                 cache_size: int = 10_000, max_batch: int = 500):
+        self.flush_interval = (
+            flush_interval if flush_interval is not None else float(os.getenv("SESSION_FLUSH_INTERVAL", 0.2))
+        )
+        self.cache_ttl = cache_ttl if cache_ttl is not None else float(os.getenv("SESSION_CACHE_TTL", 1.0))
+        self.cache_size = cache_size
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[str, Any] = {}     # key → value | _DELETED
+        self._cache: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self.stats = {"cache_hits": 0, "backend_reads": 0, "writes": 0, "flushes": 0, "flushed_keys": 0,
+                      "cas_writes": 0, "cas_conflicts": 0, "cas_errors": 0, "errors": 0}
+        self._stop = threading.Event()
+        self._start_flusher()
+        register_after_fork(self._after_fork)
+
+    def _start_flusher(self):
+        self._flusher = threading.Thread(target=self._flush_loop, name=f"{type(self).__name__}-flusher", daemon=True)
+        self._flusher.start()
+
+    def _after_fork(self):
+        """Worker sau fork: lock / thread flush mới, buffer chưa flush của master không ghi lại lần nữa"""
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._reconnect()
+        if not self._stop.is_set():
+            self._start_flusher()
+
+    def _reconnect(self):
+        """Backend có kết nối riêng (SQLite, socket Redis) mở lại kết nối ở process con"""
+
+    # ----- backend -----
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def _save_many(self, items: List[Tuple[str, Dict[str, Any]]]):
+        raise NotImplementedError
+
+    def _delete_many(self, keys: List[str]):
+        raise NotImplementedError
+
+    def _compare_and_set(self, key: str, expected_version: int, value: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    # ----- cache cục bộ -----
+    def _cache_put_locked(self, key: str, value: Optional[Dict[str, Any]]):
+        self._cache[key] = (time.monotonic(), value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # ----- API -----
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key in self._pending:
+                value = self._pending[key]
+                return None if value is _DELETED else value
+            cached = self._cache.get(key)
+            if cached is not None and time.monotonic() - cached[0] <= self.cache_ttl:
+                self.stats["cache_hits"] += 1
+                return cached[1]
+            self.stats["backend_reads"] += 1
+        try:
+            value = self._load(key)
+        except Exception as e:
+            logger.error(f"❌ Session store read lỗi ({key}): {e}")
+            with self._lock:
+                self.stats["errors"] += 1
+            return None
+        with self._lock:
+            if key not in self._pending:
+                self._cache_put_locked(key, value)
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]):
+        with self._lock:
+            self._pending[key] = value
+            self._cache_put_locked(key, value)
+            self.stats["writes"] += 1
+            should_flush = len(self._pending) >= self.max_batch
+        if should_flush:
+            self.flush()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._pending[key] = _DELETED
+            self._cache_put_locked(key, None)
+            self.stats["writes"] += 1
+
+    def compare_and_set(self, key: str, expected_version: int, value: Dict[str, Any]) -> bool:
+        """Không qua buffer: version phải so ở backend. Giữ _flush_lock để không chen giữa 1 lần flush dở"""
+        try:
+            with self._flush_lock:
+                with self._lock:
+                    pending = key in self._pending
+                if pending:
+                    self._flush_locked()
+                ok = self._compare_and_set(key, expected_version, value)
+        except Exception as e:
+            # Không so được version → không ghi (write-behind ở đây sẽ đè lượt của worker khác khi backend sống lại)
+            logger.error(f"❌ Session store compare-and-set lỗi ({key}): {e}")
+            with self._lock:
+                self.stats["errors"] += 1
+                self.stats["cas_errors"] += 1
+                self._cache.pop(key, None)
+            raise SessionStoreUnavailable(f"compare-and-set {key}: {e}") from e
+        with self._lock:
+            if ok:
+                self._cache_put_locked(key, value)
+                self.stats["cas_writes"] += 1
+            else:
+                # Bản cache đã cũ → lần get sau đọc thẳng backend
+                self._cache.pop(key, None)
+                self.stats["cas_conflicts"] += 1
+        return ok
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+        saves = [(k, v) for k, v in pending.items() if v is not _DELETED]
+        deletes = [k for k, v in pending.items() if v is _DELETED]
+        try:
+            if saves:
+                self._save_many(saves)
+            if deletes:
+                self._delete_many(deletes)
+        except Exception as e:
+            logger.error(f"❌ Session store flush lỗi ({len(pending)} keys): {e}")
+            with self._lock:
+                self.stats["errors"] += 1
+                # Trả lại buffer (thay đổi mới hơn trong lúc flush được giữ nguyên)
+                for k, v in pending.items():
+                    self._pending.setdefault(k, v)
+            return
+        with self._lock:
+            self.stats["flushes"] += 1
+            self.stats["flushed_keys"] += len(pending)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["pending"] = len(self._pending)
+            stats["cached"] = len(self._cache)
+        stats["backend"] = type(self).__name__
+        return stats
+
+
+# ================= SQLite (WAL) =================
+class SQLiteSessionStore(BufferedSessionStore):
+    def __init__(self, path: Optional[str] = None, ttl_seconds: Optional[float] = None, **kwargs):
+        self.path = path or os.getenv("SESSION_STORE_PATH", "data/sessions.sqlite3")
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("SESSION_TTL_SECONDS", 24 * 3600))
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db_lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at)")
+        self._last_purge = 0.0
+        super().__init__(**kwargs)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+
+    def _reconnect(self):
+        self._db_lock = threading.Lock()
+        self._conn = self._connect()
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT value FROM sessions WHERE key = ? AND updated_at >= ?",
+                (key, time.time() - self.ttl_seconds),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save_many(self, items: List[Tuple[str, Dict[str, Any]]]):
+        now = time.time()
+        rows = [(k, json.dumps(v, ensure_ascii=False, default=str), now) for k, v in items]
+        with self._db_lock:
+            # 1 transaction cho cả lô → 1 lần fsync WAL
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO sessions (key, value, updated_at) VALUES (?, ?, ?)", rows)
+                if now - self._last_purge > 300:
+                    self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_seconds,))
+                    self._last_purge = now
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _delete_many(self, keys: List[str]):
+        with self._db_lock:
+            self._conn.executemany("DELETE FROM sessions WHERE key = ?", [(k,) for k in keys])
+
+    def _compare_and_set(self, key: str, expected_version: int, value: Dict[str, Any]) -> bool:
+        now = time.time()
+        with self._db_lock:
+            # BEGIN IMMEDIATE: giữ write lock của file từ lúc đọc version → worker khác không chen giữa
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value FROM sessions WHERE key = ? AND updated_at >= ?",
+                    (key, now - self.ttl_seconds),
+                ).fetchone()
+                ok = _version_of(json.loads(row[0]) if row else None) == expected_version
+                if ok:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO sessions (key, value, updated_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(value, ensure_ascii=False, default=str), now),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ok
+
+
+# ================= Redis (RESP) =================
+class RedisError(Exception):
+    pass
+
+
+class RespClient:
+    """Client giao thức Redis tối giản (đủ cho GET/SET/DEL + pipeline + WATCH/MULTI/EXEC), không cần thư viện ngoài"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, timeout: float = 2.0):
+        self.host, self.port, self.db, self.password, self.timeout = host, port, db, password, timeout
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url: str) -> "RespClient":
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip("/") or 0)
+        return cls(parsed.hostname or "127.0.0.1", parsed.port or 6379, db, parsed.password)
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        if self.password:
+            self._roundtrip([("AUTH", self.password)])
+        if self.db:
+            self._roundtrip([("SELECT", str(self.db))])
+
+    def _close(self):
+        try:
+            if self._sock is not None:
+                self._sock.close()
+        finally:
+            self._sock = None
+            self._file = None
+
+    @staticmethod
+    def _encode(args: Iterable[Any]) -> bytes:
+        parts = []
+        args = list(args)
+        parts.append(f"*{len(args)}\r\n".encode())
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        return b"".join(parts)
+
+    def _read_reply(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Redis đóng kết nối")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode()
+        if prefix == b"-":
+            return RedisError(payload.decode())
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            data = self._file.read(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            length = int(payload)
+            return None if length == -1 else [self._read_reply() for _ in range(length)]
+        raise RedisError(f"Reply không hợp lệ: {line!r}")
+
+    def _roundtrip(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        self._sock.sendall(b"".join(self._encode(cmd) for cmd in commands))
+        return [self._read_reply() for _ in commands]
+
+    def pipeline(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        """Gửi nhiều lệnh trong 1 lần ghi socket, đọc lần lượt các reply (retry 1 lần nếu mất kết nối)"""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    replies = self._roundtrip(commands)
+                    break
+                except (OSError, ConnectionError):
+                    self._close()
+                    if attempt == 1:
+                        raise
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def execute(self, *args) -> Any:
+        return self.pipeline([args])[0]
+
+    def check_and_set(self, key: str, check: Callable[[Optional[bytes]], bool],
+                      commands: List[Tuple[Any, ...]]) -> bool:
+        """
+        Transaction lạc quan: WATCH key → GET → check(giá trị hiện tại) → MULTI / commands / EXEC.
+        False nếu check sai hoặc key bị client khác ghi giữa GET và EXEC (EXEC trả nil).
+        """
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    watched, current = self._roundtrip([("WATCH", key), ("GET", key)])
+                    break
+                except (OSError, ConnectionError):
+                    # Chỉ retry trước MULTI: EXEC đã gửi mà mất reply thì không biết đã ghi hay chưa
+                    self._close()
+                    if attempt == 1:
+                        raise
+            for reply in (watched, current):
+                if isinstance(reply, RedisError):
+                    self._roundtrip([("UNWATCH",)])
+                    raise reply
+            if not check(current):
+                self._roundtrip([("UNWATCH",)])
+                return False
+            try:
+                replies = self._roundtrip([("MULTI",), *commands, ("EXEC",)])
+            except (OSError, ConnectionError):
+                self._close()
+                raise
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies[-1] is not None
+
+
+class RedisSessionStore(BufferedSessionStore):
+    def __init__(self, url: Optional[str] = None, ttl_seconds: Optional[float] = None,
+                 prefix: str = "uxo:session:", **kwargs):
+        self.url = url or os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+        self.ttl_seconds = int(ttl_seconds if ttl_seconds is not None else float(os.getenv("SESSION_TTL_SECONDS", 24 * 3600)))
+        self.prefix = prefix
+        self.client = RespClient.from_url(self.url)
+        self.client.execute("PING")
+        super().__init__(**kwargs)
+
+    def _reconnect(self):
+        # Đóng bản fd kế thừa (socket của master vẫn mở), lệnh đầu tiên ở worker tự kết nối lại
+        self.client._lock = threading.Lock()
+        self.client._close()
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.execute("GET", self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def _save_many(self, items: List[Tuple[str, Dict[str, Any]]]):
+        self.client.pipeline([
+            ("SET", self.prefix + k, json.dumps(v, ensure_ascii=False, default=str), "EX", self.ttl_seconds)
+            for k, v in items
+        ])
+
+    def _delete_many(self, keys: List[str]):
+        self.client.execute("DEL", *[self.prefix + k for k in keys])
+
+    def _compare_and_set(self, key: str, expected_version: int, value: Dict[str, Any]) -> bool:
+        redis_key = self.prefix + key
+        return self.client.check_and_set(
+            redis_key,
+            lambda raw: _version_of(json.loads(raw) if raw else None) == expected_version,
+            [("SET", redis_key, json.dumps(value, ensure_ascii=False, default=str), "EX", self.ttl_seconds)],
+        )
+
+
+def create_session_store(backend: Optional[str] = None) -> SessionStore:
+    """SESSION_STORE=memory (mặc định) | sqlite | redis"""
+    backend = (backend or os.getenv("SESSION_STORE", "memory")).lower()
+    if backend == "sqlite":
+        store = SQLiteSessionStore()
+    elif backend == "redis":
+        store = RedisSessionStore()
+    else:
+        store = InMemorySessionStore()
+    logger.info(f"✅ Session store: {type(store).__name__}")
+    return store
@@ -0,0 +1,44 @@
+# utils/single_flight.py
+"""
+Single-flight: các lời gọi đồng thời cùng key dùng chung 1 lần thực thi (kiểu golang singleflight).
+Chỉ gộp các lời gọi đang chạy song song — không phải cache, xong là key được giải phóng.
+"""
+import asyncio
+import re
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+def normalize_question(text: str) -> str:
+    """'  Mìn là gì ?' → 'mìn là gì' (NFC, chữ thường, bỏ dấu câu / khoảng trắng thừa)"""
+    text = unicodedata.normalize("NFC", text or "").lower()
+    return " ".join(re.findall(r"\w+", text))
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[Hashable, "asyncio.Task"] = {}
+        self.stats = {"calls": 0, "executions": 0, "coalesced": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Trả (kết quả, shared). shared=True nghĩa là dùng lại kết quả của lời gọi khác.
+        Công việc chạy trong task riêng → 1 client ngắt kết nối không huỷ kết quả của những người đang chờ.
+        """
+        self.stats["calls"] += 1
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["executions"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        return await asyncio.shield(task), shared
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats["inflight"] = len(self._inflight)
+        stats["coalescing_ratio"] = round(stats["coalesced"] / stats["calls"], 4) if stats["calls"] else 0.0
+        return stats
@@ -0,0 +1,98 @@
+# utils/startup_profile.py
+"""
+Đo cold start của process API (autoscale: replica mới phải nhận traffic nhanh):
+  - startup_phase("vector_store"): ghi thời gian từng bước khởi tạo (load model, index, DB...)
+  - profile_startup("app.main"): import module trong process con chạy `python -X importtime`,
+    in các module import chậm nhất (cumulative), thời gian import theo package, và các bước khởi tạo.
+Chạy:
+    python -m app.main --profile-startup [--top 25]
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_phases: List[Tuple[str, float]] = []
+
+
+@contextmanager
+def startup_phase(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _phases.append((name, elapsed))
+        logger.debug(f"⏱️ startup {name}: {elapsed * 1000:.1f} ms")
+
+
+def get_startup_phases() -> Dict[str, float]:
+    """{bước: ms} theo thứ tự chạy"""
+    return {name: round(seconds * 1000, 1) for name, seconds in _phases}
+
+
+def _parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """Dòng `import time: self [us] | cumulative | imported package` → (module, self_us, cumulative_us, độ sâu)"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        head, cumulative_us, name = line.split("|", 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(head.split(":", 1)[1]), int(cumulative_us), depth))
+    return rows
+
+
+def profile_startup(module: str = "app.main", top: int = 25) -> int:
+    code = (
+        "import json, time; t = time.perf_counter(); "
+        f"import {module}; total = time.perf_counter() - t; "
+        "from utils.startup_profile import get_startup_phases; "
+        "print('STARTUP_PROFILE ' + json.dumps({'total_ms': round(total * 1000, 1), "
+        "'phases': get_startup_phases()}))"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=root, capture_output=True, text=True)
+    report = None
+    for line in proc.stdout.splitlines():
+        if line.startswith("STARTUP_PROFILE "):
+            report = json.loads(line[len("STARTUP_PROFILE "):])
+    if proc.returncode != 0 or report is None:
+        print(f"❌ Import {module} lỗi:\n{proc.stderr[-3000:]}")
+        return 1
+
+    rows = _parse_importtime(proc.stderr)
+    phases = report["phases"]
+    init_ms = sum(phases.values())
+    import_ms = report["total_ms"] - init_ms
+
+    print(f"🔹 {module}: tổng {report['total_ms']:.0f} ms "
+          f"(import {import_ms:.0f} ms, khởi tạo {init_ms:.0f} ms)")
+
+    print("\n📦 Thời gian import theo package (self, gồm cả phần khởi tạo chạy trong thân module):")
+    by_package: Dict[str, int] = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+    for package, self_us in sorted(by_package.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"  {package:<32} {self_us / 1000:>9.1f} ms")
+
+    print(f"\n🐢 {top} module import chậm nhất (cumulative):")
+    for name, self_us, cumulative_us, depth in sorted(rows, key=lambda r: -r[2])[:top]:
+        print(f"  {name:<48} {cumulative_us / 1000:>9.1f} ms   (self {self_us / 1000:.1f} ms, mức {depth})")
+
+    print("\n⚙️ Các bước khởi tạo:")
+    for name, ms in phases.items():
+        print(f"  {name:<32} {ms:>9.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(profile_startup(sys.argv[1] if len(sys.argv) > 1 else "app.main"))
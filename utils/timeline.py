@@ -0,0 +1,79 @@
+# utils/timeline.py
+"""
+Đo thời gian từng giai đoạn của 1 request (nlu, retrieval, generation...).
+Timeline hiện tại nằm trong ContextVar → các task con (asyncio.create_task) ghi chung 1 timeline
+mà không cần truyền tham số qua từng hàm.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+_current_timeline: ContextVar[Optional["RequestTimeline"]] = ContextVar("request_timeline", default=None)
+
+
+class RequestTimeline:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.spans: Dict[str, Tuple[float, float]] = {}
+        self.notes: Dict[str, Any] = {}
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            key = name
+            i = 2
+            while key in self.spans:
+                key = f"{name}#{i}"
+                i += 1
+            self.spans[key] = (start, time.perf_counter())
+
+    def note(self, key: str, value: Any):
+        self.notes[key] = value
+
+    def overlap_ms(self, a: str, b: str) -> float:
+        """Thời gian 2 giai đoạn chạy song song (= latency tiết kiệm so với chạy tuần tự)"""
+        if a not in self.spans or b not in self.spans:
+            return 0.0
+        (a_start, a_end), (b_start, b_end) = self.spans[a], self.spans[b]
+        return max(0.0, min(a_end, b_end) - max(a_start, b_start)) * 1000
+
+    def as_dict(self) -> Dict[str, Any]:
+        def ms(t: float) -> float:
+            return round((t - self.started_at) * 1000, 1)
+
+        return {
+            "total_ms": ms(time.perf_counter()),
+            "spans": {
+                name: {"start_ms": ms(start), "end_ms": ms(end), "duration_ms": round((end - start) * 1000, 1)}
+                for name, (start, end) in self.spans.items()
+            },
+            **self.notes,
+        }
+
+    # ================= ContextVar helpers =================
+    def activate(self):
+        """Gắn timeline vào context hiện tại, trả token để reset"""
+        return _current_timeline.set(self)
+
+    @staticmethod
+    def deactivate(token):
+        _current_timeline.reset(token)
+
+
+def current_timeline() -> Optional[RequestTimeline]:
+    return _current_timeline.get()
+
+
+@contextmanager
+def timeline_span(name: str) -> Iterator[None]:
+    """Ghi span vào timeline của request hiện tại (không có timeline → không làm gì)"""
+    timeline = _current_timeline.get()
+    if timeline is None:
+        yield
+        return
+    with timeline.span(name):
+        yield
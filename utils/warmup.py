@@ -0,0 +1,93 @@
+# utils/warmup.py
+"""
+Warm-up nền lúc khởi động + trạng thái readiness:
+  add("embedding", fn, pool="cpu") → chạy lần lượt sau khi server nhận kết nối (không chặn startup),
+  ghi trạng thái / thời gian từng bước; ready khi mọi bước bắt buộc đã xong.
+  /health/live : process còn sống (luôn 200)
+  /health/ready: 503 đến khi warm xong → load balancer chưa đưa replica lạnh vào rotation
+fn sync chạy trong pool bulkhead (utils.executors), coroutine function chạy thẳng trên event loop.
+Bước lỗi: bắt buộc → không bao giờ ready (xem "error" ở /health/ready); không bắt buộc → bỏ qua.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.executors import run_in
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupStep:
+    def __init__(self, name: str, fn: Callable[[], Any], pool: str, required: bool):
+        self.name = name
+        self.fn = fn
+        self.pool = pool
+        self.required = required
+        self.state = "pending"      # pending → running → ready | failed
+        self.duration_ms: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        info = {"state": self.state, "required": self.required, "duration_ms": self.duration_ms}
+        if self.error:
+            info["error"] = self.error
+        return info
+
+
+class WarmupRunner:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.steps: List[WarmupStep] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def add(self, name: str, fn: Callable[[], Any], pool: str = "cpu", required: bool = True) -> "WarmupRunner":
+        self.steps.append(WarmupStep(name, fn, pool, required))
+        return self
+
+    async def run(self):
+        self.started_at = time.perf_counter()
+        if self.enabled:
+            for step in self.steps:
+                await self._run_step(step)
+        self.finished_at = time.perf_counter()
+        total_ms = (self.finished_at - self.started_at) * 1000
+        if self.is_ready():
+            logger.info(f"✅ Warm-up xong trong {total_ms:.0f} ms, sẵn sàng nhận traffic")
+        else:
+            failed = [s.name for s in self.steps if s.state == "failed" and s.required]
+            logger.error(f"❌ Warm-up lỗi ở bước {failed}, /health/ready trả 503")
+
+    async def _run_step(self, step: WarmupStep):
+        step.state = "running"
+        start = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(step.fn):
+                await step.fn()
+            else:
+                await run_in(step.pool, step.fn)
+            step.state = "ready"
+        except Exception as e:
+            step.state = "failed"
+            step.error = str(e)
+            log = logger.error if step.required else logger.warning
+            log(f"{'❌' if step.required else '⚠️'} Warm-up {step.name} lỗi: {e}")
+        step.duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"🔥 Warm-up {step.name}: {step.state} ({step.duration_ms} ms)")
+
+    def is_ready(self) -> bool:
+        if not self.enabled:
+            return True
+        return self.finished_at is not None and all(s.state == "ready" for s in self.steps if s.required)
+
+    def get_stats(self) -> Dict[str, Any]:
+        total_ms = None
+        if self.finished_at is not None:
+            total_ms = round((self.finished_at - self.started_at) * 1000, 1)
+        return {
+            "enabled": self.enabled,
+            "ready": self.is_ready(),
+            "total_ms": total_ms,
+            "components": {step.name: step.to_dict() for step in self.steps},
+        }